@@ -1,22 +1,41 @@
+import asyncio
 import os
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
 
-from fastapi import FastAPI, HTTPException, Query, status
-from fastapi.responses import JSONResponse
+import orjson
+
+from fastapi import Body, FastAPI, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from models import Task, TaskCreate, TaskUpdate
-from data_handler import get_data_handler
-from utils import get_logger
+from models import Task, TaskCreate, TaskUpdate, TaskStats, BulkIds, BulkItemResult
+from data_handler import BackendUnavailable, get_data_handler
+from idempotency import IdempotencyConflict, IdempotencyStore
+from metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE, MetricsMiddleware
+from utils import get_logger, http_date, to_iso_utc
 from dotenv import load_dotenv
 
 load_dotenv()
 
 logger = get_logger("app")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await handler.startup()
+    yield
+    # flush pending writes before the process exits
+    await handler.close()
+
+
 app = FastAPI(
     title="Task Management System API",
     version="1.0.0",
-    description="Simple task manager with MongoDB or JSON storage."
+    description="Simple task manager with MongoDB or JSON storage.",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS
@@ -26,27 +45,300 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
+app.add_middleware(MetricsMiddleware)
+
+DEFAULT_PAGE_SIZE = 100
+NDJSON = "application/x-ndjson"
+SSE = "text/event-stream"
+# seconds between SSE comments that keep idle connections (and proxies) from timing out
+SSE_HEARTBEAT = 15.0
 
 handler = get_data_handler()
+idempotency = IdempotencyStore(
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000")),
+    ttl=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+)
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "backend": handler.__class__.__name__}
+    backend = handler
+    while hasattr(backend, "inner"):
+        backend = backend.inner
+    body = {"status": "ok", "backend": backend.__class__.__name__}
+    mirror = getattr(handler, "mirror", None)
+    if mirror is not None:
+        body["mirror"] = mirror.stats()
+    cache = getattr(handler, "cache", None)
+    if cache is not None:
+        body["cache"] = cache.stats()
+    breaker = getattr(handler, "breaker", None)
+    if breaker is not None:
+        body["mongo_breaker"] = breaker.stats()
+    broker = getattr(handler, "broker", None)
+    if broker is not None:
+        body["change_feed"] = broker.stats()
+    shard_stats = getattr(handler, "shard_stats", None)
+    if shard_stats is not None:
+        body["json_shards"] = shard_stats()
+    archive_stats = getattr(handler, "archive_stats", None)
+    if archive_stats is not None:
+        body["archive"] = archive_stats()
+    flight = getattr(handler, "flight", None)
+    if flight is not None:
+        body["coalescing"] = flight.stats()
+    body["idempotency"] = idempotency.stats()
+    return body
+
+def _unavailable(e: BackendUnavailable) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+def _validators(version: int, modified_at: Optional[str]) -> Dict[str, str]:
+    "ETag / Last-Modified headers for a representation at `version`."
+    headers = {"ETag": f'"{version}"'}
+    if modified_at:
+        headers["Last-Modified"] = http_date(modified_at)
+    return headers
+
+def _not_modified(request: Request, etag: str) -> bool:
+    "Whether If-None-Match already names `etag` (weak comparison, as HTTP specifies for If-None-Match)."
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/debug/query-plans")
+async def query_plans():
+    explain = getattr(handler, "explain_queries", None)
+    if explain is None:
+        raise HTTPException(status_code=404, detail="Query plans are not available for this backend")
+    return await explain()
+
+@app.get("/debug/mirror/reconcile")
+async def reconcile_status():
+    reconciler = getattr(handler, "reconciler", None)
+    if reconciler is None:
+        raise HTTPException(status_code=404, detail="There is no mirror to reconcile for this backend")
+    return reconciler.status()
+
+@app.post("/debug/mirror/reconcile")
+async def reconcile_mirror(repair: bool = Query(True, description="Repair the mirror; false only reports the drift")):
+    reconciler = getattr(handler, "reconciler", None)
+    if reconciler is None:
+        raise HTTPException(status_code=404, detail="There is no mirror to reconcile for this backend")
+    return await reconciler.run(repair=repair)
 
 @app.post("/tasks", response_model=Task, status_code=status.HTTP_201_CREATED)
-async def create_task(payload: TaskCreate):
+async def create_task(
+    payload: TaskCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(
+        None, max_length=255, description="Retries with the same key return the first response instead of creating again"),
+):
     try:
-        task = await handler.create_task(payload)
+        if idempotency_key is None:
+            return await handler.create_task(payload)
+        task, replayed = await idempotency.run(
+            idempotency_key, payload.model_dump_json(), lambda: handler.create_task(payload))
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
         return task
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except BackendUnavailable as e:
+        raise _unavailable(e)
     except Exception as e:
         logger.exception("Failed to create task")
         raise HTTPException(status_code=400, detail=str(e))
 
+async def _ndjson(rows):
+    async for row in rows:
+        yield orjson.dumps(row) + b"\n"
+
 @app.get("/tasks", response_model=List[Task])
-async def list_tasks(is_completed: Optional[bool] = Query(None), q: Optional[str] = Query(None)):
-    tasks = await handler.list_tasks(is_completed=is_completed, q=q)
-    return tasks
+async def list_tasks(
+    request: Request,
+    is_completed: Optional[bool] = Query(None),
+    q: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; enables cursor pagination"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor header"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return"),
+    stream: bool = Query(False, description="Stream tasks as NDJSON (same as Accept: application/x-ndjson)"),
+    sort: Optional[Literal["created_at", "-created_at", "title", "-title"]] = Query(
+        None, description="Sort order; a leading '-' sorts descending (default: oldest first)"),
+    created_after: Optional[datetime] = Query(None, description="Only tasks created strictly after this time"),
+    created_before: Optional[datetime] = Query(None, description="Only tasks created strictly before this time"),
+    include_archived: bool = Query(False, description="Also list completed tasks moved to the archive"),
+):
+    filters = {
+        "is_completed": is_completed,
+        "q": q,
+        "sort": sort,
+        "created_after": to_iso_utc(created_after) if created_after else None,
+        "created_before": to_iso_utc(created_before) if created_before else None,
+    }
+    if include_archived and getattr(handler, "archive_stats", None) is not None:
+        filters["include_archived"] = True
+    if stream or NDJSON in request.headers.get("accept", ""):
+        return StreamingResponse(_ndjson(handler.iter_tasks(**filters)), media_type=NDJSON)
+    # the version is read before the listing, so the listing is never older than its ETag;
+    # a client that already holds this version gets a 304 without the listing being loaded
+    version = await handler.get_version()
+    validators = _validators(*version) if version else {}
+    if validators and _not_modified(request, validators["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
+    if limit is None and cursor is None and fields is None:
+        # Rows from storage were validated when written: serialize them directly instead of
+        # building a Task per row and letting response_model validate and dump it again.
+        # response_model still documents the schema in OpenAPI.
+        return ORJSONResponse(await handler.list_task_rows(**filters), headers=validators)
+    try:
+        page = await handler.list_tasks_page(
+            limit=limit or DEFAULT_PAGE_SIZE,
+            cursor=cursor,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+            **filters,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {**validators, "X-Next-Cursor": page.next_cursor} if page.next_cursor else validators
+    return ORJSONResponse(content=page.items, headers=headers)
+
+# Bulk routes are registered before /tasks/{task_id} so "bulk" is never taken for an id.
+@app.post("/tasks/bulk", response_model=List[BulkItemResult], status_code=status.HTTP_201_CREATED)
+async def create_tasks_bulk(payloads: List[TaskCreate] = Body(..., max_length=10000)):
+    try:
+        tasks = await handler.create_tasks(payloads)
+    except BackendUnavailable as e:
+        raise _unavailable(e)
+    except Exception as e:
+        logger.exception("Failed to create tasks")
+        raise HTTPException(status_code=400, detail=str(e))
+    return [
+        BulkItemResult(id=t.id, ok=True, task=t) if t else BulkItemResult(ok=False, error="Insert failed")
+        for t in tasks
+    ]
+
+@app.put("/tasks/bulk/complete", response_model=List[BulkItemResult])
+async def mark_tasks_completed_bulk(body: BulkIds):
+    try:
+        tasks = await handler.mark_completed_many(body.ids)
+    except BackendUnavailable as e:
+        raise _unavailable(e)
+    except Exception as e:
+        logger.exception("Failed to update tasks")
+        raise HTTPException(status_code=400, detail=str(e))
+    return [
+        BulkItemResult(id=i, ok=True, task=t) if t else BulkItemResult(id=i, ok=False, error="Task not found")
+        for i, t in zip(body.ids, tasks)
+    ]
+
+@app.delete("/tasks/bulk", response_model=List[BulkItemResult])
+async def delete_tasks_bulk(body: BulkIds):
+    try:
+        deleted = await handler.delete_tasks(body.ids)
+    except BackendUnavailable as e:
+        raise _unavailable(e)
+    except Exception as e:
+        logger.exception("Failed to delete tasks")
+        raise HTTPException(status_code=400, detail=str(e))
+    return [
+        BulkItemResult(id=i, ok=ok, error=None if ok else "Task not found")
+        for i, ok in zip(body.ids, deleted)
+    ]
+
+def _feed_event(broker, event) -> dict:
+    return {"token": broker.token(event["seq"]), "op": event["op"], "id": event["id"],
+            "task": event["task"], "at": event["at"]}
+
+def _sse_message(event: str, data: dict) -> bytes:
+    token = f"id: {data['token']}\n" if data.get("token") else ""
+    return f"{token}event: {event}\n".encode() + b"data: " + orjson.dumps(data) + b"\n\n"
+
+async def _sse(broker, after: Optional[int], reset: bool):
+    backlog, sub = broker.subscribe(after)
+    start = broker.token()
+    with sub:
+        if reset or backlog is None:
+            # events were missed: the client refetches GET /tasks, then follows on from here
+            yield _sse_message("reset", {"token": start})
+        for event in backlog or ():
+            yield _sse_message(event["op"], _feed_event(broker, event))
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.next(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if event is None:
+                # this client fell too far behind and was cut off
+                yield _sse_message("reset", {"token": broker.token()})
+                return
+            yield _sse_message(event["op"], _feed_event(broker, event))
+
+# Registered before /tasks/{task_id} so "stats" is never taken for an id.
+@app.get("/tasks/stats", response_model=TaskStats)
+async def task_stats(
+    request: Request,
+    by_day: bool = Query(False, description="Also count tasks per created_at day (UTC)"),
+):
+    version = await handler.get_version()
+    validators = _validators(*version) if version else {}
+    if validators and _not_modified(request, validators["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
+    stats = await handler.get_stats(by_day)
+    return ORJSONResponse(stats.model_dump(exclude_none=True), headers=validators)
+
+# Registered before /tasks/{task_id} so "changes" is never taken for an id.
+@app.get("/tasks/changes")
+async def task_changes(
+    request: Request,
+    after: Optional[str] = Query(None, description="Resume token from a previous response or event"),
+    timeout: float = Query(25.0, ge=0, le=60, description="Long-poll: seconds to wait for a change"),
+):
+    """Task changes as Server-Sent Events (Accept: text/event-stream) or a long-poll.
+
+    Without a token the feed starts from now. A token this process cannot resume
+    from (too old, from another process or an earlier run) yields a reset: refetch
+    GET /tasks and continue with the token that came with the reset.
+    """
+    broker = getattr(handler, "broker", None)
+    if broker is None:
+        raise HTTPException(status_code=404, detail="The change feed is disabled")
+    token = after or request.headers.get("last-event-id")
+    seq = broker.parse_token(token) if token else broker.seq
+    if SSE in request.headers.get("accept", ""):
+        return StreamingResponse(_sse(broker, seq, reset=seq is None), media_type=SSE,
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    if seq is None:
+        return {"events": [], "token": broker.token(), "reset": True}
+    events = await broker.wait(seq, timeout)
+    if events is None:
+        return {"events": [], "token": broker.token(), "reset": True}
+    next_token = broker.token(events[-1]["seq"]) if events else broker.token(seq)
+    return {"events": [_feed_event(broker, e) for e in events], "token": next_token, "reset": False}
+
+@app.get("/tasks/{task_id}", response_model=Task)
+async def get_task(request: Request, task_id: str):
+    found = await handler.get_task_with_version(task_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    task, task_version = found
+    if task_version is None:
+        return task
+    # Last-Modified is the store's last write: never earlier than this task's own last change
+    version = await handler.get_version()
+    validators = _validators(task_version, version[1] if version else None)
+    if _not_modified(request, validators["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validators)
+    return ORJSONResponse(task.model_dump(), headers=validators)
 
 @app.put("/tasks/{task_id}", response_model=Task)
 async def mark_task_completed(task_id: str, _body: TaskUpdate | None = None):
@@ -65,6 +357,8 @@ async def mark_task_completed(task_id: str, _body: TaskUpdate | None = None):
         raise HTTPException(status_code=404, detail="Task not found")
     except HTTPException:
         raise
+    except BackendUnavailable as e:
+        raise _unavailable(e)
     except Exception as e:
         logger.exception("Failed to update task")
         raise HTTPException(status_code=400, detail=str(e))
@@ -78,6 +372,8 @@ async def delete_task(task_id: str):
         return JSONResponse(status_code=200, content={"deleted": True})
     except HTTPException:
         raise
+    except BackendUnavailable as e:
+        raise _unavailable(e)
     except Exception as e:
         logger.exception("Failed to delete task")
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
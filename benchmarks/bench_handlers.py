@@ -0,0 +1,102 @@
+"""
+Micro-benchmarks for every IDataHandler method at several dataset sizes.
+
+    python benchmarks/bench_handlers.py --backends json,json-journal,mongo --sizes 1000,10000,100000,1000000
+
+Each operation runs up to --iterations times or until --max-seconds have passed, whichever
+comes first. Results (p50/p95/p99 latency and throughput) are written as JSON to --output.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from common import BACKENDS, build_handler, make_tasks, run_metadata, summarize, write_results
+
+from models import TaskCreate
+
+
+async def measure(op: Callable[[int], Awaitable[Any]], iterations: int, max_seconds: float) -> Dict[str, Any]:
+    samples: List[float] = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        await op(i)
+        samples.append(time.perf_counter() - t0)
+        if time.perf_counter() - started > max_seconds:
+            break
+    return summarize(samples, time.perf_counter() - started)
+
+
+async def drain(rows) -> None:
+    async for _ in rows:
+        pass
+
+
+async def bench_backend(backend: str, size: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    seed = make_tasks(size)
+    with tempfile.TemporaryDirectory() as workdir:
+        t0 = time.perf_counter()
+        handler = await build_handler(backend, workdir, seed)
+        load_seconds = time.perf_counter() - t0
+        ids = [t["id"] for t in seed]
+        rng = random.Random(size)
+        # ids consumed by the destructive operations, disjoint from each other
+        to_complete = rng.sample(ids, min(args.iterations, size // 3))
+        to_delete = rng.sample(sorted(set(ids) - set(to_complete)), min(args.iterations, size // 3))
+        page = {"cursor": None}
+
+        async def next_page(_):
+            result = await handler.list_tasks_page(limit=50, cursor=page["cursor"])
+            page["cursor"] = result.next_cursor
+
+        ops: Dict[str, Callable[[int], Awaitable[Any]]] = {
+            "get_task": lambda i: handler.get_task(rng.choice(ids)),
+            "list_tasks": lambda i: handler.list_tasks(),
+            "list_tasks_open": lambda i: handler.list_tasks(is_completed=False),
+            "list_tasks_search": lambda i: handler.list_tasks(q=f"number {rng.randrange(size)} "),
+            "list_tasks_page": next_page,
+            "iter_tasks": lambda i: drain(handler.iter_tasks(is_completed=False)),
+            "create_task": lambda i: handler.create_task(TaskCreate(title=f"bench {i}", description="created")),
+            "create_tasks_x100": lambda i: handler.create_tasks(
+                [TaskCreate(title=f"bulk {i}-{j}") for j in range(100)]),
+            "mark_completed": lambda i: handler.mark_completed(to_complete[i % len(to_complete)]),
+            "delete_task": lambda i: handler.delete_task(to_delete[i % len(to_delete)]),
+        }
+        selected = args.ops.split(",") if args.ops else list(ops)
+        results = [{"backend": backend, "size": size, "op": "load", "n": 1,
+                    "seconds": round(load_seconds, 4)}]
+        for name in selected:
+            if name in ("mark_completed", "delete_task") and size < 3:
+                continue
+            stats = await measure(ops[name], args.iterations, args.max_seconds)
+            results.append({"backend": backend, "size": size, "op": name, **stats})
+            print(f"{backend:>12} {size:>8} {name:<20} p50={stats['p50_ms']:.3f}ms "
+                  f"p99={stats['p99_ms']:.3f}ms {stats['ops_per_sec']:.0f} ops/s")
+        await handler.close()
+    return results
+
+
+async def main(args: argparse.Namespace) -> None:
+    meta = {**run_metadata(), "kind": "handlers", "args": vars(args)}
+    results: List[Dict[str, Any]] = []
+    for backend in args.backends.split(","):
+        if backend not in BACKENDS:
+            raise SystemExit(f"Unknown backend {backend!r}; choose from {', '.join(BACKENDS)}")
+        for size in (int(s) for s in args.sizes.split(",")):
+            results += await bench_backend(backend, size, args)
+    write_results(args.output, meta, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="json,json-journal", help=f"comma-separated: {', '.join(BACKENDS)}")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="comma-separated task counts")
+    parser.add_argument("--ops", default="", help="comma-separated subset of operations (default: all)")
+    parser.add_argument("--iterations", type=int, default=200, help="max calls per operation")
+    parser.add_argument("--max-seconds", type=float, default=5.0, help="time budget per operation")
+    parser.add_argument("--output", default="bench_handlers.json")
+    asyncio.run(main(parser.parse_args()))
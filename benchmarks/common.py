@@ -0,0 +1,114 @@
+"""
+Shared helpers for the benchmark scripts: backend construction, data seeding and result files.
+"""
+from __future__ import annotations
+import json
+import os
+import platform
+import subprocess
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+# the benchmarks import the app modules from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from data_handler import IDataHandler, JSONDataHandler, MongoDataHandler  # noqa: E402
+from utils import ISO_FORMAT  # noqa: E402
+
+BACKENDS = ("json", "json-journal", "mongo", "sqlite")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    "Nearest-rank percentile of an unsorted sample list."
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(samples: List[float], elapsed: float) -> Dict[str, Any]:
+    "Latency percentiles (ms) and throughput for one measured operation."
+    ms = [s * 1000 for s in samples]
+    return {
+        "n": len(ms),
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p95_ms": round(percentile(ms, 95), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+        "mean_ms": round(sum(ms) / len(ms), 4) if ms else 0.0,
+        "ops_per_sec": round(len(ms) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def make_tasks(n: int, completed_every: int = 3) -> List[Dict[str, Any]]:
+    "n synthetic task documents with increasing created_at, every `completed_every`th one completed."
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "title": f"Task {i} benchmark item",
+            "description": f"Synthetic description number {i} for load testing",
+            "id": str(uuid.uuid4()),
+            "is_completed": i % completed_every == 0,
+            "created_at": (start + timedelta(milliseconds=i)).strftime(ISO_FORMAT),
+        }
+        for i in range(n)
+    ]
+
+
+async def build_handler(backend: str, workdir: str, tasks: List[Dict[str, Any]]) -> IDataHandler:
+    "A handler of the given kind, pre-seeded with `tasks`, storing its files under `workdir`."
+    path = os.path.join(workdir, f"{backend}-{len(tasks)}.json")
+    if backend in ("json", "json-journal"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"tasks": tasks}, f)
+        return JSONDataHandler(path, journal=backend == "json-journal")
+    if backend == "mongo":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("The mongo benchmark needs mongomock-motor: pip install -r requirements-bench.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"tasks": tasks}, f)
+        handler = MongoDataHandler("mongodb://benchmark", client=AsyncMongoMockClient(),
+                                   json_handler=JSONDataHandler(path), text_search=False)
+        for i in range(0, len(tasks), 10000):
+            await handler.collection.insert_many([dict(t) for t in tasks[i:i + 10000]])
+        await handler.startup()
+        return handler
+    if backend == "sqlite":
+        import sqlite3
+        from sqlite_handler import COLUMNS, SQLiteDataHandler
+        db_path = os.path.join(workdir, f"{backend}-{len(tasks)}.db")
+        handler = SQLiteDataHandler(db_path)
+        fields = COLUMNS.split(", ")
+        with sqlite3.connect(db_path) as conn:
+            # generated tasks may leave optional fields such as completed_at out
+            conn.executemany(f"INSERT INTO tasks ({COLUMNS}) VALUES ({', '.join('?' * len(fields))})",
+                             [tuple(t.get(f) for f in fields) for t in tasks])
+        return handler
+    raise SystemExit(f"Unknown backend {backend!r}; choose from {', '.join(BACKENDS)}")
+
+
+def run_metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started_at": datetime.now(timezone.utc).strftime(ISO_FORMAT),
+    }
+
+
+def write_results(path: str, meta: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"wrote {len(results)} results to {path}")
+
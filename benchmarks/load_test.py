@@ -0,0 +1,100 @@
+"""
+In-process ASGI load generator for the API in app.py.
+
+    python benchmarks/load_test.py --backend json --seed 10000 --concurrency 32 --duration 10 --read-ratio 0.9
+
+Requests go straight to the ASGI app through httpx (no sockets), so the numbers reflect the
+application and storage layers. Results per route are written as JSON to --output.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from common import BACKENDS, build_handler, make_tasks, run_metadata, summarize, write_results
+
+
+async def worker(client, rng: random.Random, ids: List[str], deadline: float, read_ratio: float,
+                 samples: Dict[str, List[float]], errors: Dict[str, int]) -> None:
+    while time.perf_counter() < deadline:
+        if rng.random() < read_ratio:
+            route, request = rng.choice((
+                ("GET /tasks?limit=50", lambda: client.get("/tasks", params={"limit": 50})),
+                ("GET /tasks?is_completed=false&limit=50",
+                 lambda: client.get("/tasks", params={"is_completed": "false", "limit": 50})),
+                ("GET /tasks?q", lambda: client.get("/tasks", params={"q": f"item {rng.randrange(1000)}", "limit": 50})),
+            ))
+        else:
+            kind = rng.random()
+            if kind < 0.5 or not ids:
+                route, request = "POST /tasks", lambda: client.post("/tasks", json={"title": "load test"})
+            elif kind < 0.8:
+                task_id = rng.choice(ids)
+                route, request = "PUT /tasks/{id}", lambda: client.put(f"/tasks/{task_id}")
+            else:
+                task_id = ids.pop(rng.randrange(len(ids)))
+                route, request = "DELETE /tasks/{id}", lambda: client.delete(f"/tasks/{task_id}")
+        t0 = time.perf_counter()
+        res = await request()
+        samples[route].append(time.perf_counter() - t0)
+        if res.status_code >= 500 or (res.status_code >= 400 and not route.startswith("DELETE")):
+            errors[route] += 1
+        elif route == "POST /tasks":
+            ids.append(res.json()["id"])
+
+
+async def main(args: argparse.Namespace) -> None:
+    import httpx
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # app.py builds its own handler at import time; point it somewhere harmless,
+        # then swap in the seeded handler under test
+        os.environ.pop("MONGO_URI", None)
+        os.environ["DATA_FILE"] = os.path.join(workdir, "import.json")
+        import app as app_module
+
+        seed = make_tasks(args.seed)
+        app_module.handler = await build_handler(args.backend, workdir, seed)
+        ids = [t["id"] for t in seed]
+        samples: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, int] = defaultdict(int)
+        rng = random.Random(0)
+
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+            started = time.perf_counter()
+            deadline = started + args.duration
+            await asyncio.gather(*(
+                worker(client, random.Random(rng.random()), ids, deadline, args.read_ratio, samples, errors)
+                for _ in range(args.concurrency)
+            ))
+            elapsed = time.perf_counter() - started
+        await app_module.handler.close()
+
+    results: List[Dict[str, Any]] = [
+        {"route": route, "errors": errors[route], **summarize(route_samples, elapsed)}
+        for route, route_samples in sorted(samples.items())
+    ]
+    total = [s for route_samples in samples.values() for s in route_samples]
+    results.append({"route": "ALL", "errors": sum(errors.values()), **summarize(total, elapsed)})
+    for r in results:
+        print(f"{r['route']:<42} n={r['n']:<7} p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms "
+              f"p99={r['p99_ms']:.2f}ms {r['ops_per_sec']:.0f} req/s errors={r['errors']}")
+    meta = {**run_metadata(), "kind": "load", "args": vars(args)}
+    write_results(args.output, meta, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="json", choices=BACKENDS)
+    parser.add_argument("--seed", type=int, default=10000, help="tasks loaded before the run")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--read-ratio", type=float, default=0.9, help="fraction of requests that are reads")
+    parser.add_argument("--output", default="bench_load.json")
+    asyncio.run(main(parser.parse_args()))
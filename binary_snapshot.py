@@ -0,0 +1,206 @@
+"""
+Compact binary snapshot format for the JSON backend, and a converter to and from data.json.
+
+    python binary_snapshot.py to-binary data.json            # convert in place
+    python binary_snapshot.py to-json data.json data-copy.json
+
+Layout (little-endian):
+
+    header    magic "TASKSNAP", format version u32, row count u64, heap size u64,
+              data version u64 (the store's change counter), padded to 40 bytes
+    ids       count x 36 bytes, ASCII, NUL-padded
+    created   count x 32 bytes, ASCII ISO timestamps, NUL-padded
+    completed count x 32 bytes, ASCII ISO completion timestamps, NUL-padded (all NUL: none)
+    flags     count x u8: bit 0 is_completed, bit 1 description present
+    padding   to an 8-byte boundary
+    offsets   (2 x count + 1) x u64: start of row i's title at [2i], of its description at [2i+1]
+    heap      UTF-8 titles and descriptions, back to back
+
+The file is memory-mapped; fixed-width columns are read in bulk at load time and
+the strings of a row are only decoded when that row is read.
+"""
+from __future__ import annotations
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Tuple
+
+MAGIC = b"TASKSNAP"
+VERSION = 3
+HEADER = struct.Struct("<8sIQQQ")
+HEADER_SIZE = 40
+ID_WIDTH = 36
+CREATED_WIDTH = 32
+COMPLETED, HAS_DESCRIPTION = 1, 2
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def is_binary(path: str) -> bool:
+    "Whether `path` holds a binary snapshot (as opposed to JSON)."
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def _fixed(value: str, width: int, name: str) -> bytes:
+    raw = value.encode("ascii") if value.isascii() else b""
+    if not raw or len(raw) > width:
+        raise ValueError(f"{name} {value!r} does not fit the binary format ({width} ASCII characters max)")
+    return raw.ljust(width, b"\0")
+
+
+def dump(tasks: Iterable[Dict[str, Any]], f: BinaryIO, version: int = 0) -> None:
+    "Write task dicts (and the store's data version) to `f` in the binary snapshot format."
+    tasks = list(tasks)
+    ids, created, completed, flags = bytearray(), bytearray(), bytearray(), bytearray()
+    offsets = array("Q")
+    heap: List[bytes] = []
+    size = 0
+    for t in tasks:
+        ids += _fixed(t["id"], ID_WIDTH, "id")
+        created += _fixed(t["created_at"], CREATED_WIDTH, "created_at")
+        completed_at = t.get("completed_at")
+        completed += _fixed(completed_at, CREATED_WIDTH, "completed_at") if completed_at else bytes(CREATED_WIDTH)
+        description = t.get("description")
+        flags.append((COMPLETED if t.get("is_completed") else 0) | (HAS_DESCRIPTION if description is not None else 0))
+        for text in (t["title"], description or ""):
+            data = text.encode("utf-8")
+            offsets.append(size)
+            heap.append(data)
+            size += len(data)
+    offsets.append(size)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    f.write(HEADER.pack(MAGIC, VERSION, len(tasks), size, version).ljust(HEADER_SIZE, b"\0"))
+    f.write(ids)
+    f.write(created)
+    f.write(completed)
+    f.write(flags)
+    f.write(b"\0" * _pad(HEADER_SIZE + len(ids) + len(created) + len(completed) + len(flags)))
+    f.write(offsets.tobytes())
+    for data in heap:
+        f.write(data)
+
+
+class BinarySnapshot:
+    """Read-only view of a binary snapshot file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # self.version is the store's change counter when the snapshot was written
+        magic, version, self.count, heap_size, self.version = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} task snapshot")
+        n = self.count
+        self._ids_at = HEADER_SIZE
+        self._created_at = self._ids_at + n * ID_WIDTH
+        self._completed_at = self._created_at + n * CREATED_WIDTH
+        self._flags_at = self._completed_at + n * CREATED_WIDTH
+        offsets_at = self._flags_at + n
+        offsets_at += _pad(offsets_at)
+        self._heap_at = offsets_at + (2 * n + 1) * 8
+        if len(self._mm) != self._heap_at + heap_size:
+            raise ValueError(f"{path} is truncated or corrupt")
+        raw = memoryview(self._mm)[offsets_at:self._heap_at]
+        if sys.byteorder == "little":
+            self._offsets = raw.cast("Q")
+        else:
+            self._offsets = array("Q", raw.tobytes())
+            self._offsets.byteswap()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _column(self, start: int, width: int) -> List[str]:
+        text = self._mm[start:start + self.count * width].decode("ascii")
+        values = [text[i:i + width] for i in range(0, len(text), width)]
+        return [v.rstrip("\0") for v in values] if "\0" in text else values
+
+    def ids(self) -> List[str]:
+        return self._column(self._ids_at, ID_WIDTH)
+
+    def created_ats(self) -> List[str]:
+        return self._column(self._created_at, CREATED_WIDTH)
+
+    def completed(self) -> List[bool]:
+        return [bool(flags & COMPLETED) for flags in self._mm[self._flags_at:self._flags_at + self.count]]
+
+    def _text(self, k: int) -> str:
+        return self._mm[self._heap_at + self._offsets[k]:self._heap_at + self._offsets[k + 1]].decode("utf-8")
+
+    def texts(self, i: int) -> tuple:
+        "(title, description) of row i."
+        flags = self._mm[self._flags_at + i]
+        return self._text(2 * i), self._text(2 * i + 1) if flags & HAS_DESCRIPTION else None
+
+    def row(self, i: int) -> Dict[str, Any]:
+        "Decode row i into a task dict."
+        at = self._ids_at + i * ID_WIDTH
+        task_id = self._mm[at:at + ID_WIDTH].rstrip(b"\0").decode("ascii")
+        at = self._created_at + i * CREATED_WIDTH
+        created_at = self._mm[at:at + CREATED_WIDTH].rstrip(b"\0").decode("ascii")
+        at = self._completed_at + i * CREATED_WIDTH
+        completed_at = self._mm[at:at + CREATED_WIDTH].rstrip(b"\0").decode("ascii") or None
+        title, description = self.texts(i)
+        return {
+            "title": title,
+            "description": description,
+            "id": task_id,
+            "is_completed": bool(self._mm[self._flags_at + i] & COMPLETED),
+            "created_at": created_at,
+            "completed_at": completed_at,
+        }
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        return (self.row(i) for i in range(self.count))
+
+
+def _read_tasks(path: str) -> Tuple[List[Dict[str, Any]], int]:
+    if is_binary(path):
+        snapshot = BinarySnapshot(path)
+        return list(snapshot.rows()), snapshot.version
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    return doc.get("tasks", []), doc.get("version", 0)
+
+
+def convert(src: str, dst: str, to: str) -> int:
+    "Rewrite the snapshot at `src` into `dst` in format `to` ('binary' or 'json'); returns the task count."
+    tasks, version = _read_tasks(src)
+    tmp = f"{dst}.tmp"
+    with open(tmp, "wb") as f:
+        if to == "binary":
+            dump(tasks, f, version)
+        else:
+            document = {"tasks": tasks, "version": version}
+            f.write(json.dumps(document, ensure_ascii=False, indent=2).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)
+    return len(tasks)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("to-binary", "to-json"))
+    parser.add_argument("src", help="snapshot to read (either format)")
+    parser.add_argument("dst", nargs="?", help="file to write (default: replace src)")
+    args = parser.parse_args(argv)
+    to = "binary" if args.command == "to-binary" else "json"
+    dst = args.dst or args.src
+    count = convert(args.src, dst, to)
+    print(f"wrote {count} tasks to {dst} ({to}, {os.path.getsize(dst)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Read-through cache that wraps any IDataHandler.
+"""
+from __future__ import annotations
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+
+from data_handler import IDataHandler
+from metrics import instrument_backend
+from models import Task, TaskCreate, TaskPage, TaskStats
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU map whose entries also expire `ttl` seconds after being stored."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        if self._data.pop(key, _MISSING) is not _MISSING:
+            self.invalidations += 1
+
+    def pop_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        for key in [k for k in self._data if predicate(k)]:
+            del self._data[key]
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+@instrument_backend
+class CachedDataHandler(IDataHandler):
+    """Serves get_task / list_tasks / list_tasks_page from a TTLCache in front of `inner`.
+
+    Our own writes invalidate the affected keys. A read that raced with a write
+    is returned but not cached, so it cannot outlive the write. get_version is
+    never cached: when it reports a version other than the last one seen (e.g.
+    another process wrote), every entry is dropped, so a listing served after a
+    version check is never older than that version.
+    """
+
+    _LISTINGS = ("list", "rows", "page")
+
+    def __init__(self, inner: IDataHandler, max_entries: int = 1024, ttl: float = 5.0):
+        self.inner = inner
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._generation = 0
+        self._seen_version: Optional[int] = None
+
+    def __getattr__(self, name: str) -> Any:
+        # backend-specific extras (mirror, explain_queries, ...) pass straight through
+        return getattr(self.inner, name)
+
+    async def _read_through(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self._generation
+        value = await load()
+        if generation == self._generation:
+            self.cache.set(key, value)
+        return value
+
+    def _invalidate(self, task_id: Optional[str] = None, listings: Callable[[Hashable], bool] = lambda k: True) -> None:
+        self._generation += 1
+        if task_id is not None:
+            self.cache.pop(("get", task_id))
+        self.cache.pop_where(lambda k: k[0] in self._LISTINGS and listings(k))
+
+    async def create_task(self, payload: TaskCreate) -> Task:
+        try:
+            return await self.inner.create_task(payload)
+        finally:
+            # a new task is open, so listings filtered on is_completed=True are unaffected
+            self._invalidate(listings=lambda k: k[1] is not True)
+
+    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> List[Task]:
+        return await self._read_through(
+            ("list", is_completed, q, sort, created_after, created_before),
+            lambda: self.inner.list_tasks(is_completed=is_completed, q=q, sort=sort,
+                                          created_after=created_after, created_before=created_before),
+        )
+
+    async def list_task_rows(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                             sort: Optional[str] = None, created_after: Optional[str] = None,
+                             created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self._read_through(
+            ("rows", is_completed, q, sort, created_after, created_before),
+            lambda: self.inner.list_task_rows(is_completed=is_completed, q=q, sort=sort,
+                                              created_after=created_after, created_before=created_before),
+        )
+
+    async def list_tasks_page(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None, limit: int = 100,
+                              cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                              sort: Optional[str] = None, created_after: Optional[str] = None,
+                              created_before: Optional[str] = None) -> TaskPage:
+        return await self._read_through(
+            ("page", is_completed, q, limit, cursor, tuple(fields) if fields else None,
+             sort, created_after, created_before),
+            lambda: self.inner.list_tasks_page(is_completed=is_completed, q=q, limit=limit, cursor=cursor,
+                                               fields=fields, sort=sort, created_after=created_after,
+                                               created_before=created_before),
+        )
+
+    def iter_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                   sort: Optional[str] = None, created_after: Optional[str] = None,
+                   created_before: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # streams are never cached
+        return self.inner.iter_tasks(is_completed=is_completed, q=q, sort=sort,
+                                     created_after=created_after, created_before=created_before)
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        return await self._read_through(("get", task_id), lambda: self.inner.get_task(task_id))
+
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]:
+        version = await self.inner.get_version()
+        if version is not None and version[0] != self._seen_version:
+            if self._seen_version is not None:
+                self._generation += 1
+                self.cache.pop_where(lambda k: True)
+            self._seen_version = version[0]
+        return version
+
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]:
+        # the version is what a conditional GET is checked against, so it always comes from storage
+        return await self.inner.get_task_with_version(task_id)
+
+    async def get_stats(self, by_day: bool = False) -> TaskStats:
+        # backends answer this from counters; nothing to gain from caching it here
+        return await self.inner.get_stats(by_day)
+
+    async def mark_completed(self, task_id: str) -> Task:
+        try:
+            return await self.inner.mark_completed(task_id)
+        finally:
+            self._invalidate(task_id)
+
+    async def delete_task(self, task_id: str) -> bool:
+        try:
+            return await self.inner.delete_task(task_id)
+        finally:
+            self._invalidate(task_id)
+
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]:
+        try:
+            return await self.inner.create_tasks(payloads)
+        finally:
+            self._invalidate(listings=lambda k: k[1] is not True)
+
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]:
+        try:
+            return await self.inner.mark_completed_many(task_ids)
+        finally:
+            self._invalidate_many(task_ids)
+
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]:
+        try:
+            return await self.inner.delete_tasks(task_ids)
+        finally:
+            self._invalidate_many(task_ids)
+
+    def _invalidate_many(self, task_ids: List[str]) -> None:
+        for task_id in task_ids:
+            self.cache.pop(("get", task_id))
+        self._invalidate()
+
+    async def startup(self) -> None:
+        await self.inner.startup()
+
+    async def close(self) -> None:
+        await self.inner.close()
@@ -0,0 +1,265 @@
+"""
+In-process change feed: a fan-out broker for task change events and a wrapper that
+publishes every mutation of any IDataHandler to it.
+"""
+from __future__ import annotations
+import asyncio
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from data_handler import IDataHandler
+from models import Task, TaskCreate, TaskPage, TaskStats
+from utils import utc_now_iso, get_logger
+
+logger = get_logger("change_feed")
+
+
+class Subscription:
+    """A subscriber's bounded queue. If the subscriber falls behind and its queue fills up,
+    it is cut off (`overflowed`) and must resynchronise from a full listing."""
+
+    def __init__(self, broker: "ChangeBroker", queue_size: int):
+        self._broker = broker
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    async def next(self) -> Optional[Dict[str, Any]]:
+        "The next event, or None once the subscription has overflowed and its queue is drained."
+        if self.overflowed and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+    def drain(self) -> List[Dict[str, Any]]:
+        "Events already queued, without waiting."
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    def close(self) -> None:
+        self._broker._subscribers.discard(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ChangeBroker:
+    """Fans change events out to subscribers and keeps the last `history` for resuming.
+
+    Events are numbered per broker; a resume token is "<epoch>-<seq>", where the epoch
+    identifies this broker, so a token from another process or an earlier run is
+    recognised as unusable instead of silently skipping events.
+    """
+
+    def __init__(self, history: int = 1000, queue_size: int = 256):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self._seq = 0
+        self._history: deque = deque(maxlen=history)
+        self._subscribers: Set[Subscription] = set()
+        # set while events come from an external source (a Mongo change stream) rather than
+        # from this process's own writes
+        self.external = False
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    @property
+    def seq(self) -> int:
+        "Number of the latest event."
+        return self._seq
+
+    def token(self, seq: Optional[int] = None) -> str:
+        return f"{self.epoch}-{self._seq if seq is None else seq}"
+
+    def parse_token(self, token: Optional[str]) -> Optional[int]:
+        "The sequence number a token resumes after; None if it was not issued by this broker."
+        epoch, _, seq = (token or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+            return None
+        return int(seq)
+
+    def publish(self, op: str, task_id: Optional[str], task: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._seq += 1
+        event = {"seq": self._seq, "op": op, "id": task_id, "task": task, "at": utc_now_iso()}
+        self._history.append(event)
+        self.published += 1
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                sub.overflowed = True
+                sub.close()
+                self.dropped_subscribers += 1
+        return event
+
+    def since(self, seq: int) -> Optional[List[Dict[str, Any]]]:
+        "Retained events after `seq`, or None if some of them have already been discarded."
+        if seq >= self._seq:
+            return []
+        if not self._history or self._history[0]["seq"] > seq + 1:
+            return None
+        return [e for e in self._history if e["seq"] > seq]
+
+    def subscribe(self, after: Optional[int] = None) -> Tuple[Optional[List[Dict[str, Any]]], Subscription]:
+        "Events after `after` (None: a gap, see since) and a subscription for everything later."
+        # no await between reading the backlog and registering, so nothing falls in between
+        backlog = self.since(after) if after is not None else []
+        sub = Subscription(self, self.queue_size)
+        self._subscribers.add(sub)
+        return backlog, sub
+
+    async def wait(self, after: int, timeout: float) -> Optional[List[Dict[str, Any]]]:
+        "Long-poll: events after `after`, waiting up to `timeout` seconds for one; None on a gap."
+        backlog, sub = self.subscribe(after)
+        with sub:
+            if backlog != []:
+                return backlog
+            try:
+                first = await asyncio.wait_for(sub.next(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            return [first] + sub.drain() if first is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": "mongo_change_stream" if self.external else "in_process",
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "dropped_subscribers": self.dropped_subscribers,
+            "retained": len(self._history),
+        }
+
+
+class ChangeFeedDataHandler(IDataHandler):
+    """Publishes every successful mutation of `inner` to `broker`.
+
+    When `inner` can open a change stream (`open_change_stream`, MongoDB replica sets),
+    events come from the stream instead, so writes made by other processes appear too;
+    if the stream cannot be opened or fails, this process's own writes are published.
+    """
+
+    def __init__(self, inner: IDataHandler, broker: Optional[ChangeBroker] = None, change_streams: bool = True):
+        self.inner = inner
+        self.broker = broker or ChangeBroker()
+        self.change_streams = change_streams
+        self._watcher: Optional[asyncio.Task] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    def _publish(self, op: str, task_id: str, task: Optional[Task] = None) -> None:
+        if not self.broker.external:
+            self.broker.publish(op, task_id, task.model_dump() if task else None)
+
+    async def _watch(self, stream: AsyncIterator[Dict[str, Any]]) -> None:
+        try:
+            async for event in stream:
+                self.broker.publish(event["op"], event["id"], event.get("task"))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("MongoDB change stream failed; publishing this process's writes only")
+        finally:
+            self.broker.external = False
+            # events may have been missed: tell subscribers to resynchronise
+            self.broker.publish("reset", None)
+
+    async def startup(self) -> None:
+        await self.inner.startup()
+        open_stream = getattr(self.inner, "open_change_stream", None)
+        if not self.change_streams or open_stream is None:
+            return
+        try:
+            stream = await open_stream()
+        except Exception as e:
+            logger.info("Change streams unavailable (%s); publishing this process's writes only", e)
+            return
+        # from here on our own writes arrive through the stream; publishing them too would duplicate them
+        self.broker.external = True
+        self._watcher = asyncio.create_task(self._watch(stream))
+
+    async def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+        await self.inner.close()
+
+    async def create_task(self, payload: TaskCreate) -> Task:
+        task = await self.inner.create_task(payload)
+        self._publish("create", task.id, task)
+        return task
+
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]:
+        tasks = await self.inner.create_tasks(payloads)
+        for task in tasks:
+            if task is not None:
+                self._publish("create", task.id, task)
+        return tasks
+
+    @staticmethod
+    def _completed_since(task: Optional[Task], started: str) -> bool:
+        """Whether `task` was completed at or after `started`, i.e. by the call that returned it.
+
+        Completing a task that already is (or one served from an archive) returns it with its
+        earlier completed_at, or none if it predates completion times: that is not a change.
+        """
+        return task is not None and task.completed_at is not None and task.completed_at >= started
+
+    async def mark_completed(self, task_id: str) -> Task:
+        started = utc_now_iso()
+        task = await self.inner.mark_completed(task_id)
+        if self._completed_since(task, started):
+            self._publish("complete", task_id, task)
+        return task
+
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]:
+        started = utc_now_iso()
+        tasks = await self.inner.mark_completed_many(task_ids)
+        published = set()
+        for task in tasks:
+            if self._completed_since(task, started) and task.id not in published:
+                published.add(task.id)
+                self._publish("complete", task.id, task)
+        return tasks
+
+    async def delete_task(self, task_id: str) -> bool:
+        deleted = await self.inner.delete_task(task_id)
+        if deleted:
+            self._publish("delete", task_id)
+        return deleted
+
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]:
+        results = await self.inner.delete_tasks(task_ids)
+        for task_id, deleted in zip(task_ids, results):
+            if deleted:
+                self._publish("delete", task_id)
+        return results
+
+    # reads go straight to the wrapped handler
+    async def list_tasks(self, **filters: Any) -> List[Task]:
+        return await self.inner.list_tasks(**filters)
+
+    async def list_task_rows(self, **filters: Any) -> List[Dict[str, Any]]:
+        return await self.inner.list_task_rows(**filters)
+
+    async def list_tasks_page(self, **kwargs: Any) -> TaskPage:
+        return await self.inner.list_tasks_page(**kwargs)
+
+    def iter_tasks(self, **filters: Any) -> AsyncIterator[Dict[str, Any]]:
+        return self.inner.iter_tasks(**filters)
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        return await self.inner.get_task(task_id)
+
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]:
+        return await self.inner.get_version()
+
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]:
+        return await self.inner.get_task_with_version(task_id)
+
+    async def get_stats(self, by_day: bool = False) -> TaskStats:
+        return await self.inner.get_stats(by_day)
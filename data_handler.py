@@ -311,150 +311,1729 @@ Data access layer: provides CRUD via an abstract interface.
 Supports MongoDB (Motor) + JSON file dual write.
 """
 from __future__ import annotations
-import os, json, asyncio
-from typing import List, Optional, Protocol, Dict, Any
-from models import Task, TaskCreate
-from utils import utc_now_iso, get_logger
+import os, re, json, time, asyncio, bisect, contextlib, heapq, itertools
+from collections import deque
+from collections.abc import MutableMapping
+from typing import List, Optional, Protocol, Dict, Any, Iterable, Tuple, AsyncIterator, Awaitable, Callable
+from models import DayStats, Task, TaskCreate, TaskPage, TaskStats
+from metrics import instrument_backend
+import binary_snapshot
+from search_index import GRAM, TrigramIndex
+from utils import utc_now_iso, iso_from_timestamp, get_logger, parse_bool, encode_cursor, decode_cursor
 
 logger = get_logger("data_handler")
 
+TASK_FIELDS = tuple(Task.model_fields)
+# accepted `sort` values; a leading "-" means descending. Ties are broken on id.
+SORTS = ("created_at", "-created_at", "title", "-title")
+# sorts after any id, for bisecting past every key with a given sort value
+_MAX_ID = "\U0010ffff"
+# rows per event-loop yield (JSON) / cursor batch (Mongo) when streaming listings
+STREAM_YIELD_EVERY = 1000
+# a search matching more than 1/N of the tasks walks the sorted order, filtering on the
+# candidates, instead of sorting them: a page then stops after about `limit * N` keys
+WALK_ORDER_RATIO = 64
+
+
+def _sort_spec(sort: Optional[str]) -> Tuple[str, bool]:
+    "(field, descending) for a `sort` value; None sorts by created_at, ascending."
+    sort = sort or "created_at"
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort: {sort}; expected one of {', '.join(SORTS)}")
+    return sort.lstrip("-"), sort.startswith("-")
+
+
+def _parse_page_args(cursor: Optional[str], fields: Optional[List[str]],
+                     sort: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    "Validate pagination arguments; returns the (sort key, id) to resume after."
+    _sort_spec(sort)
+    if fields:
+        unknown = [f for f in fields if f not in TASK_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if cursor is None:
+        return None
+    key = decode_cursor(cursor)
+    if len(key) != 3 or not all(isinstance(v, str) for v in key):
+        raise ValueError("Invalid cursor")
+    # cursors remember their sort: resuming one under another order would skip or repeat rows
+    if key[0] != (sort or "created_at"):
+        raise ValueError("Cursor was issued for a different sort")
+    return key[1], key[2]
+
+
+def _next_cursor(row: Dict[str, Any], sort: Optional[str]) -> str:
+    field, _ = _sort_spec(sort)
+    return encode_cursor([sort or "created_at", row[field], row["id"]])
+
+
+def _file_id(path: str) -> Optional[Tuple[int, int, int]]:
+    "(inode, mtime, size) of a file, or None if it does not exist."
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _task_stats(total: int, completed: int, days: Optional[Dict[str, Tuple[int, int]]] = None) -> TaskStats:
+    "TaskStats from counts; `days` maps a created_at day to its (created, completed) counts."
+    by_day = None
+    if days is not None:
+        by_day = {day: DayStats(created=c, completed=k) for day, (c, k) in sorted(days.items()) if c}
+    return TaskStats(total=total, open=total - completed, completed=completed, by_day=by_day)
+
+
+def _sum_stats(parts: List[TaskStats], by_day: bool = False) -> TaskStats:
+    "Stats of several disjoint sets of tasks (shards, tiers) combined."
+    days: Optional[Dict[str, Tuple[int, int]]] = None
+    if by_day:
+        days = {}
+        for part in parts:
+            for day, counts in part.by_day.items():
+                created, completed = days.get(day, (0, 0))
+                days[day] = (created + counts.created, completed + counts.completed)
+    return _task_stats(sum(p.total for p in parts), sum(p.completed for p in parts), days)
+
+
+class _Descending:
+    "Inverts the ordering of a sort key, so a heap can merge descending streams."
+    __slots__ = ("key",)
+
+    def __init__(self, key: Tuple[str, str]):
+        self.key = key
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.key < self.key
+
+
+def _merge_rows(parts: List[List[Dict[str, Any]]], sort: Optional[str]) -> List[Dict[str, Any]]:
+    "Merge listings that are each in `sort` order into one."
+    field, descending = _sort_spec(sort)
+    return list(heapq.merge(*parts, key=lambda t: (t[field], t["id"]), reverse=descending))
+
+
+async def _merge_streams(streams: List[AsyncIterator[Dict[str, Any]]],
+                         sort: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+    "k-way merge of streams that are each in `sort` order, holding one row per stream."
+    field, descending = _sort_spec(sort)
+    heap = []
+
+    async def push(i: int) -> None:
+        row = await anext(streams[i], None)
+        if row is not None:
+            key = (row[field], row["id"])
+            heapq.heappush(heap, (_Descending(key) if descending else key, i, row))
+
+    try:
+        for i in range(len(streams)):
+            await push(i)
+        while heap:
+            _, i, row = heapq.heappop(heap)
+            yield row
+            await push(i)
+    finally:
+        for stream in streams:
+            await stream.aclose()
+
+
+def _project(task: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if not fields:
+        return {f: task.get(f) for f in TASK_FIELDS}
+    return {f: task.get(f) for f in fields}
+
+
 # ---------------- Protocol Interface ----------------
 class IDataHandler(Protocol):
     async def create_task(self, payload: TaskCreate) -> Task: ...
-    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None) -> List[Task]: ...
+    # `sort` is one of SORTS (None: the backend's natural order); created_after / created_before
+    # are exclusive bounds on created_at, as ISO strings in the stored format
+    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> List[Task]: ...
+    # list_tasks as plain dicts straight from storage, for callers that only serialize them
+    async def list_task_rows(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                             sort: Optional[str] = None, created_after: Optional[str] = None,
+                             created_before: Optional[str] = None) -> List[Dict[str, Any]]: ...
     async def mark_completed(self, task_id: str) -> Task: ...
     async def delete_task(self, task_id: str) -> bool: ...
+    # bulk variants: results line up with the inputs; None / False mark items that were not applied
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]: ...
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]: ...
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]: ...
+    async def list_tasks_page(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None, limit: int = 100,
+                              cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                              sort: Optional[str] = None, created_after: Optional[str] = None,
+                              created_before: Optional[str] = None) -> TaskPage: ...
+    def iter_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                   sort: Optional[str] = None, created_after: Optional[str] = None,
+                   created_before: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]: ...
     async def get_task(self, task_id: str) -> Optional[Task]: ...
+    # a change counter bumped by every write, and the time of the last write (None if unknown);
+    # returns None when the backend cannot currently tell, and callers then skip conditional requests
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]: ...
+    # get_task plus a version that changes whenever the task does (None if unknown)
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]: ...
+    # total / open / completed counts, plus per created_at day counts when `by_day`
+    async def get_stats(self, by_day: bool = False) -> TaskStats: ...
+    async def startup(self) -> None: ...
+    async def close(self) -> None: ...
 
 
 # ---------------- JSON FILE BACKEND ----------------
+def _text_matches(task: Dict[str, Any], ql: str) -> bool:
+    return ql in task["title"].lower() or bool(task.get("description") and ql in task["description"].lower())
+
+
+class _LazyRows(MutableMapping):
+    """id -> task dict over a binary snapshot: a row is decoded the first time it is read.
+
+    Values are either a row number in the snapshot or the decoded (or newly added) dict,
+    so iteration order is that of a plain dict built from the document.
+    """
+
+    def __init__(self, snapshot: Any):
+        self._snapshot = snapshot
+        self._slots: Dict[str, Any] = dict(zip(snapshot.ids(), range(len(snapshot))))
+
+    def __getitem__(self, task_id: str) -> Dict[str, Any]:
+        value = self._slots[task_id]
+        if type(value) is int:
+            value = self._slots[task_id] = self._snapshot.row(value)
+        return value
+
+    def __setitem__(self, task_id: str, task: Dict[str, Any]) -> None:
+        self._slots[task_id] = task
+
+    def __delitem__(self, task_id: str) -> None:
+        del self._slots[task_id]
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._slots
+
+    def peek(self, task_id: str) -> Dict[str, Any]:
+        "The task without keeping its decoded row around."
+        value = self._slots[task_id]
+        return self._snapshot.row(value) if type(value) is int else value
+
+    def texts(self, task_id: str) -> Tuple[str, Optional[str]]:
+        value = self._slots[task_id]
+        if type(value) is int:
+            return self._snapshot.texts(value)
+        return value["title"], value.get("description")
+
+
+class _TaskStore:
+    """In-memory view of the JSON document: id -> task dict plus is_completed, ordering and text indexes.
+
+    The text index is only built when the first `q` search needs it, so loading
+    a large document does not pay for it up front.
+    """
+
+    def __init__(self, tasks: Iterable[Dict[str, Any]] = (), version: int = 0):
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        # change counter: saved with the snapshot and advanced by every record that changes
+        # something, so replaying the same files always arrives at the same version
+        self.version = version
+        # version at which each task last changed; tasks untouched since loading have the loaded version
+        self._loaded_version = version
+        self._task_versions: Dict[str, int] = {}
+        # ordered sets (dict keys) of task ids per completion flag
+        self.by_status: Dict[bool, Dict[str, None]] = {True: {}, False: {}}
+        # file position of every task, so filtered listings keep document order
+        self._rank: Dict[str, int] = {}
+        self._next_rank = 0
+        # (created_at, id) keys kept sorted for cursor pagination
+        self.order: List[Tuple[str, str]] = []
+        self.text: Optional[TrigramIndex] = None
+        # (added, id, texts) changes made while the index is built off the event loop, replayed into it after
+        self._text_backlog: Optional[List[Tuple[bool, str, Tuple[str, Optional[str]]]]] = None
+        # (title, id) keys kept sorted once a title sort has been asked for
+        self._by_title: Optional[List[Tuple[str, str]]] = None
+        # created_at day -> [created, completed] counts, kept up to date once stats per day are asked for
+        self._days: Optional[Dict[str, List[int]]] = None
+        for t in tasks:
+            self.add(t, ordered=False)
+        self.order.sort()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Any) -> "_TaskStore":
+        "Index a binary snapshot from its fixed-width columns, leaving rows undecoded."
+        store = cls(version=snapshot.version)
+        store.tasks = _LazyRows(snapshot)
+        ids = list(store.tasks)
+        for task_id, completed in zip(ids, snapshot.completed()):
+            store.by_status[completed][task_id] = None
+        store._rank = dict(zip(ids, range(len(ids))))
+        store._next_rank = len(ids)
+        store.order = sorted(zip(snapshot.created_ats(), ids))
+        return store
+
+    def _texts(self, task_id: str) -> Tuple[str, Optional[str]]:
+        if isinstance(self.tasks, _LazyRows):
+            return self.tasks.texts(task_id)
+        task = self.tasks[task_id]
+        return task["title"], task.get("description")
+
+    def text_index_job(self) -> Optional[Callable[[], TrigramIndex]]:
+        """A function that builds the trigram index, safe to run in another thread; None if the
+        index exists or is being built. Hand its result to `install_text_index`."""
+        if self.text is not None or self._text_backlog is not None:
+            return None
+        docs = [(task_id, self._texts(task_id)) for task_id in self.tasks]
+        self._text_backlog = []
+
+        def build() -> TrigramIndex:
+            index = TrigramIndex()
+            for task_id, texts in docs:
+                index.add(task_id, texts)
+            return index
+        return build
+
+    def install_text_index(self, index: Optional[TrigramIndex]) -> None:
+        "Catch `index` up with the writes made while it was built and start using it; None abandons the build."
+        if index is not None:
+            for added, task_id, texts in self._text_backlog:
+                (index.add if added else index.remove)(task_id, texts)
+        self._text_backlog = None
+        self.text = index
+
+    def _title_order(self) -> List[Tuple[str, str]]:
+        if self._by_title is None:
+            self._by_title = sorted((self._texts(i)[0], i) for i in self.tasks)
+        return self._by_title
+
+    def _day_counts(self) -> Dict[str, List[int]]:
+        if self._days is None:
+            days: Dict[str, List[int]] = {}
+            done = self.by_status[True]
+            # from the ordering index, so binary snapshots need not decode any row
+            for created_at, task_id in self.order:
+                counts = days.setdefault(created_at[:10], [0, 0])
+                counts[0] += 1
+                counts[1] += task_id in done
+            self._days = days
+        return self._days
+
+    def _count_day(self, created_at: str, created: int, completed: int) -> None:
+        if self._days is not None:
+            counts = self._days.setdefault(created_at[:10], [0, 0])
+            counts[0] += created
+            counts[1] += completed
+            if not counts[0]:
+                del self._days[created_at[:10]]
+
+    def stats(self, by_day: bool = False) -> TaskStats:
+        "Counts from the status index (and the per-day counters), without visiting any task."
+        days = {day: tuple(c) for day, c in self._day_counts().items()} if by_day else None
+        return _task_stats(len(self.tasks), len(self.by_status[True]), days)
+
+    def add(self, task: Dict[str, Any], ordered: bool = True) -> None:
+        task_id = task["id"]
+        if task_id in self.tasks:
+            self.remove(task_id)
+        self.tasks[task_id] = task
+        self.by_status[bool(task.get("is_completed"))][task_id] = None
+        self._count_day(task["created_at"], 1, bool(task.get("is_completed")))
+        self._rank[task_id] = self._next_rank
+        self._next_rank += 1
+        if ordered:
+            bisect.insort(self.order, (task["created_at"], task_id))
+        else:
+            self.order.append((task["created_at"], task_id))
+        if self.text is not None:
+            self.text.add(task_id, (task["title"], task.get("description")))
+        elif self._text_backlog is not None:
+            self._text_backlog.append((True, task_id, (task["title"], task.get("description"))))
+        if self._by_title is not None:
+            bisect.insort(self._by_title, (task["title"], task_id))
+
+    def complete(self, task_id: str, at: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        if not task.get("is_completed"):
+            self.by_status[False].pop(task_id, None)
+            self.by_status[True][task_id] = None
+            task["is_completed"] = True
+            task["completed_at"] = at
+            self._count_day(task["created_at"], 0, 1)
+        return task
+
+    def remove(self, task_id: str) -> Optional[Dict[str, Any]]:
+        task = self.tasks.pop(task_id, None)
+        if task is None:
+            return None
+        self.by_status[bool(task.get("is_completed"))].pop(task_id, None)
+        self._count_day(task["created_at"], -1, -bool(task.get("is_completed")))
+        self._rank.pop(task_id, None)
+        for keys, key in ((self.order, (task["created_at"], task_id)), (self._by_title, (task["title"], task_id))):
+            if keys is None:
+                continue
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+        if self.text is not None:
+            self.text.remove(task_id, (task["title"], task.get("description")))
+        elif self._text_backlog is not None:
+            self._text_backlog.append((False, task_id, (task["title"], task.get("description"))))
+        return task
+
+    def _search(self, is_completed: Optional[bool], q: Optional[str],
+                created_after: Optional[str] = None, created_before: Optional[str] = None):
+        "Candidate ids from the text index (None = no narrowing) and a predicate confirming a task."
+        ql = q.lower() if q else None
+        # until the index is built, a search scans
+        ids = self.text.candidates(ql) if ql and len(ql) >= GRAM and self.text is not None else None
+
+        def match(t: Dict[str, Any]) -> bool:
+            if is_completed is not None and bool(t.get("is_completed")) != is_completed:
+                return False
+            if (created_after and t["created_at"] <= created_after) or (
+                    created_before and t["created_at"] >= created_before):
+                return False
+            return not ql or _text_matches(t, ql)
+        return ids, match
+
+    def scan(self, is_completed: Optional[bool] = None, q: Optional[str] = None, sort: Optional[str] = None,
+             created_after: Optional[str] = None, created_before: Optional[str] = None,
+             after: Optional[Tuple[str, str]] = None) -> Iterable[Dict[str, Any]]:
+        "Matching tasks in `sort` order, resuming after the (sort key, id) `after`; lazy, so callers may stop early."
+        field, descending = _sort_spec(sort)
+        ids, match = self._search(is_completed, q, created_after, created_before)
+        if ids is not None and len(ids) * WALK_ORDER_RATIO < len(self.tasks):
+            keys = sorted((self.tasks[i][field], i) for i in ids)
+            ids = None
+        else:
+            keys = self.order if field == "created_at" else self._title_order()
+        lo, hi = 0, len(keys)
+        if field == "created_at":
+            # the created_at range is a contiguous slice of the sorted keys
+            if created_after:
+                lo = bisect.bisect_right(keys, (created_after, _MAX_ID))
+            if created_before:
+                hi = bisect.bisect_left(keys, (created_before,))
+        if after:
+            if descending:
+                hi = min(hi, bisect.bisect_left(keys, after))
+            else:
+                lo = max(lo, bisect.bisect_right(keys, after))
+        for i in (range(hi - 1, lo - 1, -1) if descending else range(lo, hi)):
+            task_id = keys[i][1]
+            if ids is not None and task_id not in ids:
+                continue
+            task = self.tasks[task_id]
+            if match(task):
+                yield task
+
+    def select(self, is_completed: Optional[bool] = None, q: Optional[str] = None, sort: Optional[str] = None,
+               created_after: Optional[str] = None, created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        "Matching tasks; in document order unless a sort or created_at range is given."
+        if sort or created_after or created_before:
+            return list(self.scan(is_completed, q, sort, created_after, created_before))
+        ids, match = self._search(is_completed, q)
+        if ids is None:
+            if is_completed is None:
+                rows = self.tasks.values()
+            else:
+                rows = (self.tasks[i] for i in sorted(self.by_status[is_completed], key=self._rank.__getitem__))
+            return [t for t in rows if match(t)] if q else list(rows)
+        ids = sorted(ids, key=self._rank.__getitem__)
+        return [t for t in (self.tasks[i] for i in ids) if match(t)]
+
+    def page(self, after: Optional[Tuple[str, str]], limit: int, is_completed: Optional[bool] = None,
+             q: Optional[str] = None, sort: Optional[str] = None, created_after: Optional[str] = None,
+             created_before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        "Up to `limit` matching tasks after the `after` key in `sort` order, and whether more remain."
+        rows = list(itertools.islice(self.scan(is_completed, q, sort, created_after, created_before, after), limit + 1))
+        return rows[:limit], len(rows) > limit
+
+    def task_version(self, task_id: str) -> int:
+        return self._task_versions.get(task_id, self._loaded_version)
+
+    def document(self) -> Dict[str, Any]:
+        if isinstance(self.tasks, _LazyRows):
+            # decode for the write without keeping every row decoded afterwards
+            return {"tasks": [self.tasks.peek(i) for i in self.tasks], "version": self.version}
+        return {"tasks": list(self.tasks.values()), "version": self.version}
+
+    def apply(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        "Apply one journal record; unknown ids are ignored so replay is idempotent."
+        op = record["op"]
+        if op == "create":
+            # a copy: rows are changed in place later, and the record itself may not be journaled yet
+            task = dict(record["task"])
+            task_id = task["id"]
+            # a create replayed over its own result (e.g. after an interrupted compaction) changes nothing
+            changed = task_id not in self.tasks
+            self.add(task)
+        elif op == "put":
+            # replace a task wholesale (or add it); used to repair a mirror
+            task = dict(record["task"])
+            task_id = task["id"]
+            changed = task_id not in self.tasks or _project(self.tasks[task_id], None) != task
+            if changed:
+                self.add(task)
+        elif op == "complete":
+            task_id = record["id"]
+            task = self.tasks.get(task_id)
+            changed = task is not None and not task.get("is_completed")
+            # records written before completion times were kept have no "at"
+            self.complete(task_id, record.get("at"))
+        elif op == "delete":
+            task_id = record["id"]
+            task = self.remove(task_id)
+            changed = task is not None
+        else:
+            raise ValueError(f"Unknown journal op: {op}")
+        if changed:
+            self.version += 1
+            if op == "delete":
+                self._task_versions.pop(task_id, None)
+            else:
+                self._task_versions[task_id] = self.version
+        return task
+
+
+@instrument_backend
 class JSONDataHandler(IDataHandler):
-    def __init__(self, path: str = "data.json"):
+    """JSON file storage. The file is parsed once; reads are served from memory.
+
+    All mutations go through a single writer coroutine that groups whatever
+    arrives within `batch_window` seconds (up to `max_batch`) and makes it
+    durable with one flush; each caller resumes once its batch is on disk.
+    Without a journal every mutation rewrites the document atomically. With
+    `journal=True` each mutation is appended (and fsynced) as one JSON line to
+    `<path>.log`, and the log is folded back into the snapshot in the background
+    every `compact_every` records.
+
+    With `shared=True` several processes (e.g. uvicorn workers) may use the same
+    files. Writers hold an exclusive `fcntl` lock on `<path>.lock` while they
+    catch up with the files, apply their batch and persist it. Reads first compare
+    the files' (inode, mtime, size) with what this process last saw and only
+    reload when they differ; in journal mode a grown log is replayed from where
+    this process stopped instead of re-parsing everything.
+
+    `snapshot_format="binary"` stores the snapshot in the memory-mapped format of
+    binary_snapshot.py instead of JSON. Either format is recognised when reading;
+    None keeps whichever format the file already has (JSON for a new file).
+    """
+
+    def __init__(self, path: str = "data.json", *, journal: bool = False, compact_every: int = 1000,
+                 batch_window: float = 0.0, max_batch: int = 256, shared: bool = False,
+                 snapshot_format: Optional[str] = None):
+        if snapshot_format not in (None, "json", "binary"):
+            raise ValueError(f"Unknown snapshot format: {snapshot_format}")
         self.path = path
+        self.snapshot_format = snapshot_format or ("binary" if binary_snapshot.is_binary(path) else "json")
+        self.journal = journal
+        self.compact_every = compact_every
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.shared = shared
+        self.log_path = f"{path}.log"
+        self.lock_path = f"{path}.lock"
+        self._rotated_log_path = f"{path}.log.compacting"
+        # byte offset up to which the live log has been replayed
+        self._log_offset = 0
+        self._disk_signature: Tuple[Any, Any] = (None, None)
+        if shared:
+            import fcntl  # POSIX only
+            self._fcntl = fcntl
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._log_records = self._open_files()
+            finally:
+                os.close(fd)
+        else:
+            self._log_records = self._open_files()
+        self._log_file = None
+        self._save_lock = asyncio.Lock()
+        self._sync_lock = asyncio.Lock()
+        self._compaction: Optional[asyncio.Task] = None
+        self._indexing: Optional[asyncio.Task] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def _open_files(self) -> int:
         if not os.path.exists(self.path):
-            with open(self.path, "w", encoding="utf-8") as f:
-                json.dump({"tasks": []}, f)
-
-    async def _load(self) -> Dict[str, Any]:
-        return await asyncio.to_thread(lambda: json.load(open(self.path, "r", encoding="utf-8")))
-
-    async def _save(self, data: Dict[str, Any]) -> None:
-        def _write():
-            with open(self.path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        await asyncio.to_thread(_write)
+            self._write_snapshot({"tasks": []})
+        return self._reload()
+
+    def _load_store(self) -> _TaskStore:
+        if binary_snapshot.is_binary(self.path):
+            return _TaskStore.from_snapshot(binary_snapshot.BinarySnapshot(self.path))
+        with open(self.path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        return _TaskStore(doc.get("tasks", []), version=doc.get("version", 0))
+
+    def _write_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        # write-then-rename so readers and crashes never see a half-written file
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            if self.snapshot_format == "binary":
+                binary_snapshot.dump(snapshot["tasks"], f, snapshot.get("version", 0))
+            else:
+                f.write(json.dumps(snapshot, ensure_ascii=False, indent=2).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _replay(self, log_path: str, start: int = 0) -> Tuple[int, int]:
+        "Apply the log from byte `start`; returns the records applied and the offset reached."
+        if not os.path.exists(log_path):
+            return 0, 0
+        count = 0
+        good_bytes = start
+        with open(log_path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # torn final line from a crash mid-append; cut it off so
+                    # the next append starts on a fresh line
+                    logger.warning("Truncating torn journal tail in %s", log_path)
+                    f.close()
+                    os.truncate(log_path, good_bytes)
+                    break
+                good_bytes += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Skipping unreadable journal line in %s", log_path)
+                    continue
+                self._store.apply(record)
+                count += 1
+        return count, good_bytes
+
+    def _append(self, lines: str) -> None:
+        if self._log_file is not None and self.shared and (
+                (_file_id(self.log_path) or (None,))[0] != os.fstat(self._log_file.fileno()).st_ino):
+            # another worker compacted our log away; append to the current one
+            self._log_file.close()
+            self._log_file = None
+        if self._log_file is None:
+            self._log_file = open(self.log_path, "a", encoding="utf-8")
+        self._log_file.write(lines)
+        self._log_file.flush()
+        os.fsync(self._log_file.fileno())
+
+    def _signature(self) -> Tuple[Any, Any]:
+        "Cheap identity of what is on disk: the snapshot's and (in journal mode) the log's file ids."
+        return _file_id(self.path), _file_id(self.log_path) if self.journal else None
+
+    def _remember_disk_state(self) -> None:
+        "Record the files as they are now, after this process read or wrote them."
+        self._disk_signature = self._signature()
+        log = self._disk_signature[1]
+        self._log_offset = log[2] if log else 0
+
+    def _modified_at(self) -> Optional[str]:
+        "Time of the last write to the files, from the mtimes _remember_disk_state recorded."
+        mtimes = [f[1] for f in self._disk_signature if f]
+        return iso_from_timestamp(max(mtimes) / 1e9) if mtimes else None
+
+    def _refresh(self) -> bool:
+        "Catch up with changes other processes made to the files; True if anything was reloaded."
+        signature = self._signature()
+        if signature == self._disk_signature:
+            return False
+        (snapshot, log), (old_snapshot, old_log) = signature, self._disk_signature
+        if (snapshot == old_snapshot and log is not None and old_log is not None
+                and log[0] == old_log[0] and log[2] >= self._log_offset):
+            # only appends since we last looked: replay the new tail
+            count, _ = self._replay(self.log_path, self._log_offset)
+            self._log_records += count
+            self._remember_disk_state()
+        else:
+            self._log_records = self._reload()
+        return True
+
+    @contextlib.asynccontextmanager
+    async def _file_lock(self, exclusive: bool = True):
+        "Advisory lock on `<path>.lock` coordinating processes that share the files; no-op unless shared."
+        if not self.shared:
+            yield
+            return
+        fcntl = self._fcntl
+        mode = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB
+        # a fresh descriptor per acquisition: flock locks held through different
+        # descriptors exclude each other even within this process
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.flock(fd, mode)
+                    break
+                except BlockingIOError:
+                    # poll instead of blocking a thread, so a cancelled waiter never ends up holding the lock
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+            yield
+        finally:
+            # closing the descriptor releases the lock
+            os.close(fd)
+
+    async def _sync(self) -> None:
+        "Before a read: pick up writes from other processes (shared mode only)."
+        if not self.shared or self._signature() == self._disk_signature:
+            return
+        async with self._sync_lock:
+            async with self._file_lock(exclusive=False):
+                self._refresh()
+
+    async def _persist(self, records: List[Dict[str, Any]]) -> None:
+        "Make applied records durable; the caller holds _save_lock."
+        if not self.journal:
+            await asyncio.to_thread(self._write_snapshot, self._store.document())
+            return
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        await asyncio.to_thread(self._append, lines)
+        self._log_records += len(records)
+        if self._log_records >= self.compact_every and (self._compaction is None or self._compaction.done()):
+            self._compaction = asyncio.create_task(self.compact())
+
+    async def _commit(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return (await self._commit_many([record]))[0]
+
+    async def _commit_many(self, records: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        "Hand records to the writer as one unit; they are applied in order and made durable together."
+        loop = asyncio.get_running_loop()
+        if self._writer is None or self._writer.done() or self._writer.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._writer = loop.create_task(self._write_loop())
+        fut = loop.create_future()
+        self._queue.put_nowait((records, fut))
+        return await fut
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0] or ())
+            deadline = loop.time() + self.batch_window
+            while size < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                batch.append(item)
+                size += len(item[0] or ())
+            # close() enqueues a None item: flush what came before it and stop
+            closing = any(records is None for records, _ in batch)
+            batch = [item for item in batch if item[0] is not None]
+            try:
+                await self._flush_batch(batch)
+            except Exception as e:
+                # the writer outlives a failed batch, or every later commit would wait forever
+                logger.exception("JSON writer failed a batch of %d commits", len(batch))
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    async def _flush_batch(self, batch: List[Any]) -> None:
+        # Serialize writers, in this process and (shared mode) across processes, so an
+        # older snapshot can never be written after a newer one.
+        async with self._save_lock, self._file_lock():
+            if self.shared:
+                self._refresh()
+            results, applied, rejected = self._apply_batch(batch)
+            try:
+                if applied:
+                    await self._persist(applied)
+            except Exception as e:
+                logger.exception("Failed to persist %d JSON mutations", len(applied))
+                # drop the unpersisted changes from memory by re-reading what is on disk
+                self._reload()
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            # also keeps _modified_at current when the files are not shared
+            self._remember_disk_state()
+        for n, ((_, fut), item_results) in enumerate(zip(batch, results)):
+            if fut.done():
+                continue
+            if n in rejected:
+                fut.set_exception(rejected[n])
+            else:
+                fut.set_result(item_results)
+
+    def _apply_batch(self, batch: List[Any]
+                     ) -> Tuple[List[Optional[List[Any]]], List[Dict[str, Any]], Dict[int, Exception]]:
+        """Apply every item's records in order. Returns the results per item, the records that
+        changed something, and the error of each item (by position) that was rejected instead."""
+        rejected: Dict[int, Exception] = {}
+        while True:
+            results: List[Optional[List[Any]]] = []
+            applied: List[Dict[str, Any]] = []
+            for n, (records, _) in enumerate(batch):
+                if n in rejected:
+                    results.append(None)
+                    continue
+                item_results, item_applied = [], []
+                try:
+                    for record in records:
+                        version = self._store.version
+                        item_results.append(self._store.apply(record))
+                        # only records that changed something are journaled (e.g. not a second complete)
+                        if self._store.version != version:
+                            item_applied.append(record)
+                except Exception as e:
+                    logger.warning("Rejected a JSON mutation: %r", e)
+                    rejected[n] = e
+                    break
+                results.append(item_results)
+                applied += item_applied
+            else:
+                return results, applied, rejected
+            # the failing record may be half-applied, and earlier records of its item applied:
+            # go back to what is on disk and apply the remaining items again
+            self._reload()
+
+    def _reload(self) -> int:
+        "Rebuild the in-memory store from disk; returns the number of journal records replayed."
+        self._store = self._load_store()
+        replayed = 0
+        if self.journal:
+            # a crash during compaction leaves the rotated log behind; replay it first
+            for log in (self._rotated_log_path, self.log_path):
+                replayed += self._replay(log)[0]
+        self._remember_disk_state()
+        return replayed
+
+    async def startup(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        "Wait for queued mutations to become durable, then stop the writer."
+        if self._writer is not None and not self._writer.done():
+            self._queue.put_nowait((None, None))
+            await self._writer
+        if self._compaction is not None:
+            await asyncio.gather(self._compaction, return_exceptions=True)
+        if self._indexing is not None:
+            await asyncio.gather(self._indexing, return_exceptions=True)
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    async def compact(self) -> None:
+        "Fold the journal into a fresh snapshot and start a new, empty log."
+        if not self.journal:
+            return
+        def _fold():
+            self._write_snapshot(snapshot)
+            os.remove(self._rotated_log_path)
+
+        async with self._save_lock, self._file_lock():
+            if self.shared:
+                self._refresh()
+            if self._log_records == 0:
+                return
+            document = self._store.document()
+            # the writer changes rows in place once the lock is released, while the fold may
+            # still be serializing them in its thread: fold copies taken under the lock
+            snapshot = {**document, "tasks": [dict(t) for t in document["tasks"]]}
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+            await asyncio.to_thread(os.replace, self.log_path, self._rotated_log_path)
+            self._log_records = 0
+            if self.shared:
+                # other workers must not rotate or read a half-folded log: finish under the lock
+                try:
+                    await asyncio.to_thread(_fold)
+                except Exception:
+                    logger.exception("Journal compaction failed; rotated log kept for replay")
+                self._remember_disk_state()
+                return
+        # appends resume on a new log as soon as the lock is released
+        try:
+            await asyncio.to_thread(_fold)
+        except Exception:
+            logger.exception("Journal compaction failed; rotated log kept for replay")
+
+    def _index_for(self, q: Optional[str]) -> None:
+        "On the first indexable search, start building the trigram index; searches scan until it is ready."
+        if not q or len(q) < GRAM or self._store.text is not None:
+            return
+        store = self._store
+        build = store.text_index_job()
+        if build is not None:
+            self._indexing = asyncio.create_task(self._build_text_index(store, build))
+
+    async def _build_text_index(self, store: _TaskStore, build: Callable[[], TrigramIndex]) -> None:
+        # in a worker thread, so requests keep being served (by scanning) while it builds
+        started = time.perf_counter()
+        try:
+            index = await asyncio.to_thread(build)
+        except Exception:
+            logger.exception("Building the search index failed; searches keep scanning")
+            store.install_text_index(None)
+            return
+        store.install_text_index(index)
+        logger.info("Built search index over %d tasks in %.2fs", len(store.tasks), time.perf_counter() - started)
 
     async def create_task(self, payload: TaskCreate) -> Task:
-        data = await self._load()
         task = Task(**payload.model_dump(), created_at=utc_now_iso())
-        data["tasks"].append(task.model_dump())
-        await self._save(data)
+        await self._commit({"op": "create", "task": task.model_dump()})
         return task
 
-    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None) -> List[Task]:
-        data = await self._load()
-        tasks = [Task(**t) for t in data.get("tasks", [])]
-        if is_completed is not None:
-            tasks = [t for t in tasks if t.is_completed == is_completed]
-        if q:
-            ql = q.lower()
-            tasks = [t for t in tasks if ql in t.title.lower() or (t.description and ql in t.description.lower())]
-        return tasks
+    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> List[Task]:
+        await self._sync()
+        self._index_for(q)
+        return [Task(**t) for t in self._store.select(is_completed, q, sort, created_after, created_before)]
+
+    async def list_task_rows(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                             sort: Optional[str] = None, created_after: Optional[str] = None,
+                             created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        await self._sync()
+        self._index_for(q)
+        # copies, so callers (and caches) never hold the store's live rows
+        return [_project(t, None) for t in self._store.select(is_completed, q, sort, created_after, created_before)]
+
+    async def list_tasks_page(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None, limit: int = 100,
+                              cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                              sort: Optional[str] = None, created_after: Optional[str] = None,
+                              created_before: Optional[str] = None) -> TaskPage:
+        after = _parse_page_args(cursor, fields, sort)
+        await self._sync()
+        self._index_for(q)
+        rows, more = self._store.page(after, limit, is_completed, q, sort, created_after, created_before)
+        next_cursor = _next_cursor(rows[-1], sort) if more else None
+        return TaskPage(items=[_project(t, fields) for t in rows], next_cursor=next_cursor)
+
+    async def iter_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # only ids are captured up front; each row is read when it is reached, so
+        # tasks deleted mid-stream are skipped rather than served stale
+        await self._sync()
+        self._index_for(q)
+        ids = [t["id"] for t in self._store.select(is_completed, q, sort, created_after, created_before)]
+        for n, task_id in enumerate(ids, 1):
+            task = self._store.tasks.get(task_id)
+            if task is not None:
+                yield _project(task, None)
+            if n % STREAM_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
 
     async def get_task(self, task_id: str) -> Optional[Task]:
-        data = await self._load()
-        for t in data.get("tasks", []):
-            if t["id"] == task_id:
-                return Task(**t)
-        return None
+        await self._sync()
+        t = self._store.tasks.get(task_id)
+        return Task(**t) if t else None
+
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]:
+        await self._sync()
+        return self._store.version, self._modified_at()
+
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]:
+        await self._sync()
+        t = self._store.tasks.get(task_id)
+        return (Task(**t), self._store.task_version(task_id)) if t else None
+
+    async def get_stats(self, by_day: bool = False) -> TaskStats:
+        await self._sync()
+        return self._store.stats(by_day)
 
     async def mark_completed(self, task_id: str) -> Task:
-        data = await self._load()
-        for i, t in enumerate(data.get("tasks", [])):
-            if t["id"] == task_id:
-                t["is_completed"] = True
-                data["tasks"][i] = t
-                await self._save(data)
-                return Task(**t)
-        raise KeyError("Task not found")
+        t = await self._commit({"op": "complete", "id": task_id, "at": utc_now_iso()})
+        if t is None:
+            raise KeyError("Task not found")
+        return Task(**t)
 
     async def delete_task(self, task_id: str) -> bool:
-        data = await self._load()
-        before = len(data.get("tasks", []))
-        data["tasks"] = [t for t in data.get("tasks", []) if t["id"] != task_id]
-        after = len(data["tasks"])
-        await self._save(data)
-        return after < before
+        return await self._commit({"op": "delete", "id": task_id}) is not None
+
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]:
+        tasks = [Task(**p.model_dump(), created_at=utc_now_iso()) for p in payloads]
+        await self._commit_many([{"op": "create", "task": t.model_dump()} for t in tasks])
+        return tasks
+
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]:
+        now = utc_now_iso()
+        results = await self._commit_many([{"op": "complete", "id": i, "at": now} for i in task_ids])
+        return [Task(**t) if t else None for t in results]
+
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]:
+        results = await self._commit_many([{"op": "delete", "id": i} for i in task_ids])
+        return [t is not None for t in results]
+
+    async def apply(self, records: List[Dict[str, Any]]) -> None:
+        "Apply journal-style records (see _TaskStore.apply) in one flush."
+        await self._commit_many(records)
+
+
+# ---------------- JSON MIRROR ----------------
+class JSONMirror:
+    """Asynchronous replication sink that keeps a JSONDataHandler in step with another backend.
+
+    `publish` only enqueues a record (waiting only when the bounded queue is full);
+    a background task drains the queue in batches into the target file.
+    """
+
+    def __init__(self, target: JSONDataHandler, max_queue: int = 10000, max_batch: int = 500):
+        self.target = target
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.applied = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._drainer: Optional[asyncio.Task] = None
+        # enqueue times of records not yet written, oldest first
+        self._pending: deque = deque()
+
+    async def publish(self, record: Dict[str, Any]) -> None:
+        loop = asyncio.get_running_loop()
+        if self._drainer is None or self._drainer.done() or self._drainer.get_loop() is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._pending.clear()
+            self._drainer = loop.create_task(self._drain())
+        await self._queue.put(record)
+        self._pending.append(time.monotonic())
+
+    async def _drain(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self.target.apply(batch)
+                self.applied += len(batch)
+            except Exception:
+                self.failed += len(batch)
+                logger.exception("JSON mirror dropped %d records", len(batch))
+            for _ in batch:
+                if self._pending:
+                    self._pending.popleft()
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._pending),
+            "lag_seconds": round(time.monotonic() - self._pending[0], 3) if self._pending else 0.0,
+            "applied": self.applied,
+            "failed": self.failed,
+        }
+
+    async def flush(self) -> None:
+        "Wait until everything published so far has been written."
+        if self._drainer is not None and not self._drainer.done():
+            await self._queue.join()
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._drainer is not None:
+            self._drainer.cancel()
+            await asyncio.gather(self._drainer, return_exceptions=True)
+            self._drainer = None
+
+
+# ---------------- CIRCUIT BREAKER ----------------
+class BackendUnavailable(RuntimeError):
+    "Raised instead of calling a backend whose circuit breaker is open."
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency so requests do not queue behind its timeouts.
+
+    closed: calls go through; `failure_threshold` consecutive failures open it.
+    open: calls are refused until `reset_timeout` seconds have passed.
+    half_open: a single probe call is let through; its outcome closes or re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+
+    def allow(self) -> bool:
+        "Whether a call may go to the backend now."
+        if self.state == self.CLOSED:
+            return True
+        now = self._clock()
+        if self.state == self.OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_started = None
+        # half-open: one probe at a time; a probe that never reported back is replaced after reset_timeout
+        if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Circuit closed after a successful probe")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            logger.warning("Circuit opened after %d consecutive failures", self.failures)
+            self.state = self.OPEN
+            self.trips += 1
+            self._opened_at = self._clock()
+            self._probe_started = None
+
+    def retry_in(self) -> float:
+        "Seconds until an open circuit lets a probe through (0 unless open)."
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def stats(self) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+        if self.state == self.OPEN:
+            body["retry_in_seconds"] = round(self.retry_in(), 3)
+        return body
 
 
 # ---------------- MONGODB BACKEND ----------------
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    "Flatten an explain() plan tree into its stage names, root first."
+    stages = [plan.get("stage", "?")]
+    for child in [plan.get("inputStage")] + list(plan.get("inputStages", [])):
+        if child:
+            stages += _plan_stages(child)
+    return stages
+
+
+# task documents also carry a per-task change counter, `version`, which is not part of a Task
+_TASK_PROJECTION = {"_id": 0, "version": 0}
+
+
+def _task_document(task: Task) -> Dict[str, Any]:
+    # _id is the task id, so change stream delete events (which only carry _id) name the task
+    return {**task.model_dump(), "_id": task.id, "version": 1}
+
+
+def _change_event(change: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    "A change stream document as a change feed event (op / id / task), or None to skip it."
+    kind = change["operationType"]
+    if kind == "delete":
+        key = change["documentKey"]["_id"]
+        # documents created before _id was the task id cannot be named: make clients resync
+        return {"op": "delete", "id": key} if isinstance(key, str) else {"op": "reset", "id": None}
+    doc = change.get("fullDocument")
+    if doc is None:
+        # updated, then deleted before the lookup; the delete event follows
+        return None
+    task = {k: v for k, v in doc.items() if k in TASK_FIELDS}
+    return {"op": "create" if kind == "insert" else "complete", "id": task["id"], "task": task}
+
+
+@instrument_backend
 class MongoDataHandler(IDataHandler):
-    def __init__(self, uri: str, db_name: str = "task_db", collection: str = "tasks", json_path: str = "data.json"):
+    def __init__(self, uri: str, db_name: str = "task_db", collection: str = "tasks", json_path: str = "data.json",
+                 json_handler: Optional[JSONDataHandler] = None, text_search: bool = True,
+                 mirror_queue: int = 10000, mirror_batch: int = 500, client: Any = None,
+                 client_options: Optional[Dict[str, Any]] = None, breaker: Optional[CircuitBreaker] = None,
+                 reconcile_every: float = 0.0, reconcile_depth: int = 2):
         from motor.motor_asyncio import AsyncIOMotorClient
-        self.client = AsyncIOMotorClient(uri)
+        # `client` lets tests and benchmarks supply a stand-in such as mongomock-motor;
+        # `client_options` (maxPoolSize, serverSelectionTimeoutMS, ...) go to the Motor client
+        self.client = client if client is not None else AsyncIOMotorClient(uri, **(client_options or {}))
+        # while open, reads are served by the JSON backup and writes fail fast
+        self.breaker = breaker or CircuitBreaker()
         self.collection = self.client[db_name][collection]
-        self.json_handler = JSONDataHandler(json_path)  # ✅ dual write backup
+        # one document per task collection holding its change counter and last write time
+        self.meta = self.client[db_name]["meta"]
+        self._meta_id = collection
+        # set when a write committed but its change counter bump failed (see _changed)
+        self._unversioned = False
+        self.json_handler = json_handler or JSONDataHandler(json_path)  # ✅ dual write backup
+        # writes reach the JSON backup asynchronously; requests only wait on Mongo
+        self.mirror = JSONMirror(self.json_handler, max_queue=mirror_queue, max_batch=mirror_batch)
+        # verifies the mirror against Mongo on demand, and every `reconcile_every` seconds if > 0
+        from reconcile import Reconciler  # reconcile imports this module
+        self.reconciler = Reconciler(self, depth=reconcile_depth, interval=reconcile_every)
+        # `q` uses a text index when enabled, else an (unindexed) case-insensitive regex
+        self.text_search = text_search
+        self._text_index_ready = False
+        # (version, by_day) -> stats computed at that version; counting is only repeated after a write
+        self._stats_cache: Dict[Tuple[int, bool], TaskStats] = {}
+
+    async def startup(self) -> None:
+        self.reconciler.start()
+        try:
+            await self.ensure_indexes()
+        except Exception:
+            logger.exception("Could not provision MongoDB indexes")
+            return
+        for shape, report in (await self.explain_queries()).items():
+            if "error" in report:
+                logger.warning("Could not explain query shape %s: %s", shape, report["error"])
+            elif report["collscan"]:
+                logger.warning("Query shape %s uses a COLLSCAN: %s", shape, report["stages"])
+            else:
+                logger.info("Query shape %s plan: %s", shape, report["stages"])
+
+    async def ensure_indexes(self) -> None:
+        # point lookups, updates and deletes all filter on our own `id`
+        await self.collection.create_index("id", unique=True, name="task_id")
+        # `is_completed` filter + created_at sort
+        await self.collection.create_index([("is_completed", 1), ("created_at", 1)], name="status_created_at")
+        # cursor pagination order, created_at ranges and sort=created_at
+        await self.collection.create_index([("created_at", 1), ("id", 1)], name="created_at_id")
+        # sort=title
+        await self.collection.create_index([("title", 1), ("id", 1)], name="title_id")
+        if self.text_search:
+            await self.collection.create_index([("title", "text"), ("description", "text")], name="task_text")
+            self._text_index_ready = True
+
+    def _query_shapes(self) -> Dict[str, Any]:
+        "Representative find() cursors for every query the handler issues."
+        sort = [("created_at", 1), ("id", 1)]
+        return {
+            "get_by_id": self.collection.find({"id": ""}).limit(1),
+            "list_all": self.collection.find({}).sort("created_at", 1),
+            "list_by_status": self.collection.find({"is_completed": False}).sort("created_at", 1),
+            "created_range": self.collection.find({"created_at": {"$gt": "", "$lt": "~"}}).sort(sort),
+            "sort_by_title": self.collection.find({}).sort([("title", 1), ("id", 1)]).limit(1),
+            "page_after_cursor": self.collection.find({"$or": [
+                {"created_at": {"$gt": ""}}, {"created_at": "", "id": {"$gt": ""}},
+            ]}).sort(sort).limit(1),
+            "search": self.collection.find({"$text": {"$search": '"x"'}} if self.text_search
+                                           else {"title": {"$regex": "x", "$options": "i"}}).sort("created_at", 1),
+        }
+
+    async def explain_queries(self) -> Dict[str, Dict[str, Any]]:
+        "Winning plan stages per query shape, flagging any that fall back to a collection scan."
+        reports: Dict[str, Dict[str, Any]] = {}
+        for shape, cursor in self._query_shapes().items():
+            try:
+                plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+            except Exception as e:
+                reports[shape] = {"error": str(e)}
+                continue
+            stages = _plan_stages(plan.get("queryPlan", plan))
+            reports[shape] = {"stages": stages, "collscan": "COLLSCAN" in stages}
+        return reports
+
+    async def _search_clause(self, q: str) -> Dict[str, Any]:
+        phrase = q.replace('"', " ").strip()
+        # a query without a single word (e.g. only quotes) would be an empty phrase: match it as a substring
+        if not self.text_search or not re.search(r"\w", phrase):
+            pattern = re.escape(q)
+            return {"$or": [
+                {"title": {"$regex": pattern, "$options": "i"}},
+                {"description": {"$regex": pattern, "$options": "i"}},
+            ]}
+        if not self._text_index_ready:
+            await self.collection.create_index([("title", "text"), ("description", "text")], name="task_text")
+            self._text_index_ready = True
+        # quoted so every word must appear, as a phrase. Unlike the JSON and SQLite substring
+        # match, text search matches whole (stemmed) words: "ask" does not find "Task"
+        return {"$text": {"$search": '"%s"' % phrase}}
+
+    async def _read(self, query: Callable[[], Awaitable[Any]], fallback: Callable[[], Awaitable[Any]]) -> Any:
+        "Run a Mongo read through the breaker; serve it from the JSON backup if Mongo fails or the circuit is open."
+        if self.breaker.allow():
+            try:
+                result = await query()
+            except Exception:
+                self.breaker.record_failure()
+                logger.warning("MongoDB unavailable, using JSON fallback")
+            else:
+                self.breaker.record_success()
+                return result
+        return await fallback()
+
+    async def _write(self, op: Callable[[], Awaitable[Any]]) -> Any:
+        "Run a Mongo write through the breaker; raises BackendUnavailable while the circuit is open."
+        if not self.breaker.allow():
+            raise BackendUnavailable("MongoDB is unavailable; retry later", retry_after=self.breaker.retry_in())
+        try:
+            result = await op()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _changed(self) -> None:
+        "Advance the change counter; called after a write that changed something, never before it."
+        # bumping first would let a reader pair the new version with the old data
+        try:
+            await self._write(lambda: self.meta.update_one(
+                {"_id": self._meta_id},
+                {"$inc": {"version": 1}, "$set": {"modified_at": utc_now_iso()}},
+                upsert=True,
+            ))
+        except Exception:
+            # the write itself is committed, so it still succeeds (and is mirrored); until a bump
+            # lands, no version is reported, so no client revalidates against the unchanged one
+            logger.exception("Could not advance the change counter after a committed write")
+            self._unversioned = True
+            return
+        self._unversioned = False
 
     async def create_task(self, payload: TaskCreate) -> Task:
         # Create one Task object with a single UUID
         task = Task(**payload.model_dump(), created_at=utc_now_iso())
         # Write to MongoDB
-        await self.collection.insert_one(task.model_dump())
-        # Write the same task to JSON file (keeping same ID)
-        data = await self.json_handler._load()
-        data["tasks"].append(task.model_dump())
-        await self.json_handler._save(data)
-        print("✅ Dual write success with same ID:", task.id)
+        await self._write(lambda: self.collection.insert_one(_task_document(task)))
+        await self._changed()
+        # Queue the same task for the JSON file (keeping same ID)
+        await self.mirror.publish({"op": "create", "task": task.model_dump()})
+        logger.debug("Dual write queued for task %s", task.id)
         return task
 
-    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None) -> List[Task]:
-        try:
-            query: Dict[str, Any] = {}
-            if is_completed is not None:
-                query["is_completed"] = is_completed
-            if q:
-                query["$or"] = [
-                    {"title": {"$regex": q, "$options": "i"}},
-                    {"description": {"$regex": q, "$options": "i"}},
-                ]
-            cursor = self.collection.find(query).sort("created_at", 1)
-            docs = await cursor.to_list(length=10000)
-            return [Task(**d) for d in docs]
-        except Exception:
-            logger.warning("MongoDB unavailable, using JSON fallback")
-            return await self.json_handler.list_tasks(is_completed=is_completed, q=q)
+    async def _filter(self, is_completed: Optional[bool], q: Optional[str], created_after: Optional[str],
+                      created_before: Optional[str]) -> List[Dict[str, Any]]:
+        "Query clauses for the listing filters; created_at bounds become an indexed range."
+        clauses: List[Dict[str, Any]] = []
+        if is_completed is not None:
+            clauses.append({"is_completed": is_completed})
+        if q:
+            clauses.append(await self._search_clause(q))
+        bounds = {op: v for op, v in (("$gt", created_after), ("$lt", created_before)) if v}
+        if bounds:
+            clauses.append({"created_at": bounds})
+        return clauses
+
+    @staticmethod
+    def _sort(sort: Optional[str]) -> List[Tuple[str, int]]:
+        field, descending = _sort_spec(sort)
+        direction = -1 if descending else 1
+        return [(field, direction), ("id", direction)]
+
+    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> List[Task]:
+        return [Task(**d) for d in await self.list_task_rows(
+            is_completed=is_completed, q=q, sort=sort, created_after=created_after, created_before=created_before)]
+
+    async def list_task_rows(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                             sort: Optional[str] = None, created_after: Optional[str] = None,
+                             created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        order = self._sort(sort) if sort else [("created_at", 1)]
+
+        async def query():
+            clauses = await self._filter(is_completed, q, created_after, created_before)
+            query: Dict[str, Any] = {"$and": clauses} if clauses else {}
+            # every match, like the other backends: fetched in batches, never cut off at a fixed count
+            cursor = self.collection.find(query, _TASK_PROJECTION).sort(order).batch_size(STREAM_YIELD_EVERY)
+            return await cursor.to_list(length=None)
+        return await self._read(query, lambda: self.json_handler.list_task_rows(
+            is_completed=is_completed, q=q, sort=sort, created_after=created_after, created_before=created_before))
+
+    async def list_tasks_page(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None, limit: int = 100,
+                              cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                              sort: Optional[str] = None, created_after: Optional[str] = None,
+                              created_before: Optional[str] = None) -> TaskPage:
+        after = _parse_page_args(cursor, fields, sort)
+        field, descending = _sort_spec(sort)
+
+        async def query():
+            clauses = await self._filter(is_completed, q, created_after, created_before)
+            if after:
+                # keyset pagination: resume strictly after the last (sort key, id) seen
+                op = "$lt" if descending else "$gt"
+                clauses.append({"$or": [
+                    {field: {op: after[0]}},
+                    {field: after[0], "id": {op: after[1]}},
+                ]})
+            query: Dict[str, Any] = {"$and": clauses} if clauses else {}
+            projection = _TASK_PROJECTION
+            if fields:
+                projection = {"_id": 0, **{f: 1 for f in {*fields, field, "id"}}}
+            found = self.collection.find(query, projection).sort(self._sort(sort)).limit(limit + 1)
+            docs = await found.to_list(length=limit + 1)
+            more = len(docs) > limit
+            docs = docs[:limit]
+            next_cursor = _next_cursor(docs[-1], sort) if more else None
+            return TaskPage(items=[_project(d, fields) for d in docs], next_cursor=next_cursor)
+
+        return await self._read(query, lambda: self.json_handler.list_tasks_page(
+            is_completed=is_completed, q=q, limit=limit, cursor=cursor, fields=fields,
+            sort=sort, created_after=created_after, created_before=created_before))
+
+    async def iter_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        order = self._sort(sort) if sort else [("created_at", 1)]
+        started = False
+        if self.breaker.allow():
+            try:
+                clauses = await self._filter(is_completed, q, created_after, created_before)
+                query: Dict[str, Any] = {"$and": clauses} if clauses else {}
+                found = self.collection.find(query, _TASK_PROJECTION).sort(order).batch_size(STREAM_YIELD_EVERY)
+                async for doc in found:
+                    started = True
+                    yield doc
+            except Exception:
+                self.breaker.record_failure()
+                # once rows have gone out we cannot switch sources without duplicating them
+                if started:
+                    raise
+                logger.warning("MongoDB unavailable, using JSON fallback")
+            else:
+                self.breaker.record_success()
+                return
+        async for doc in self.json_handler.iter_tasks(
+                is_completed=is_completed, q=q, sort=sort, created_after=created_after, created_before=created_before):
+            yield doc
 
     async def get_task(self, task_id: str) -> Optional[Task]:
-        doc = await self.collection.find_one({"id": task_id})
-        if doc:
-            return Task(**doc)
-        return await self.json_handler.get_task(task_id)
+        async def query() -> Optional[Task]:
+            doc = await self.collection.find_one({"id": task_id}, _TASK_PROJECTION)
+            if doc:
+                return Task(**doc)
+            return await self.json_handler.get_task(task_id)
+        return await self._read(query, lambda: self.json_handler.get_task(task_id))
+
+    async def open_change_stream(self) -> AsyncIterator[Dict[str, Any]]:
+        "Open a change stream on the tasks (replica sets and sharded clusters only; raises otherwise)."
+        stream = self.collection.watch(
+            [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}],
+            full_document="updateLookup",
+        )
+        # the first poll opens the stream, so an unsupported deployment fails here rather than later
+        first = await stream.try_next()
+        return self._change_events(stream, first)
+
+    async def _change_events(self, stream: Any, first: Optional[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            if first is not None:
+                event = _change_event(first)
+                if event:
+                    yield event
+            async for change in stream:
+                event = _change_event(change)
+                if event:
+                    yield event
+        finally:
+            await stream.close()
+
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]:
+        if self._unversioned:
+            await self._changed()
+            if self._unversioned:
+                return None
+
+        async def query() -> Optional[Tuple[int, Optional[str]]]:
+            doc = await self.meta.find_one({"_id": self._meta_id})
+            return (doc["version"], doc.get("modified_at")) if doc else (0, None)
+
+        async def unknown() -> None:
+            # the JSON backup counts its own versions, which must not be confused with Mongo's
+            return None
+        return await self._read(query, unknown)
+
+    async def get_stats(self, by_day: bool = False) -> TaskStats:
+        # read before counting, so cached stats are never newer than their version (see get_version)
+        version = await self.get_version()
+        key = (version[0], by_day) if version else None
+
+        async def count() -> TaskStats:
+            if not by_day:
+                # both counts are answered from the task_id and status_created_at indexes
+                total = await self.collection.count_documents({})
+                completed = await self.collection.count_documents({"is_completed": True})
+                return _task_stats(total, completed)
+            days = {}
+            async for row in self.collection.aggregate([{"$group": {
+                "_id": {"$substr": ["$created_at", 0, 10]},
+                "created": {"$sum": 1},
+                "completed": {"$sum": {"$cond": ["$is_completed", 1, 0]}},
+            }}]):
+                days[row["_id"]] = (row["created"], row["completed"])
+            return _task_stats(sum(c for c, _ in days.values()), sum(k for _, k in days.values()), days)
+
+        async def query() -> TaskStats:
+            stats = self._stats_cache.get(key)
+            if stats is None:
+                stats = await count()
+                if key is not None:
+                    # only entries for the current version are worth keeping
+                    self._stats_cache = {k: v for k, v in self._stats_cache.items() if k[0] == key[0]}
+                    self._stats_cache[key] = stats
+            return stats
+        return await self._read(query, lambda: self.json_handler.get_stats(by_day))
+
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]:
+        async def query() -> Optional[Tuple[Task, Optional[int]]]:
+            doc = await self.collection.find_one({"id": task_id}, {"_id": 0})
+            if doc:
+                version = doc.pop("version", 0)
+                return Task(**doc), version
+            return await fallback()
+
+        async def fallback() -> Optional[Tuple[Task, Optional[int]]]:
+            task = await self.json_handler.get_task(task_id)
+            return (task, None) if task else None
+        return await self._read(query, fallback)
 
     async def mark_completed(self, task_id: str) -> Task:
-        res = await self.collection.find_one_and_update(
-            {"id": task_id},
-            {"$set": {"is_completed": True}},
-            return_document=True
-        )
+        async def update() -> Tuple[bool, Optional[Dict[str, Any]]]:
+            # only an open task changes, so completing twice keeps the first completion time
+            done = {"is_completed": True, "completed_at": utc_now_iso()}
+            before = await self.collection.find_one_and_update(
+                {"id": task_id, "is_completed": False},
+                {"$set": done, "$inc": {"version": 1}},
+                projection=_TASK_PROJECTION,
+            )
+            if before:
+                return True, {**before, **done}
+            return False, await self.collection.find_one({"id": task_id}, _TASK_PROJECTION)
+        changed, res = await self._write(update)
         if res:
-            await self.json_handler.mark_completed(task_id)
+            if changed:
+                await self._changed()
+            await self.mirror.publish({"op": "complete", "id": task_id, "at": res.get("completed_at")})
             return Task(**res)
         raise KeyError("Task not found")
 
     async def delete_task(self, task_id: str) -> bool:
-        res = await self.collection.delete_one({"id": task_id})
+        res = await self._write(lambda: self.collection.delete_one({"id": task_id}))
         deleted = res.deleted_count == 1
         if deleted:
-            await self.json_handler.delete_task(task_id)
+            await self._changed()
+            await self.mirror.publish({"op": "delete", "id": task_id})
         return deleted
 
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]:
+        from pymongo.errors import BulkWriteError
+        tasks = [Task(**p.model_dump(), created_at=utc_now_iso()) for p in payloads]
+        if not tasks:
+            return []
+        async def insert() -> set:
+            try:
+                # insert_many mutates its input (adds _id), so hand it copies
+                await self.collection.insert_many([_task_document(t) for t in tasks], ordered=False)
+            except BulkWriteError as e:
+                # rejected documents (e.g. duplicate keys) are not a sign that Mongo is down
+                return {err["index"] for err in e.details.get("writeErrors", [])}
+            return set()
+        failed = await self._write(insert)
+        if len(failed) < len(tasks):
+            await self._changed()
+        results: List[Optional[Task]] = [None if i in failed else t for i, t in enumerate(tasks)]
+        for t in results:
+            if t is not None:
+                await self.mirror.publish({"op": "create", "task": t.model_dump()})
+        return results
+
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]:
+        if not task_ids:
+            return []
+        async def update() -> Tuple[int, Dict[str, Dict[str, Any]]]:
+            res = await self.collection.update_many(
+                {"id": {"$in": task_ids}, "is_completed": False},
+                {"$set": {"is_completed": True, "completed_at": utc_now_iso()}, "$inc": {"version": 1}},
+            )
+            found = self.collection.find({"id": {"$in": task_ids}}, _TASK_PROJECTION)
+            return res.modified_count, {d["id"]: d async for d in found}
+        modified, docs = await self._write(update)
+        if modified:
+            await self._changed()
+        for task_id, doc in docs.items():
+            await self.mirror.publish({"op": "complete", "id": task_id, "at": doc.get("completed_at")})
+        return [Task(**docs[i]) if i in docs else None for i in task_ids]
+
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]:
+        if not task_ids:
+            return []
+        async def delete() -> Tuple[set, Optional[Exception]]:
+            # one delete_one per id (run concurrently over the connection pool) rather than a
+            # find + delete_many: only a delete's own count says it was this request that deleted
+            # the task, and not a concurrent one between the two calls
+            unique = list(dict.fromkeys(task_ids))
+            results = await asyncio.gather(*(self.collection.delete_one({"id": i}) for i in unique),
+                                           return_exceptions=True)
+            failed = next((r for r in results if isinstance(r, Exception)), None)
+            deleted = {i for i, res in zip(unique, results) if not isinstance(res, Exception) and res.deleted_count}
+            if failed is not None and not deleted:
+                raise failed
+            return deleted, failed
+        existing, failed = await self._write(delete)
+        if existing:
+            await self._changed()
+        for task_id in existing:
+            await self.mirror.publish({"op": "delete", "id": task_id})
+        if failed is not None:
+            # the deletes that went through are counted and mirrored before the error is reported
+            raise failed
+        # a repeated id is only deleted once
+        seen = set()
+        results = []
+        for i in task_ids:
+            results.append(i in existing and i not in seen)
+            seen.add(i)
+        return results
+
+    async def apply(self, records: List[Dict[str, Any]]) -> None:
+        "Apply journal-style records (see _TaskStore.apply), e.g. to store tasks with their ids and timestamps as they are."
+        from pymongo import DeleteOne, UpdateOne
+        ops = []
+        for r in records:
+            if r["op"] in ("create", "put"):
+                task = Task(**r["task"])
+                # $set rather than a replacement: documents stored before _id was the task id keep
+                # their ObjectId, which a replacement naming another _id would fail to change
+                ops.append(UpdateOne({"id": task.id}, {"$set": task.model_dump(), "$setOnInsert": {"_id": task.id},
+                                                       "$inc": {"version": 1}}, upsert=True))
+            elif r["op"] == "complete":
+                ops.append(UpdateOne({"id": r["id"], "is_completed": False},
+                                     {"$set": {"is_completed": True, "completed_at": r.get("at")},
+                                      "$inc": {"version": 1}}))
+            elif r["op"] == "delete":
+                ops.append(DeleteOne({"id": r["id"]}))
+            else:
+                raise ValueError(f"Unknown journal op: {r['op']}")
+        if not ops:
+            return
+        await self._write(lambda: self.collection.bulk_write(ops, ordered=True))
+        await self._changed()
+        for r in records:
+            await self.mirror.publish(r)
+
+    async def close(self) -> None:
+        await self.reconciler.close()
+        await self.mirror.close()
+        await self.json_handler.close()
+        self.client.close()
+
 
 # ---------------- Factory ----------------
-def get_data_handler() -> IDataHandler:
+def _json_handler_from_env(path: str) -> JSONDataHandler:
+    shared = parse_bool(os.getenv("JSON_SHARED"))
+    if shared is None:
+        # uvicorn takes its default --workers from WEB_CONCURRENCY
+        shared = int(os.getenv("WEB_CONCURRENCY", "1")) > 1
+    return JSONDataHandler(
+        path,
+        journal=bool(parse_bool(os.getenv("JSON_JOURNAL"))),
+        compact_every=int(os.getenv("JSON_COMPACT_EVERY", "1000")),
+        batch_window=float(os.getenv("JSON_BATCH_WINDOW_MS", "0")) / 1000,
+        max_batch=int(os.getenv("JSON_MAX_BATCH", "256")),
+        shared=shared,
+        snapshot_format=os.getenv("JSON_SNAPSHOT_FORMAT") or None,
+    )
+
+
+def _mongo_client_options_from_env() -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        # fail over to the JSON backup in seconds rather than after the driver's 30s default
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    }
+    for env, option in (
+        ("MONGO_MAX_POOL_SIZE", "maxPoolSize"),
+        ("MONGO_MIN_POOL_SIZE", "minPoolSize"),
+        ("MONGO_CONNECT_TIMEOUT_MS", "connectTimeoutMS"),
+        ("MONGO_SOCKET_TIMEOUT_MS", "socketTimeoutMS"),
+        ("MONGO_MAX_IDLE_TIME_MS", "maxIdleTimeMS"),
+    ):
+        value = os.getenv(env)
+        if value:
+            options[option] = int(value)
+    return options
+
+
+def _backend_from_env() -> IDataHandler:
+    if os.getenv("STORAGE_BACKEND", "").lower() == "sqlite":
+        from sqlite_handler import SQLiteDataHandler
+        sqlite_path = os.getenv("SQLITE_PATH", "tasks.db")
+        logger.info("Using SQLite backend at %s", sqlite_path)
+        return SQLiteDataHandler(sqlite_path, readers=int(os.getenv("SQLITE_READERS", "4")))
     mongo_uri = os.getenv("MONGO_URI")
+    path = os.getenv("DATA_FILE", "data.json")
     if mongo_uri:
         logger.info("Using MongoDB + JSON dual backend")
-        return MongoDataHandler(mongo_uri)
-    path = os.getenv("DATA_FILE", "data.json")
+        return MongoDataHandler(
+            mongo_uri,
+            client_options=_mongo_client_options_from_env(),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("MONGO_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("MONGO_BREAKER_RESET_SECONDS", "30")),
+            ),
+            json_handler=_json_handler_from_env(path),
+            text_search=parse_bool(os.getenv("MONGO_TEXT_SEARCH")) is not False,
+            mirror_queue=int(os.getenv("MIRROR_QUEUE_SIZE", "10000")),
+            mirror_batch=int(os.getenv("MIRROR_BATCH", "500")),
+            reconcile_every=float(os.getenv("MIRROR_RECONCILE_SECONDS", "0")),
+            reconcile_depth=int(os.getenv("MIRROR_RECONCILE_DEPTH", "2")),
+        )
+    shards = int(os.getenv("JSON_SHARDS", "0"))
+    if shards > 0:
+        from sharded_handler import ShardedJSONDataHandler
+        directory = os.getenv("JSON_SHARD_DIR", "data_shards")
+        logger.info("Using JSON-only backend, %d shards in %s", shards, directory)
+        return ShardedJSONDataHandler(directory, shards, make_shard=_json_handler_from_env)
     logger.info("Using JSON-only backend at %s", path)
-    return JSONDataHandler(path)
+    return _json_handler_from_env(path)
+
+
+def _archive_from_env(backend: IDataHandler) -> IDataHandler:
+    "Cold tier for `backend`: a second collection next to a Mongo primary, otherwise a JSON file."
+    path = os.getenv("ARCHIVE_FILE", "archive.json")
+    # written in bulk and rarely read, so the compact binary snapshot suits it
+    archive_file = JSONDataHandler(path, journal=True,
+                                   snapshot_format=os.getenv("ARCHIVE_SNAPSHOT_FORMAT", "binary"),
+                                   shared=bool(parse_bool(os.getenv("JSON_SHARED"))))
+    if isinstance(backend, MongoDataHandler):
+        return MongoDataHandler("", collection=os.getenv("ARCHIVE_COLLECTION", "tasks_archive"),
+                                client=backend.client, breaker=backend.breaker, json_handler=archive_file,
+                                text_search=backend.text_search)
+    return archive_file
+
+
+def get_data_handler() -> IDataHandler:
+    backend = handler = _backend_from_env()
+    if parse_bool(os.getenv("COALESCE_READS")) is not False:
+        from singleflight import CoalescingDataHandler
+        handler = CoalescingDataHandler(handler)
+    cache_ttl = float(os.getenv("CACHE_TTL_SECONDS", "0"))
+    if cache_ttl > 0:
+        from cache import CachedDataHandler
+        logger.info("Caching reads for %ss", cache_ttl)
+        handler = CachedDataHandler(handler, max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")), ttl=cache_ttl)
+    archive_days = float(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+    if archive_days > 0:
+        # inside the change feed, so moves are not published as deletes by this process; with
+        # MONGO_CHANGE_STREAMS the feed reads the hot collection instead, where a move is a delete
+        from tiering import TieredDataHandler
+        logger.info("Archiving tasks completed more than %s days ago", archive_days)
+        handler = TieredDataHandler(handler, _archive_from_env(backend), max_age=archive_days * 86400,
+                                    interval=float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600")),
+                                    batch=int(os.getenv("ARCHIVE_BATCH", "1000")))
+    if parse_bool(os.getenv("CHANGE_FEED")) is not False:
+        from change_feed import ChangeBroker, ChangeFeedDataHandler
+        broker = ChangeBroker(history=int(os.getenv("CHANGE_FEED_HISTORY", "1000")),
+                              queue_size=int(os.getenv("CHANGE_FEED_QUEUE_SIZE", "256")))
+        handler = ChangeFeedDataHandler(handler, broker,
+                                        change_streams=parse_bool(os.getenv("MONGO_CHANGE_STREAMS")) is not False)
+    return handler
@@ -0,0 +1,60 @@
+"""
+Idempotency-Key support: remembers the outcome of a request so a retry replays it instead of repeating it.
+"""
+from __future__ import annotations
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from cache import TTLCache
+
+
+class IdempotencyConflict(ValueError):
+    """The key was already used for a request with a different payload."""
+
+
+class IdempotencyStore:
+    """Results of completed operations by key, in a bounded TTL store, plus the operations in flight.
+
+    A request whose key is in flight waits for the first one and shares its result.
+    Only successes are remembered, so a request that failed can be retried with the
+    same key. Keys are local to this process.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400.0):
+        self.results = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.replays = 0
+
+    async def run(self, key: str, fingerprint: str, operation: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        "The result of `operation` for `key`, and whether it is a replay of an earlier request."
+        stored = self.results.get(key)
+        if stored is not None:
+            return self._replay(stored, fingerprint), True
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            used_for, call = pending
+            if used_for != fingerprint:
+                raise IdempotencyConflict("Idempotency-Key was already used with a different payload")
+            self.replays += 1
+            return await asyncio.shield(call), True
+
+        call = asyncio.ensure_future(operation())
+        self._in_flight[key] = (fingerprint, call)
+
+        def done(_):
+            self._in_flight.pop(key, None)
+            if not call.cancelled() and call.exception() is None:
+                self.results.set(key, (fingerprint, call.result()))
+        # runs to completion (and is remembered) even if this request is cancelled
+        call.add_done_callback(done)
+        return await asyncio.shield(call), False
+
+    def _replay(self, stored: Tuple[str, Any], fingerprint: str) -> Any:
+        used_for, result = stored
+        if used_for != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key was already used with a different payload")
+        self.replays += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {"keys": len(self.results), "in_flight": len(self._in_flight), "replays": self.replays}
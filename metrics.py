@@ -0,0 +1,229 @@
+"""
+Latency instrumentation: an in-process metrics registry rendered in Prometheus text format,
+an ASGI middleware timing every request, and a class decorator timing data-handler calls.
+"""
+from __future__ import annotations
+import functools
+import inspect
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils import get_logger
+
+logger = get_logger("metrics")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# seconds; the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _labels(**labels: Any) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        self.values[_labels(**labels)] += amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(k)} {v}" for k, v in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.values[_labels(**labels)] -= amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = buckets
+        # per label set: [count per bucket..., +Inf count], sum
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _labels(**labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * (len(self.buckets) + 1)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[key] += value
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', repr(bound)))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {self.sums[key]}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+
+    def _get(self, cls, name: str, help: str):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str) -> Histogram:
+        return self._get(Histogram, name, help)
+
+    def render(self) -> str:
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# calls slower than this are logged; 0 disables the slow-call log
+SLOW_CALL_SECONDS = float(os.getenv("SLOW_CALL_MS", "0")) / 1000
+
+REQUESTS = REGISTRY.counter("task_api_requests_total", "HTTP requests by route and status code")
+REQUEST_ERRORS = REGISTRY.counter("task_api_request_errors_total", "HTTP requests that failed with a 5xx or raised")
+REQUEST_LATENCY = REGISTRY.histogram("task_api_request_duration_seconds", "HTTP request latency")
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("task_api_requests_in_flight", "HTTP requests currently being served")
+BACKEND_LATENCY = REGISTRY.histogram("task_backend_call_duration_seconds", "Data handler call latency")
+BACKEND_ERRORS = REGISTRY.counter("task_backend_call_errors_total", "Data handler calls that raised")
+BACKEND_IN_FLIGHT = REGISTRY.gauge("task_backend_calls_in_flight", "Data handler calls currently running")
+
+
+def _log_if_slow(kind: str, name: str, elapsed: float) -> None:
+    if SLOW_CALL_SECONDS and elapsed >= SLOW_CALL_SECONDS:
+        logger.warning("Slow %s %s took %.1fms", kind, name, elapsed * 1000)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight and error counts per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route(self, scope) -> str:
+        from starlette.routing import Match
+        for route in scope["app"].router.routes:
+            if route.matches(scope)[0] == Match.FULL:
+                return route.path
+        return "<unmatched>"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method, route = scope["method"], self._route(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(method=method, route=route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec(method=method, route=route)
+            REQUEST_LATENCY.observe(elapsed, method=method, route=route)
+            REQUESTS.inc(method=method, route=route, status=status["code"])
+            if status["code"] >= 500:
+                REQUEST_ERRORS.inc(method=method, route=route)
+            _log_if_slow("request", f"{method} {route}", elapsed)
+
+
+def _timed(backend: str, name: str, fn):
+    labels = {"backend": backend, "method": name}
+
+    def _done(start: float, failed: bool) -> None:
+        elapsed = time.perf_counter() - start
+        BACKEND_IN_FLIGHT.dec(**labels)
+        BACKEND_LATENCY.observe(elapsed, **labels)
+        if failed:
+            BACKEND_ERRORS.inc(**labels)
+        _log_if_slow("backend call", f"{backend}.{name}", elapsed)
+
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def gen_wrapper(*args, **kwargs):
+            # streams are timed from the first pull to exhaustion
+            BACKEND_IN_FLIGHT.inc(**labels)
+            start, failed = time.perf_counter(), True
+            try:
+                async for item in fn(*args, **kwargs):
+                    yield item
+                failed = False
+            except GeneratorExit:
+                # the consumer stopped early (e.g. client disconnected); not a backend error
+                failed = False
+                raise
+            finally:
+                _done(start, failed)
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        BACKEND_IN_FLIGHT.inc(**labels)
+        start, failed = time.perf_counter(), True
+        try:
+            result = await fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _done(start, failed)
+    return wrapper
+
+
+def instrument_backend(cls):
+    "Class decorator: time every public async method of a data handler, labelled by class name."
+    for name, fn in list(vars(cls).items()):
+        if name.startswith("_"):
+            continue
+        if inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn):
+            setattr(cls, name, _timed(cls.__name__, name, fn))
+    return cls
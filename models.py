@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
 class TaskBase(BaseModel):
@@ -13,7 +13,33 @@ class Task(TaskBase):
     id: str = Field(default_factory=lambda: str(uuid4()), description="UUIDv4 string identifier")
     is_completed: bool = Field(default=False)
     created_at: str = Field(..., description="UTC ISO8601 timestamp")
+    completed_at: Optional[str] = Field(None, description="UTC ISO8601 timestamp of completion, if completed")
     model_config = ConfigDict(from_attributes=True)
 
 class TaskUpdate(BaseModel):
-    is_completed: bool
\ No newline at end of file
+    is_completed: bool
+
+class TaskPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = Field(None, description="Pass back as `cursor` to fetch the next page")
+
+
+class DayStats(BaseModel):
+    created: int = Field(..., description="Tasks created on this day (UTC) that still exist")
+    completed: int = Field(..., description="How many of them are completed")
+
+class TaskStats(BaseModel):
+    total: int
+    open: int
+    completed: int
+    by_day: Optional[Dict[str, DayStats]] = Field(None, description="Counts per created_at day (YYYY-MM-DD, UTC)")
+
+
+class BulkIds(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=10000)
+
+class BulkItemResult(BaseModel):
+    id: Optional[str] = None
+    ok: bool
+    task: Optional[Task] = None
+    error: Optional[str] = None
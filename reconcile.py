@@ -0,0 +1,220 @@
+"""
+Reconciliation of the JSON mirror with the MongoDB primary.
+
+Tasks are grouped into buckets by the first `depth` characters of their id. Each side
+folds its tasks into one 64-bit digest per bucket (an XOR of per-task hashes, so the
+order rows arrive in does not matter), and the bucket digests into a root digest. Equal
+roots mean the mirror is in sync; otherwise only the primary's rows in buckets whose
+digests differ are read again, compared with the per-task hashes kept from the mirror's
+single pass, and the mirror is repaired from them.
+
+    python reconcile.py              # verify and repair (uses MONGO_URI / DATA_FILE)
+    python reconcile.py --dry-run    # only report the drift
+
+Run the CLI while the service is stopped, or with JSON_SHARED=true, since it writes
+the same JSON file.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from data_handler import TASK_FIELDS, _MAX_ID, _TASK_PROJECTION
+from utils import utc_now_iso, get_logger
+
+logger = get_logger("reconcile")
+
+# rows per Mongo cursor batch while digesting
+BATCH = 1000
+
+
+def task_hash(task: Dict[str, Any]) -> int:
+    "64-bit hash of a task's stored fields, the same on both sides for the same content."
+    # repr of a tuple of str / None / bool is canonical, and about 3x cheaper than json.dumps
+    values = tuple(bool(task.get(f)) if f == "is_completed" else task.get(f) for f in TASK_FIELDS)
+    return int.from_bytes(hashlib.blake2b(repr(values).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def root_digest(buckets: Dict[str, int]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for bucket in sorted(buckets):
+        h.update(f"{bucket}:{buckets[bucket]:016x};".encode("utf-8"))
+    return h.hexdigest()
+
+
+class Reconciler:
+    """Verifies and repairs the JSON mirror of a MongoDataHandler.
+
+    Repairs go through the handler's mirror queue, in order with regular mirrored writes.
+    A write racing a run can still leave one row behind; the next run picks it up.
+    With `interval` > 0, `start` schedules a run every `interval` seconds.
+    """
+
+    def __init__(self, mongo: Any, depth: int = 2, interval: float = 0.0):
+        self.mongo = mongo
+        self.depth = depth
+        self.interval = interval
+        self.runs = 0
+        self.last: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def bucket(self, task_id: str) -> str:
+        return task_id[:self.depth]
+
+    def _digests(self, rows: Iterable[Dict[str, Any]], digests: Dict[str, int],
+                 hashes: Optional[Dict[str, Dict[str, int]]] = None) -> int:
+        "Fold `rows` into their bucket digests; with `hashes`, also keep each row's hash by bucket and id."
+        count = 0
+        for row in rows:
+            bucket = self.bucket(row["id"])
+            h = task_hash(row)
+            digests[bucket] = digests.get(bucket, 0) ^ h
+            if hashes is not None:
+                hashes.setdefault(bucket, {})[row["id"]] = h
+            count += 1
+        return count
+
+    async def _batches(self, rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[List[Dict[str, Any]]]:
+        batch = []
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def _primary_digests(self) -> Tuple[Dict[str, int], int]:
+        digests: Dict[str, int] = {}
+        count = 0
+        cursor = self.mongo.collection.find({}, _TASK_PROJECTION).batch_size(BATCH)
+        async for batch in self._batches(cursor):
+            count += self._digests(batch, digests)
+        return digests, count
+
+    async def _mirror_digests(self) -> Tuple[Dict[str, int], int, Dict[str, Dict[str, int]]]:
+        "Bucket digests of the mirror, plus every row's hash (8 bytes a task, not the row) for diffing buckets."
+        digests: Dict[str, int] = {}
+        hashes: Dict[str, Dict[str, int]] = {}
+        count = 0
+        # iter_tasks yields to the event loop as it goes, so a large mirror does not stall requests
+        async for batch in self._batches(self.mongo.json_handler.iter_tasks()):
+            count += self._digests(batch, digests, hashes)
+        return digests, count, hashes
+
+    async def _primary_rows(self, buckets: Set[str]) -> Dict[str, Dict[str, Any]]:
+        rows: Dict[str, Dict[str, Any]] = {}
+        for bucket in sorted(buckets):
+            # an id range, so each bucket is read through the unique `id` index
+            query = {"id": {"$gte": bucket, "$lt": bucket + _MAX_ID}}
+            async for doc in self.mongo.collection.find(query, _TASK_PROJECTION):
+                if self.bucket(doc["id"]) == bucket:
+                    rows[doc["id"]] = doc
+        return rows
+
+    async def run(self, repair: bool = True) -> Dict[str, Any]:
+        "Compare both sides; with `repair`, bring the mirror in line with the primary. Returns a report."
+        async with self._lock:
+            started, started_at = time.perf_counter(), utc_now_iso()
+            report: Dict[str, Any] = {"started_at": started_at, "repair": repair}
+            try:
+                report.update(await self._run(repair))
+            except Exception as e:
+                logger.exception("Mirror reconciliation failed")
+                report["error"] = str(e)
+            report["seconds"] = round(time.perf_counter() - started, 3)
+            self.runs += 1
+            self.last = report
+            return report
+
+    async def _run(self, repair: bool) -> Dict[str, Any]:
+        # records still queued for the mirror are not drift
+        await self.mongo.mirror.flush()
+        (primary, primary_count), (mirror, mirror_count, mirror_hashes) = await asyncio.gather(
+            self._primary_digests(), self._mirror_digests())
+        report: Dict[str, Any] = {
+            "in_sync": root_digest(primary) == root_digest(mirror),
+            "tasks": {"primary": primary_count, "mirror": mirror_count},
+            "buckets": {"total": len(primary.keys() | mirror.keys()), "differing": 0},
+            "missing": 0, "stale": 0, "extra": 0, "repaired": 0,
+        }
+        if report["in_sync"]:
+            return report
+        differing = {b for b in primary.keys() | mirror.keys() if primary.get(b, 0) != mirror.get(b, 0)}
+        report["buckets"]["differing"] = len(differing)
+
+        # the mirror's side of the differing buckets comes from the digest pass: it is read only once
+        mirrored = {task_id: h for b in differing for task_id, h in mirror_hashes.get(b, {}).items()}
+        # read last, right before the repair is queued, to keep the window for racing writes short
+        primary_rows = await self._primary_rows(differing)
+        records = []
+        for task_id, row in primary_rows.items():
+            h = mirrored.get(task_id)
+            if h is None:
+                report["missing"] += 1
+            elif h != task_hash(row):
+                report["stale"] += 1
+            else:
+                continue
+            records.append({"op": "put", "task": {f: row.get(f) for f in TASK_FIELDS}})
+        for task_id in mirrored.keys() - primary_rows.keys():
+            report["extra"] += 1
+            records.append({"op": "delete", "id": task_id})
+        if repair and records:
+            for record in records:
+                await self.mongo.mirror.publish(record)
+            await self.mongo.mirror.flush()
+            report["repaired"] = len(records)
+            logger.warning("Repaired %d mirror rows in %d buckets", len(records), len(differing))
+        return report
+
+    def status(self) -> Dict[str, Any]:
+        return {"running": self._lock.locked(), "interval": self.interval, "runs": self.runs, "last": self.last}
+
+    async def _every_interval(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run()
+
+    def start(self) -> None:
+        if self.interval > 0 and (self._loop_task is None or self._loop_task.done()):
+            self._loop_task = asyncio.create_task(self._every_interval())
+
+    async def close(self) -> None:
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+
+
+async def _main(repair: bool, depth: int) -> Dict[str, Any]:
+    from data_handler import MongoDataHandler, _backend_from_env
+    handler = _backend_from_env()
+    if not isinstance(handler, MongoDataHandler):
+        raise SystemExit("MONGO_URI is not set: there is no mirror to reconcile")
+    try:
+        return await Reconciler(handler, depth=depth).run(repair=repair)
+    finally:
+        await handler.close()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report drift without repairing it")
+    parser.add_argument("--depth", type=int, default=2, help="id prefix length that defines a bucket")
+    args = parser.parse_args(argv)
+    load_dotenv()
+    report = asyncio.run(_main(not args.dry_run, args.depth))
+    print(json.dumps(report, indent=2))
+    if "error" in report:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Trigram inverted index used by the JSON backend for the `q` search parameter.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+GRAM = 3
+
+
+def _grams(text: str) -> Set[str]:
+    text = text.lower()
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class TrigramIndex:
+    """Maps every lowercase 3-character substring to the ids of the documents containing it.
+
+    `candidates` narrows a substring query down to the documents holding all of its
+    trigrams; callers still confirm the match, since trigrams can occur out of order.
+    Documents' own trigram sets are not kept (they would dwarf the postings), so
+    `remove` takes the same texts the document was added with.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+
+    @staticmethod
+    def _doc_grams(texts: Iterable[Optional[str]]) -> Set[str]:
+        grams: Set[str] = set()
+        for text in texts:
+            if text:
+                grams |= _grams(text)
+        return grams
+
+    def add(self, doc_id: str, texts: Iterable[Optional[str]]) -> None:
+        for g in self._doc_grams(texts):
+            self._postings[g].add(doc_id)
+
+    def remove(self, doc_id: str, texts: Iterable[Optional[str]]) -> None:
+        for g in self._doc_grams(texts):
+            ids = self._postings.get(g)
+            if ids is None:
+                continue
+            ids.discard(doc_id)
+            if not ids:
+                del self._postings[g]
+
+    def candidates(self, query: str) -> Optional[Set[str]]:
+        "Ids that may contain `query`, or None when the query is too short to use the index."
+        grams = _grams(query)
+        if not grams:
+            return None
+        postings = sorted((self._postings.get(g, set()) for g in grams), key=len)
+        # intersect from the rarest trigram up so the working set only shrinks
+        result = set(postings[0])
+        for ids in postings[1:]:
+            if not result:
+                break
+            result &= ids
+        return result
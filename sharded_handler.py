@@ -0,0 +1,247 @@
+"""
+Hash-partitioned JSON storage: tasks are spread over N JSON files by a hash of their id,
+and an offline tool to re-shard a data set.
+
+    python sharded_handler.py data.json data_shards --shards 8        # split a single file
+    python sharded_handler.py data_shards data_shards_16 --shards 16  # change the shard count
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from data_handler import (IDataHandler, JSONDataHandler, _merge_rows, _merge_streams, _next_cursor, _parse_page_args,
+                          _project, _sum_stats)
+from metrics import instrument_backend
+from models import Task, TaskCreate, TaskPage, TaskStats
+from utils import utc_now_iso, get_logger
+
+logger = get_logger("sharded_handler")
+
+MANIFEST = "shards.json"
+
+
+def shard_of(task_id: str, shards: int) -> int:
+    "Shard index of a task id; crc32 is stable across processes and Python versions, unlike hash()."
+    return zlib.crc32(task_id.encode("utf-8")) % shards
+
+
+def shard_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"shard-{index:03d}.json")
+
+
+def read_manifest(directory: str) -> Optional[int]:
+    "Shard count recorded in `directory`, or None if it holds no sharded data set."
+    try:
+        with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+            return int(json.load(f)["shards"])
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(directory: str, shards: int) -> None:
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"shards": shards, "hash": "crc32"}, f)
+
+
+@instrument_backend
+class ShardedJSONDataHandler(IDataHandler):
+    """JSON storage split over `shards` files in `directory`, routed by a crc32 of the task id.
+
+    Every shard is an independent JSONDataHandler with its own file, writer and lock, so
+    writes to different shards are flushed in parallel and each rewrite only covers its
+    shard. Point reads and writes touch exactly one shard; listings query every shard
+    concurrently and merge their (already ordered) results. `make_shard` builds the
+    handler for a shard file, e.g. to enable journaling or shared mode.
+
+    Listings without a sort come back in created_at order: there is no document order
+    across shards. The shard count of an existing directory can only be changed offline
+    (see `reshard`).
+    """
+
+    def __init__(self, directory: str, shards: int = 4,
+                 make_shard: Optional[Callable[[str], JSONDataHandler]] = None):
+        os.makedirs(directory, exist_ok=True)
+        existing = read_manifest(directory)
+        if existing is None:
+            write_manifest(directory, shards)
+        elif existing != shards:
+            raise ValueError(f"{directory} holds {existing} shards, not {shards}; "
+                             f"re-shard it offline with `python sharded_handler.py`")
+        self.directory = directory
+        make_shard = make_shard or JSONDataHandler
+        self.shards: List[JSONDataHandler] = [make_shard(shard_path(directory, i)) for i in range(shards)]
+
+    def _shard(self, task_id: str) -> JSONDataHandler:
+        return self.shards[shard_of(task_id, len(self.shards))]
+
+    def _partition(self, task_ids: List[str]) -> Dict[int, List[int]]:
+        "Positions of `task_ids` grouped by shard index."
+        groups: Dict[int, List[int]] = {}
+        for pos, task_id in enumerate(task_ids):
+            groups.setdefault(shard_of(task_id, len(self.shards)), []).append(pos)
+        return groups
+
+    async def _scatter(self, task_ids: List[str], call: Callable[[JSONDataHandler, List[str]], Any]) -> List[Any]:
+        "Run `call` on every shard with its share of `task_ids`; results come back in input order."
+        groups = self._partition(task_ids)
+        results: List[Any] = [None] * len(task_ids)
+        parts = await asyncio.gather(*(call(self.shards[i], [task_ids[p] for p in positions])
+                                       for i, positions in groups.items()))
+        for positions, part in zip(groups.values(), parts):
+            for pos, result in zip(positions, part):
+                results[pos] = result
+        return results
+
+    async def startup(self) -> None:
+        await asyncio.gather(*(s.startup() for s in self.shards))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(s.close() for s in self.shards))
+
+    async def create_task(self, payload: TaskCreate) -> Task:
+        # the id decides the shard, so the task is built here rather than by the shard
+        task = Task(**payload.model_dump(), created_at=utc_now_iso())
+        await self._shard(task.id).apply([{"op": "create", "task": task.model_dump()}])
+        return task
+
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]:
+        tasks = [Task(**p.model_dump(), created_at=utc_now_iso()) for p in payloads]
+        by_id = {t.id: t for t in tasks}
+
+        async def create(shard: JSONDataHandler, ids: List[str]) -> List[None]:
+            await shard.apply([{"op": "create", "task": by_id[i].model_dump()} for i in ids])
+            return [None] * len(ids)
+        await self._scatter([t.id for t in tasks], create)
+        return tasks
+
+    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> List[Task]:
+        rows = await self.list_task_rows(is_completed=is_completed, q=q, sort=sort,
+                                         created_after=created_after, created_before=created_before)
+        return [Task(**t) for t in rows]
+
+    async def list_task_rows(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                             sort: Optional[str] = None, created_after: Optional[str] = None,
+                             created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        sort = sort or "created_at"
+        parts = await asyncio.gather(*(
+            s.list_task_rows(is_completed=is_completed, q=q, sort=sort,
+                             created_after=created_after, created_before=created_before)
+            for s in self.shards))
+        return _merge_rows(parts, sort)
+
+    async def list_tasks_page(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None, limit: int = 100,
+                              cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                              sort: Optional[str] = None, created_after: Optional[str] = None,
+                              created_before: Optional[str] = None) -> TaskPage:
+        _parse_page_args(cursor, fields, sort)
+        # the cursor is a (sort key, id) position, which means the same thing in every shard
+        pages = await asyncio.gather(*(
+            s.list_tasks_page(is_completed=is_completed, q=q, limit=limit, cursor=cursor, sort=sort,
+                              created_after=created_after, created_before=created_before)
+            for s in self.shards))
+        rows = _merge_rows([p.items for p in pages], sort)
+        more = len(rows) > limit or any(p.next_cursor for p in pages)
+        rows = rows[:limit]
+        next_cursor = _next_cursor(rows[-1], sort) if more and rows else None
+        return TaskPage(items=[_project(t, fields) for t in rows], next_cursor=next_cursor)
+
+    async def iter_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        streams = [s.iter_tasks(is_completed=is_completed, q=q, sort=sort or "created_at",
+                                created_after=created_after, created_before=created_before)
+                   for s in self.shards]
+        async for row in _merge_streams(streams, sort):
+            yield row
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        return await self._shard(task_id).get_task(task_id)
+
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]:
+        # every shard's counter only grows, so their sum changes with every write to any shard
+        versions = await asyncio.gather(*(s.get_version() for s in self.shards))
+        modified = [m for _, m in versions if m]
+        return sum(v for v, _ in versions), max(modified) if modified else None
+
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]:
+        return await self._shard(task_id).get_task_with_version(task_id)
+
+    async def get_stats(self, by_day: bool = False) -> TaskStats:
+        return _sum_stats(await asyncio.gather(*(s.get_stats(by_day) for s in self.shards)), by_day)
+
+    async def mark_completed(self, task_id: str) -> Task:
+        return await self._shard(task_id).mark_completed(task_id)
+
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]:
+        return await self._scatter(task_ids, lambda shard, ids: shard.mark_completed_many(ids))
+
+    async def delete_task(self, task_id: str) -> bool:
+        return await self._shard(task_id).delete_task(task_id)
+
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]:
+        return await self._scatter(task_ids, lambda shard, ids: shard.delete_tasks(ids))
+
+    def shard_stats(self) -> Dict[str, Any]:
+        "Shard count and the number of tasks each shard holds in memory."
+        return {"shards": len(self.shards), "tasks": [len(s._store.tasks) for s in self.shards]}
+
+
+# ---------------- Re-sharding ----------------
+def _read_documents(src: str) -> List[Dict[str, Any]]:
+    "Snapshot documents of a single data file or of every shard of a sharded directory, journals included."
+    paths = [src]
+    if not os.path.exists(src):
+        raise FileNotFoundError(src)
+    if os.path.isdir(src):
+        shards = read_manifest(src)
+        if shards is None:
+            raise ValueError(f"{src} is not a sharded data set (no {MANIFEST})")
+        paths = [shard_path(src, i) for i in range(shards)]
+    # journal=True replays a pending <file>.log, if any, so nothing only in the journal is lost
+    return [JSONDataHandler(p, journal=True)._store.document() for p in paths]
+
+
+def reshard(src: str, dst: str, shards: int, snapshot_format: str = "json") -> List[int]:
+    """Copy the tasks of `src` (a data file or a sharded directory) into `shards` new shards
+    in `dst`; returns the number of tasks per shard. Run it with the service stopped.
+
+    Every new shard starts at the sum of the source versions, so versions and ETags issued
+    before the move never reappear for different content afterwards.
+    """
+    if os.path.exists(dst) and os.listdir(dst):
+        raise ValueError(f"{dst} is not empty")
+    documents = _read_documents(src)
+    version = sum(d.get("version", 0) for d in documents)
+    buckets: List[List[Dict[str, Any]]] = [[] for _ in range(shards)]
+    for doc in documents:
+        for task in doc["tasks"]:
+            buckets[shard_of(task["id"], shards)].append(task)
+    os.makedirs(dst, exist_ok=True)
+    for i, tasks in enumerate(buckets):
+        tasks.sort(key=lambda t: (t["created_at"], t["id"]))
+        JSONDataHandler(shard_path(dst, i), snapshot_format=snapshot_format)._write_snapshot(
+            {"tasks": tasks, "version": version})
+    # written last: a directory without a manifest is recognisably incomplete
+    write_manifest(dst, shards)
+    return [len(b) for b in buckets]
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("src", help="data file or sharded directory to read")
+    parser.add_argument("dst", help="new, empty directory for the shards")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--format", choices=("json", "binary"), default="json", help="snapshot format of the shards")
+    args = parser.parse_args(argv)
+    counts = reshard(args.src, args.dst, args.shards, args.format)
+    print(f"wrote {sum(counts)} tasks to {args.shards} shards in {args.dst} (min {min(counts)}, max {max(counts)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Request coalescing: concurrent identical reads share one in-flight backend call.
+"""
+from __future__ import annotations
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from data_handler import IDataHandler
+from models import Task, TaskCreate, TaskPage, TaskStats
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs await the same result.
+
+    The call runs as its own task, so a caller that is cancelled (e.g. its client
+    disconnected) neither cancels it nor fails the other callers.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = asyncio.ensure_future(fn())
+            call.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is call else None)
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(call)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "calls": self.calls, "coalesced": self.coalesced}
+
+
+class CoalescingDataHandler(IDataHandler):
+    """Coalesces concurrent identical get_task and listing calls to `inner`.
+
+    Each write through this wrapper starts a new generation, and only calls from
+    the same generation are shared, so a read issued after a write never receives
+    the result of a read that started before it.
+    """
+
+    def __init__(self, inner: IDataHandler):
+        self.inner = inner
+        self.flight = SingleFlight()
+        self._generation = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    def _shared(self, key: Tuple[Any, ...], fn: Callable[[], Awaitable[Any]]) -> Awaitable[Any]:
+        return self.flight.do((self._generation,) + key, fn)
+
+    async def _write(self, call: Awaitable[Any]) -> Any:
+        self._generation += 1
+        try:
+            return await call
+        finally:
+            # reads issued while the write was in flight may predate it too
+            self._generation += 1
+
+    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> List[Task]:
+        return await self._shared(
+            ("list", is_completed, q, sort, created_after, created_before),
+            lambda: self.inner.list_tasks(is_completed=is_completed, q=q, sort=sort,
+                                          created_after=created_after, created_before=created_before),
+        )
+
+    async def list_task_rows(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                             sort: Optional[str] = None, created_after: Optional[str] = None,
+                             created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self._shared(
+            ("rows", is_completed, q, sort, created_after, created_before),
+            lambda: self.inner.list_task_rows(is_completed=is_completed, q=q, sort=sort,
+                                              created_after=created_after, created_before=created_before),
+        )
+
+    async def list_tasks_page(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None, limit: int = 100,
+                              cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                              sort: Optional[str] = None, created_after: Optional[str] = None,
+                              created_before: Optional[str] = None) -> TaskPage:
+        return await self._shared(
+            ("page", is_completed, q, limit, cursor, tuple(fields) if fields else None,
+             sort, created_after, created_before),
+            lambda: self.inner.list_tasks_page(is_completed=is_completed, q=q, limit=limit, cursor=cursor,
+                                               fields=fields, sort=sort, created_after=created_after,
+                                               created_before=created_before),
+        )
+
+    def iter_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                   sort: Optional[str] = None, created_after: Optional[str] = None,
+                   created_before: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # a stream is consumed at its reader's pace, so it cannot be shared
+        return self.inner.iter_tasks(is_completed=is_completed, q=q, sort=sort,
+                                     created_after=created_after, created_before=created_before)
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        return await self._shared(("get", task_id), lambda: self.inner.get_task(task_id))
+
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]:
+        return await self.inner.get_version()
+
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]:
+        return await self._shared(("get_version", task_id), lambda: self.inner.get_task_with_version(task_id))
+
+    async def get_stats(self, by_day: bool = False) -> TaskStats:
+        return await self._shared(("stats", by_day), lambda: self.inner.get_stats(by_day))
+
+    async def create_task(self, payload: TaskCreate) -> Task:
+        return await self._write(self.inner.create_task(payload))
+
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]:
+        return await self._write(self.inner.create_tasks(payloads))
+
+    async def mark_completed(self, task_id: str) -> Task:
+        return await self._write(self.inner.mark_completed(task_id))
+
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]:
+        return await self._write(self.inner.mark_completed_many(task_ids))
+
+    async def delete_task(self, task_id: str) -> bool:
+        return await self._write(self.inner.delete_task(task_id))
+
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]:
+        return await self._write(self.inner.delete_tasks(task_ids))
+
+    async def startup(self) -> None:
+        await self.inner.startup()
+
+    async def close(self) -> None:
+        await self.inner.close()
@@ -0,0 +1,356 @@
+"""
+SQLite storage backend: indexed, transactional single-node storage without an external service.
+"""
+from __future__ import annotations
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from data_handler import (IDataHandler, STREAM_YIELD_EVERY, TASK_FIELDS, _next_cursor, _parse_page_args, _sort_spec,
+                          _task_stats)
+from metrics import instrument_backend
+from models import Task, TaskCreate, TaskPage, TaskStats
+from utils import utc_now_iso, get_logger
+
+logger = get_logger("sqlite_handler")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    is_completed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    completed_at TEXT
+);
+-- one row: the change counter every write advances, and the time of the last write
+CREATE TABLE IF NOT EXISTS state (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL,
+    modified_at TEXT
+);
+INSERT OR IGNORE INTO state (id, version) VALUES (0, 0);
+CREATE INDEX IF NOT EXISTS tasks_status_created_at ON tasks (is_completed, created_at, id);
+CREATE INDEX IF NOT EXISTS tasks_created_at ON tasks (created_at, id);
+CREATE INDEX IF NOT EXISTS tasks_title ON tasks (title, id);
+"""
+
+# external-content FTS5 table kept in step by triggers; the trigram tokenizer
+# answers case-insensitive substring queries, matching the other backends' `q`
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+    title, description, content='tasks', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+    INSERT INTO tasks_fts (rowid, title, description) VALUES (new.rowid, new.title, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+    INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+    VALUES ('delete', old.rowid, old.title, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+    INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+    VALUES ('delete', old.rowid, old.title, old.description);
+    INSERT INTO tasks_fts (rowid, title, description) VALUES (new.rowid, new.title, new.description);
+END;
+"""
+
+# per created_at day counts kept current by triggers, so stats never scan the tasks
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_days (
+    day TEXT PRIMARY KEY,
+    created INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TRIGGER IF NOT EXISTS task_days_insert AFTER INSERT ON tasks BEGIN
+    INSERT OR IGNORE INTO task_days (day) VALUES (substr(new.created_at, 1, 10));
+    UPDATE task_days SET created = created + 1, completed = completed + new.is_completed
+    WHERE day = substr(new.created_at, 1, 10);
+END;
+CREATE TRIGGER IF NOT EXISTS task_days_delete AFTER DELETE ON tasks BEGIN
+    UPDATE task_days SET created = created - 1, completed = completed - old.is_completed
+    WHERE day = substr(old.created_at, 1, 10);
+END;
+CREATE TRIGGER IF NOT EXISTS task_days_complete AFTER UPDATE OF is_completed ON tasks BEGIN
+    UPDATE task_days SET completed = completed + new.is_completed - old.is_completed
+    WHERE day = substr(old.created_at, 1, 10);
+END;
+"""
+
+COLUMNS = ", ".join(TASK_FIELDS)
+# ids per statement in bulk operations, well under SQLITE_MAX_VARIABLE_NUMBER
+CHUNK = 500
+
+
+def _row(cursor: sqlite3.Cursor, values: Tuple[Any, ...]) -> Dict[str, Any]:
+    row = {col[0]: v for col, v in zip(cursor.description, values)}
+    if "is_completed" in row:
+        row["is_completed"] = bool(row["is_completed"])
+    return row
+
+
+def _like_pattern(q: str) -> str:
+    return "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _changed(conn: sqlite3.Connection) -> int:
+    "Advance the change counter inside the caller's transaction; returns the new version."
+    return conn.execute("UPDATE state SET version = version + 1, modified_at = ? WHERE id = 0 RETURNING version",
+                        (utc_now_iso(),)).fetchall()[0]["version"]
+
+
+def _order_by(sort: Optional[str]) -> str:
+    field, descending = _sort_spec(sort)
+    direction = " DESC" if descending else ""
+    return f" ORDER BY {field}{direction}, id{direction}"
+
+
+@instrument_backend
+class SQLiteDataHandler(IDataHandler):
+    """SQLite storage in WAL mode.
+
+    Writes go through one dedicated thread and connection, so they are serialized
+    and each call is one transaction; reads run on a small pool of threads with a
+    connection each, which WAL lets proceed while a write is in progress.
+    `q` uses the FTS5 trigram index for queries of three or more characters and
+    falls back to LIKE for shorter ones (or when SQLite lacks the tokenizer).
+    A write that changes rows advances the version in `state` in the same
+    transaction and stamps the changed rows with it.
+    """
+
+    def __init__(self, path: str = "tasks.db", readers: int = 4):
+        self.path = path
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="sqlite-reader")
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        conn = self._connect()
+        with conn:
+            conn.executescript(SCHEMA)
+            columns = {c["name"] for c in conn.execute("PRAGMA table_info(tasks)")}
+            if "version" not in columns:
+                # databases created before tasks carried a version
+                conn.execute("ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if "completed_at" not in columns:
+                conn.execute("ALTER TABLE tasks ADD COLUMN completed_at TEXT")
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'task_days'").fetchone():
+                # databases created before the per-day counters: count what is already there, in the
+                # same transaction as the triggers; OR IGNORE keeps a concurrent second run harmless
+                conn.executescript("BEGIN IMMEDIATE;" + STATS_SCHEMA + """
+                    INSERT OR IGNORE INTO task_days
+                    SELECT substr(created_at, 1, 10), count(*), sum(is_completed) FROM tasks GROUP BY 1;
+                    COMMIT;""")
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError as e:
+                logger.warning("SQLite full-text search unavailable (%s); q falls back to LIKE", e)
+                self.fts = False
+
+    def _connect(self) -> sqlite3.Connection:
+        "The calling thread's connection, opened on first use."
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            conn.row_factory = _row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # a call returns only once its transaction is on disk, like the JSON backend
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    async def _read(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._readers, lambda: fn(self._connect()))
+
+    async def _write(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        "Run `fn` in one transaction on the writer thread."
+        def run():
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return await asyncio.get_running_loop().run_in_executor(self._writer, run)
+
+    def _where(self, is_completed: Optional[bool], q: Optional[str], created_after: Optional[str] = None,
+               created_before: Optional[str] = None) -> Tuple[str, List[Any]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if is_completed is not None:
+            clauses.append("is_completed = ?")
+            params.append(int(is_completed))
+        if created_after:
+            clauses.append("created_at > ?")
+            params.append(created_after)
+        if created_before:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+        if q:
+            if self.fts and len(q) >= 3:
+                clauses.append("rowid IN (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?)")
+                params.append('"' + q.replace('"', '""') + '"')
+            else:
+                clauses.append("(title LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\')")
+                params += [_like_pattern(q)] * 2
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _select_page(self, conn: sqlite3.Connection, is_completed: Optional[bool], q: Optional[str],
+                     after: Optional[Tuple[str, str]], limit: int, columns: str = COLUMNS,
+                     sort: Optional[str] = None, created_after: Optional[str] = None,
+                     created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        where, params = self._where(is_completed, q, created_after, created_before)
+        if after:
+            field, descending = _sort_spec(sort)
+            op = "<" if descending else ">"
+            where += (" AND " if where else " WHERE ") + f"({field}, id) {op} (?, ?)"
+            params += list(after)
+        sql = f"SELECT {columns} FROM tasks{where}{_order_by(sort)} LIMIT ?"
+        return conn.execute(sql, params + [limit]).fetchall()
+
+    async def startup(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    async def create_task(self, payload: TaskCreate) -> Task:
+        return (await self.create_tasks([payload]))[0]
+
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]:
+        tasks = [Task(**p.model_dump(), created_at=utc_now_iso()) for p in payloads]
+        if not tasks:
+            return []
+        rows = [tuple(getattr(t, f) for f in TASK_FIELDS) for t in tasks]
+        marks = ", ".join("?" * len(TASK_FIELDS))
+
+        def run(conn: sqlite3.Connection) -> None:
+            version = _changed(conn)
+            conn.executemany(f"INSERT INTO tasks ({COLUMNS}, version) VALUES ({marks}, ?)",
+                             [row + (version,) for row in rows])
+        await self._write(run)
+        return tasks
+
+    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> List[Task]:
+        return [Task(**r) for r in await self.list_task_rows(
+            is_completed=is_completed, q=q, sort=sort, created_after=created_after, created_before=created_before)]
+
+    async def list_task_rows(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                             sort: Optional[str] = None, created_after: Optional[str] = None,
+                             created_before: Optional[str] = None) -> List[Dict[str, Any]]:
+        where, params = self._where(is_completed, q, created_after, created_before)
+        sql = f"SELECT {COLUMNS} FROM tasks{where}{_order_by(sort)}"
+        return await self._read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def list_tasks_page(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None, limit: int = 100,
+                              cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                              sort: Optional[str] = None, created_after: Optional[str] = None,
+                              created_before: Optional[str] = None) -> TaskPage:
+        after = _parse_page_args(cursor, fields, sort)
+        field, _ = _sort_spec(sort)
+        # the sort key is always fetched so the next cursor can be built
+        columns = ", ".join(dict.fromkeys(list(fields or TASK_FIELDS) + [field, "id"]))
+        rows = await self._read(lambda conn: self._select_page(
+            conn, is_completed, q, after, limit + 1, columns, sort, created_after, created_before))
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = _next_cursor(rows[-1], sort) if more else None
+        if fields:
+            rows = [{f: r[f] for f in fields} for r in rows]
+        return TaskPage(items=rows, next_cursor=next_cursor)
+
+    async def iter_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # keyset batches, so no cursor is held open on a reader thread between pulls
+        field, _ = _sort_spec(sort)
+        after = None
+        while True:
+            rows = await self._read(lambda conn: self._select_page(
+                conn, is_completed, q, after, STREAM_YIELD_EVERY, COLUMNS, sort, created_after, created_before))
+            for row in rows:
+                yield row
+            if len(rows) < STREAM_YIELD_EVERY:
+                return
+            after = (rows[-1][field], rows[-1]["id"])
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        row = await self._read(lambda conn: conn.execute(
+            f"SELECT {COLUMNS} FROM tasks WHERE id = ?", (task_id,)).fetchone())
+        return Task(**row) if row else None
+
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]:
+        row = await self._read(lambda conn: conn.execute("SELECT version, modified_at FROM state WHERE id = 0").fetchone())
+        return row["version"], row["modified_at"]
+
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]:
+        row = await self._read(lambda conn: conn.execute(
+            f"SELECT {COLUMNS}, version FROM tasks WHERE id = ?", (task_id,)).fetchone())
+        if not row:
+            return None
+        version = row.pop("version")
+        return Task(**row), version
+
+    async def get_stats(self, by_day: bool = False) -> TaskStats:
+        rows = await self._read(lambda conn: conn.execute(
+            "SELECT day, created, completed FROM task_days WHERE created > 0").fetchall())
+        days = {r["day"]: (r["created"], r["completed"]) for r in rows}
+        return _task_stats(sum(c for c, _ in days.values()), sum(k for _, k in days.values()),
+                           days if by_day else None)
+
+    async def mark_completed(self, task_id: str) -> Task:
+        task = (await self.mark_completed_many([task_id]))[0]
+        if task is None:
+            raise KeyError("Task not found")
+        return task
+
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]:
+        def run(conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+            found: Dict[str, Dict[str, Any]] = {}
+            changed = 0
+            now = utc_now_iso()
+            unique = list(dict.fromkeys(task_ids))
+            for i in range(0, len(unique), CHUNK):
+                chunk = unique[i:i + CHUNK]
+                marks = ", ".join("?" * len(chunk))
+                # stamped with the version _changed() moves to below
+                changed += conn.execute(
+                    f"UPDATE tasks SET is_completed = 1, completed_at = ?, "
+                    f"version = (SELECT version + 1 FROM state WHERE id = 0) "
+                    f"WHERE id IN ({marks}) AND is_completed = 0", [now] + chunk).rowcount
+                for row in conn.execute(f"SELECT {COLUMNS} FROM tasks WHERE id IN ({marks})", chunk):
+                    found[row["id"]] = row
+            if changed:
+                _changed(conn)
+            return found
+        found = await self._write(run)
+        return [Task(**found[i]) if i in found else None for i in task_ids]
+
+    async def delete_task(self, task_id: str) -> bool:
+        return (await self.delete_tasks([task_id]))[0]
+
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]:
+        def run(conn: sqlite3.Connection) -> List[bool]:
+            # one statement per id: its rowcount tells whether that id existed, and a
+            # repeated id is only deleted once
+            deleted = [conn.execute("DELETE FROM tasks WHERE id = ?", (i,)).rowcount > 0 for i in task_ids]
+            if any(deleted):
+                _changed(conn)
+            return deleted
+        return await self._write(run)
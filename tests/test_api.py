@@ -1,3 +1,4 @@
+import asyncio
 import os
 import json
 import pytest
@@ -49,4 +50,184 @@ async def test_create_and_list_tasks(tmp_path, monkeypatch):
 
         # delete again -> 404
         res = await ac.delete(f"/tasks/{task_id}")
-        assert res.status_code == 404
\ No newline at end of file
+        assert res.status_code == 404
+
+@pytest.mark.asyncio
+async def test_list_tasks_cursor_pagination_and_fields():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        ids = []
+        for i in range(3):
+            res = await ac.post("/tasks", json={"title": f"paged {i}"})
+            ids.append(res.json()["id"])
+
+        seen = []
+        params = {"q": "paged", "limit": 2, "fields": "id,title"}
+        while True:
+            res = await ac.get("/tasks", params=params)
+            assert res.status_code == 200
+            page = res.json()
+            assert all(set(t) == {"id", "title"} for t in page)
+            seen += [t["id"] for t in page]
+            if "x-next-cursor" not in res.headers:
+                break
+            params["cursor"] = res.headers["x-next-cursor"]
+        assert seen == ids
+
+        res = await ac.get("/tasks", params={"fields": "nope"})
+        assert res.status_code == 400
+        res = await ac.get("/tasks", params={"cursor": "garbage"})
+        assert res.status_code == 400
+        res = await ac.get("/tasks", params={"sort": "nope"})
+        assert res.status_code == 422
+
+        # newest first, paged; the cursor is bound to the sort it was issued for
+        res = await ac.get("/tasks", params={"q": "paged", "sort": "-created_at", "limit": 2})
+        assert [t["id"] for t in res.json()] == ids[:0:-1]
+        res = await ac.get("/tasks", params={"limit": 2, "cursor": res.headers["x-next-cursor"]})
+        assert res.status_code == 400
+        res = await ac.get("/tasks", params={"q": "paged", "created_after": "2000-01-01T00:00:00+02:00",
+                                             "created_before": "2999-01-01"})
+        assert [t["id"] for t in res.json()] == ids
+
+        for task_id in ids:
+            await ac.delete(f"/tasks/{task_id}")
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_complete_delete():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        res = await ac.post("/tasks/bulk", json=[{"title": "bulk a"}, {"title": "bulk b"}])
+        assert res.status_code == status.HTTP_201_CREATED
+        results = res.json()
+        assert all(r["ok"] for r in results)
+        ids = [r["id"] for r in results]
+
+        res = await ac.put("/tasks/bulk/complete", json={"ids": [ids[0], "missing"]})
+        assert res.status_code == 200
+        assert [(r["id"], r["ok"]) for r in res.json()] == [(ids[0], True), ("missing", False)]
+        assert res.json()[0]["task"]["is_completed"] is True
+
+        res = await ac.request("DELETE", "/tasks/bulk", json={"ids": ids + ["missing"]})
+        assert res.status_code == 200
+        assert [r["ok"] for r in res.json()] == [True, True, False]
+        res = await ac.get("/tasks", params={"q": "bulk"})
+        assert res.json() == []
+
+
+@pytest.mark.asyncio
+async def test_list_tasks_ndjson_stream():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        res = await ac.post("/tasks", json={"title": "streamed"})
+        task_id = res.json()["id"]
+
+        for kwargs in ({"params": {"q": "streamed", "stream": "true"}},
+                       {"params": {"q": "streamed"}, "headers": {"Accept": "application/x-ndjson"}}):
+            res = await ac.get("/tasks", **kwargs)
+            assert res.status_code == 200
+            assert res.headers["content-type"].startswith("application/x-ndjson")
+            rows = [json.loads(line) for line in res.text.splitlines()]
+            assert [r["id"] for r in rows] == [task_id]
+
+        await ac.delete(f"/tasks/{task_id}")
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_routes_and_backend_calls():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await ac.get("/tasks")
+        await ac.delete("/tasks/does-not-exist")
+        res = await ac.get("/metrics")
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("text/plain")
+        body = res.text
+        assert 'task_api_request_duration_seconds_count{method="GET",route="/tasks"}' in body
+        assert 'task_api_requests_total{method="DELETE",route="/tasks/{task_id}",status="404"}' in body
+        assert 'task_backend_call_duration_seconds_count{backend="JSONDataHandler",method="list_task_rows"}' in body
+        assert "# TYPE task_backend_calls_in_flight gauge" in body
+
+
+@pytest.mark.asyncio
+async def test_conditional_get_with_etags():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        res = await ac.get("/tasks")
+        etag = res.headers["etag"]
+        assert "last-modified" in res.headers
+        res = await ac.get("/tasks", headers={"If-None-Match": etag})
+        assert res.status_code == 304 and res.content == b""
+
+        task_id = (await ac.post("/tasks", json={"title": "etag me"})).json()["id"]
+        res = await ac.get("/tasks", headers={"If-None-Match": etag})
+        assert res.status_code == 200 and res.headers["etag"] != etag
+        assert "last-modified" in res.headers
+
+        res = await ac.get(f"/tasks/{task_id}")
+        assert res.status_code == 200 and res.json()["title"] == "etag me"
+        task_etag = res.headers["etag"]
+        res = await ac.get(f"/tasks/{task_id}", headers={"If-None-Match": f'W/{task_etag}, "other"'})
+        assert res.status_code == 304
+        await ac.put(f"/tasks/{task_id}")
+        res = await ac.get(f"/tasks/{task_id}", headers={"If-None-Match": task_etag})
+        assert res.status_code == 200 and res.json()["is_completed"] is True
+
+        await ac.delete(f"/tasks/{task_id}")
+        assert (await ac.get(f"/tasks/{task_id}")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replays_the_first_create():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        headers = {"Idempotency-Key": "retry-me"}
+        first, second = await asyncio.gather(
+            ac.post("/tasks", json={"title": "once"}, headers=headers),
+            ac.post("/tasks", json={"title": "once"}, headers=headers),
+        )
+        assert first.status_code == second.status_code == 201
+        assert first.json() == second.json()
+        assert [first.headers.get("idempotent-replayed"), second.headers.get("idempotent-replayed")].count("true") == 1
+        third = await ac.post("/tasks", json={"title": "once"}, headers=headers)
+        assert third.json() == first.json() and third.headers["idempotent-replayed"] == "true"
+
+        res = await ac.post("/tasks", json={"title": "different"}, headers=headers)
+        assert res.status_code == 422
+        titles = [t["title"] for t in (await ac.get("/tasks", params={"q": "once"})).json()]
+        assert titles == ["once"]
+        await ac.delete(f"/tasks/{first.json()['id']}")
+
+
+@pytest.mark.asyncio
+async def test_stats_endpoint():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        before = (await ac.get("/tasks/stats")).json()
+        task_id = (await ac.post("/tasks", json={"title": "counted"})).json()["id"]
+        await ac.put(f"/tasks/{task_id}", json={"is_completed": True})
+        res = await ac.get("/tasks/stats", params={"by_day": "true"})
+        after = res.json()
+        assert after["total"] == before["total"] + 1 and after["completed"] == before["completed"] + 1
+        assert sum(d["created"] for d in after["by_day"].values()) == after["total"]
+        assert "by_day" not in before
+
+        res = await ac.get("/tasks/stats", headers={"If-None-Match": res.headers["etag"]})
+        assert res.status_code == 304
+        await ac.delete(f"/tasks/{task_id}")
+
+
+
+@pytest.mark.asyncio
+async def test_archived_tasks_are_listed_on_request(tmp_path, monkeypatch):
+    import sys
+    from data_handler import JSONDataHandler
+    from tiering import TieredDataHandler
+    tiered = TieredDataHandler(JSONDataHandler(str(tmp_path / "hot.json")),
+                               JSONDataHandler(str(tmp_path / "archive.json")), max_age=86400, interval=0)
+    monkeypatch.setattr(sys.modules["app"], "handler", tiered)
+    old = {"id": "old", "title": "done long ago", "description": None, "is_completed": True,
+           "created_at": "2025-01-01T00:00:00.000000Z", "completed_at": "2025-01-02T00:00:00.000000Z"}
+    await tiered.inner.apply([{"op": "put", "task": old}])
+    assert await tiered.archive_completed() == 1
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        assert (await ac.get("/tasks")).json() == []
+        assert (await ac.get("/tasks", params={"include_archived": "true"})).json() == [old]
+        assert (await ac.get("/tasks/old")).json()["completed_at"] == old["completed_at"]
+        assert (await ac.get("/health")).json()["archive"]["archived"] == 1
+    await tiered.close()
@@ -0,0 +1,59 @@
+import pytest
+
+from cache import CachedDataHandler, TTLCache
+from data_handler import JSONDataHandler
+from models import TaskCreate
+
+
+def test_ttl_cache_evicts_lru_and_expires():
+    now = [0.0]
+    cache = TTLCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2, "evictions": 1,
+                             "expirations": 1, "invalidations": 0}
+
+
+@pytest.mark.asyncio
+async def test_cached_handler_invalidates_on_own_writes(tmp_path):
+    handler = CachedDataHandler(JSONDataHandler(str(tmp_path / "data.json")), ttl=60)
+    task = await handler.create_task(TaskCreate(title="cached"))
+
+    assert [t.id for t in await handler.list_tasks(is_completed=False)] == [task.id]
+    assert await handler.list_tasks(is_completed=True) == []
+    await handler.list_tasks(is_completed=False)
+    assert handler.cache.hits == 1
+
+    await handler.mark_completed(task.id)
+    assert await handler.list_tasks(is_completed=False) == []
+    assert [t.id for t in await handler.list_tasks(is_completed=True)] == [task.id]
+    assert (await handler.get_task(task.id)).is_completed is True
+
+    other = await handler.create_task(TaskCreate(title="second"))
+    # the completed-only listing was untouched by the create and is still cached
+    hits = handler.cache.hits
+    assert [t.id for t in await handler.list_tasks(is_completed=True)] == [task.id]
+    assert handler.cache.hits == hits + 1
+    assert [t.id for t in await handler.list_tasks()] == [task.id, other.id]
+
+
+@pytest.mark.asyncio
+async def test_version_change_from_another_writer_drops_cached_entries(tmp_path):
+    data_file = str(tmp_path / "data.json")
+    handler = CachedDataHandler(JSONDataHandler(data_file, shared=True), ttl=60)
+    other = JSONDataHandler(data_file, shared=True)
+    task = await handler.create_task(TaskCreate(title="cached"))
+    version = await handler.get_version()
+    assert [t.id for t in await handler.list_tasks()] == [task.id]
+
+    # a write this wrapper did not see: the cached listing is stale until the version moves
+    await other.mark_completed(task.id)
+    assert (await handler.list_tasks())[0].is_completed is False
+    assert (await handler.get_version())[0] == version[0] + 1
+    assert (await handler.list_tasks())[0].is_completed is True
+    await other.close()
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import pytest
+from httpx import AsyncClient
+
+# Ensure JSON backend for tests
+os.environ["DATA_FILE"] = "test_data.json"
+
+import app as app_module  # noqa: E402
+from change_feed import ChangeBroker, ChangeFeedDataHandler  # noqa: E402
+from data_handler import JSONDataHandler  # noqa: E402
+from models import TaskCreate  # noqa: E402
+from tiering import TieredDataHandler  # noqa: E402
+
+
+def test_broker_resumes_from_history_and_drops_slow_subscribers():
+    broker = ChangeBroker(history=3, queue_size=2)
+    start = broker.seq
+    for i in range(3):
+        broker.publish("delete", f"t{i}")
+    assert [e["id"] for e in broker.since(start)] == ["t0", "t1", "t2"]
+    broker.publish("delete", "t3")
+    # t0 is no longer retained, so resuming from before it is a gap
+    assert broker.since(start) is None
+    assert broker.parse_token(broker.token(2)) == 2
+    assert broker.parse_token("other-2") is None
+
+    backlog, slow = broker.subscribe(broker.seq)
+    assert backlog == []
+    for i in range(3):
+        broker.publish("delete", f"late{i}")
+    assert slow.overflowed and broker.stats()["subscribers"] == 0
+    assert [e["id"] for e in slow.drain()] == ["late0", "late1"]
+
+
+@pytest.mark.asyncio
+async def test_wrapper_publishes_mutations_and_long_poll_waits(tmp_path):
+    handler = ChangeFeedDataHandler(JSONDataHandler(str(tmp_path / "data.json")))
+    broker = handler.broker
+    start = broker.seq
+
+    waiter = asyncio.create_task(broker.wait(start, timeout=5))
+    await asyncio.sleep(0)
+    task = await handler.create_task(TaskCreate(title="watched"))
+    assert [(e["op"], e["id"]) for e in await waiter] == [("create", task.id)]
+
+    await handler.mark_completed_many([task.id, task.id, "missing"])
+    # already completed: no change, so no event
+    await handler.mark_completed(task.id)
+    await handler.mark_completed_many([task.id])
+    assert await handler.delete_tasks([task.id, "missing"]) == [True, False]
+    events = broker.since(start)
+    assert [(e["op"], e["id"]) for e in events] == [("create", task.id), ("complete", task.id), ("delete", task.id)]
+    assert events[1]["task"]["is_completed"] is True
+    assert await broker.wait(broker.seq, timeout=0.01) == []
+
+
+@pytest.mark.asyncio
+async def test_completing_an_archived_task_publishes_nothing(tmp_path):
+    archived = {"id": "old", "title": "old", "description": None, "is_completed": True,
+                "created_at": "2025-01-01T00:00:00.000000Z", "completed_at": "2025-01-02T00:00:00.000000Z"}
+    archive = JSONDataHandler(str(tmp_path / "archive.json"))
+    await archive.apply([{"op": "put", "task": archived}])
+    handler = ChangeFeedDataHandler(TieredDataHandler(JSONDataHandler(str(tmp_path / "hot.json")), archive,
+                                                      interval=0))
+    start = handler.broker.seq
+
+    assert (await handler.mark_completed("old")).id == "old"
+    assert [t.id for t in await handler.mark_completed_many(["old"])] == ["old"]
+    assert handler.broker.since(start) == []
+    await handler.close()
+
+
+@pytest.mark.asyncio
+async def test_changes_endpoint_long_poll_and_sse():
+    async with AsyncClient(app=app_module.app, base_url="http://test") as ac:
+        token = (await ac.get("/tasks/changes", params={"timeout": 0})).json()["token"]
+        task_id = (await ac.post("/tasks", json={"title": "feed me"})).json()["id"]
+        body = (await ac.get("/tasks/changes", params={"after": token})).json()
+        assert body["reset"] is False
+        assert [(e["op"], e["id"]) for e in body["events"]] == [("create", task_id)]
+
+        res = await ac.get("/tasks/changes", params={"after": "bogus-1"})
+        assert res.json()["reset"] is True
+
+        await ac.delete(f"/tasks/{task_id}")
+
+    # the SSE stream replays from the token, then follows live events
+    broker = app_module.handler.broker
+    stream = app_module._sse(broker, broker.parse_token(token), reset=False)
+    messages = [await stream.__anext__() for _ in range(2)]
+    assert messages[0].startswith(b"id: ") and b"event: create\n" in messages[0]
+    assert b"event: delete\n" in messages[1]
+    await stream.aclose()
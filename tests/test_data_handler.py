@@ -0,0 +1,365 @@
+import asyncio
+import json
+import pytest
+
+import binary_snapshot
+from data_handler import JSONDataHandler
+from models import Task, TaskCreate
+
+
+@pytest.mark.asyncio
+async def test_json_handler_serves_from_memory_and_persists(tmp_path):
+    data_file = tmp_path / "data.json"
+    handler = JSONDataHandler(str(data_file))
+
+    first = await handler.create_task(TaskCreate(title="first"))
+    second = await handler.create_task(TaskCreate(title="second"))
+    await handler.mark_completed(first.id)
+
+    assert (await handler.get_task(first.id)).is_completed is True
+    assert [t.id for t in await handler.list_tasks(is_completed=False)] == [second.id]
+    assert [t.id for t in await handler.list_tasks()] == [first.id, second.id]
+
+    # writes go through to the file, and a fresh handler picks them up
+    on_disk = json.loads(data_file.read_text())
+    assert [t["id"] for t in on_disk["tasks"]] == [first.id, second.id]
+    reopened = JSONDataHandler(str(data_file))
+    assert (await reopened.get_task(first.id)).is_completed is True
+
+    assert await handler.delete_task(second.id) is True
+    assert await handler.delete_task(second.id) is False
+    with pytest.raises(KeyError):
+        await handler.mark_completed(second.id)
+
+
+@pytest.mark.asyncio
+async def test_json_journal_replay_and_compaction(tmp_path):
+    data_file = tmp_path / "data.json"
+    handler = JSONDataHandler(str(data_file), journal=True, compact_every=100)
+
+    first = await handler.create_task(TaskCreate(title="first"))
+    second = await handler.create_task(TaskCreate(title="second"))
+    await handler.mark_completed(first.id)
+    await handler.delete_task(second.id)
+
+    # one appended line per mutation; the snapshot itself is untouched
+    log_lines = (tmp_path / "data.json.log").read_text().splitlines()
+    assert [json.loads(line)["op"] for line in log_lines] == ["create", "create", "complete", "delete"]
+    assert json.loads(data_file.read_text()) == {"tasks": []}
+
+    # a torn trailing line is dropped on replay
+    with open(tmp_path / "data.json.log", "a") as f:
+        f.write('{"op": "dele')
+    reopened = JSONDataHandler(str(data_file), journal=True)
+    assert [t.id for t in await reopened.list_tasks()] == [first.id]
+    assert (await reopened.get_task(first.id)).is_completed is True
+    assert (tmp_path / "data.json.log").read_text().splitlines() == log_lines
+
+    await handler.compact()
+    assert not (tmp_path / "data.json.log.compacting").exists()
+    assert [t["id"] for t in json.loads(data_file.read_text())["tasks"]] == [first.id]
+    third = await handler.create_task(TaskCreate(title="third"))
+    reopened = JSONDataHandler(str(data_file), journal=True)
+    assert [t.id for t in await reopened.list_tasks()] == [first.id, third.id]
+
+
+@pytest.mark.asyncio
+async def test_journal_replay_matches_a_batch_that_creates_and_completes(tmp_path):
+    data_file = tmp_path / "data.json"
+    handler = JSONDataHandler(str(data_file), journal=True, batch_window=0.01)
+    task = Task(title="batched", created_at="2025-01-01T00:00:00.000000Z")
+    # one group commit: the create must be journaled as it was, not as the complete left the row
+    await asyncio.gather(handler.apply([{"op": "create", "task": task.model_dump()}]),
+                         handler.apply([{"op": "complete", "id": task.id, "at": "2025-01-02T00:00:00.000000Z"}]))
+    live = (await handler.get_version())[0], await handler.get_task(task.id)
+
+    # completing again changes nothing: no journal record, no new version
+    log_size = (tmp_path / "data.json.log").stat().st_size
+    await handler.mark_completed(task.id)
+    assert (tmp_path / "data.json.log").stat().st_size == log_size
+    assert (await handler.get_version())[0] == live[0]
+    await handler.close()
+
+    replayed = JSONDataHandler(str(data_file), journal=True)
+    assert ((await replayed.get_version())[0], await replayed.get_task(task.id)) == live == (2, live[1])
+    assert live[1].completed_at == "2025-01-02T00:00:00.000000Z"
+
+
+@pytest.mark.asyncio
+async def test_compaction_folds_a_copy_of_the_rows(tmp_path):
+    data_file = tmp_path / "data.json"
+    handler = JSONDataHandler(str(data_file), journal=True)
+    task = await handler.create_task(TaskCreate(title="first"))
+    write_snapshot = handler._write_snapshot
+
+    def write_during_a_commit(snapshot):
+        # a commit changing the row in place while the fold thread is still writing
+        handler._store.complete(task.id, "2025-01-01T00:00:00.000000Z")
+        write_snapshot(snapshot)
+    handler._write_snapshot = write_during_a_commit
+    await handler.compact()
+
+    assert json.loads(data_file.read_text())["tasks"][0]["is_completed"] is False
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_share_flushes_without_lost_updates(tmp_path):
+    data_file = tmp_path / "data.json"
+    handler = JSONDataHandler(str(data_file), journal=True)
+    flushes = []
+    append = handler._append
+    handler._append = lambda lines: (flushes.append(lines), append(lines))
+
+    created = await asyncio.gather(*(handler.create_task(TaskCreate(title=f"t{i}")) for i in range(50)))
+    await handler.close()
+
+    assert len(flushes) < 50
+    reopened = JSONDataHandler(str(data_file), journal=True)
+    assert {t.id for t in await reopened.list_tasks()} == {t.id for t in created}
+
+
+@pytest.mark.asyncio
+async def test_malformed_record_fails_alone_and_the_writer_keeps_going(tmp_path):
+    data_file = tmp_path / "data.json"
+    handler = JSONDataHandler(str(data_file), journal=True, batch_window=0.01)
+    first = await handler.create_task(TaskCreate(title="first"))
+
+    # queued into the same batch: only the item holding the bad record fails, and its
+    # half-applied create (no created_at) leaves nothing behind
+    good, bad = await asyncio.wait_for(asyncio.gather(
+        handler.create_task(TaskCreate(title="same batch")),
+        handler.apply([{"op": "complete", "id": first.id}, {"op": "create", "task": {"id": "x", "title": "x"}}]),
+        return_exceptions=True), 5)
+    assert isinstance(bad, KeyError)
+    assert not (await handler.get_task(first.id)).is_completed
+    assert await handler.get_task("x") is None
+    with pytest.raises(ValueError):
+        await handler.apply([{"op": "bogus"}])
+
+    later = await asyncio.wait_for(handler.create_task(TaskCreate(title="later")), 1)
+    await handler.close()
+    reopened = JSONDataHandler(str(data_file), journal=True)
+    assert [t.id for t in await reopened.list_tasks()] == [first.id, good.id, later.id]
+
+
+@pytest.mark.asyncio
+async def test_json_search_uses_trigram_index(tmp_path):
+    handler = JSONDataHandler(str(tmp_path / "data.json"))
+    a = await handler.create_task(TaskCreate(title="Write unit tests", description="pytest"))
+    b = await handler.create_task(TaskCreate(title="Deploy", description="Unit of work"))
+    c = await handler.create_task(TaskCreate(title="tinu"))
+
+    # the first search scans and starts building the index in the background
+    assert [t.id for t in await handler.list_tasks(q="UNIT")] == [a.id, b.id]
+    assert handler._store.text is None
+    # a write made while the index is built is caught up once it is installed
+    d = await handler.create_task(TaskCreate(title="reunite"))
+    await handler._indexing
+    assert handler._store.text.candidates("unit") == {a.id, b.id, d.id}
+    await handler.delete_task(d.id)
+    assert [t.id for t in await handler.list_tasks(q="UNIT")] == [a.id, b.id]
+    # short queries fall back to scanning
+    assert [t.id for t in await handler.list_tasks(q="u")] == [a.id, b.id, c.id]
+    # trigram hits that are not real substrings are filtered out
+    assert await handler.list_tasks(q="nit tinu") == []
+
+    await handler.delete_task(a.id)
+    await handler.mark_completed(b.id)
+    assert [t.id for t in await handler.list_tasks(q="unit", is_completed=True)] == [b.id]
+    page = await handler.list_tasks_page(q="unit", limit=1)
+    assert [t["id"] for t in page.items] == [b.id] and page.next_cursor is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("journal", [False, True])
+async def test_shared_handlers_see_each_others_writes(tmp_path, journal):
+    # two handlers on one file stand in for two worker processes: flock locks
+    # taken through separate descriptors exclude each other just the same
+    data_file = str(tmp_path / "data.json")
+    a = JSONDataHandler(data_file, journal=journal, shared=True, compact_every=40)
+    b = JSONDataHandler(data_file, journal=journal, shared=True, compact_every=40)
+
+    first = await a.create_task(TaskCreate(title="from a"))
+    assert (await b.get_task(first.id)).title == "from a"
+    await b.mark_completed(first.id)
+    assert (await a.get_task(first.id)).is_completed is True
+
+    # interleaved writers never clobber each other, across compactions too
+    created = await asyncio.gather(*(
+        (a if i % 2 else b).create_task(TaskCreate(title=f"t{i}")) for i in range(60)
+    ))
+    expected = {first.id} | {t.id for t in created}
+    assert {t.id for t in await a.list_tasks()} == expected
+    assert {t.id for t in await b.list_tasks()} == expected
+    await a.close()
+    await b.close()
+    reopened = JSONDataHandler(data_file, journal=journal)
+    assert {t.id for t in await reopened.list_tasks()} == expected
+
+
+@pytest.mark.asyncio
+async def test_shared_reader_replays_only_the_journal_tail(tmp_path):
+    data_file = str(tmp_path / "data.json")
+    writer = JSONDataHandler(data_file, journal=True, shared=True)
+    reader = JSONDataHandler(data_file, journal=True, shared=True)
+    await writer.create_task(TaskCreate(title="one"))
+    await reader.list_tasks()
+    reloads = []
+    reload = reader._reload
+    reader._reload = lambda: (reloads.append(1), reload())[1]
+
+    await writer.create_task(TaskCreate(title="two"))
+    assert [t.title for t in await reader.list_tasks()] == ["one", "two"]
+    assert reloads == []
+
+
+@pytest.mark.asyncio
+async def test_binary_snapshot_round_trip_and_lazy_rows(tmp_path):
+    data_file = str(tmp_path / "data.json")
+    handler = JSONDataHandler(data_file, snapshot_format="binary")
+    first = await handler.create_task(TaskCreate(title="first", description="ünïcode"))
+    second = await handler.create_task(TaskCreate(title="second"))
+    await handler.mark_completed(first.id)
+    assert binary_snapshot.is_binary(data_file)
+
+    # format is detected from the file; rows are decoded only once they are read
+    reopened = JSONDataHandler(data_file)
+    assert reopened.snapshot_format == "binary"
+    slots = reopened._store.tasks._slots
+    assert all(isinstance(v, int) for v in slots.values())
+    assert [t.id for t in await reopened.list_tasks(is_completed=False)] == [second.id]
+    assert isinstance(slots[first.id], int) and isinstance(slots[second.id], dict)
+    completed = await handler.get_task(first.id)
+    assert completed.completed_at is not None
+    assert (await reopened.get_task(first.id)) == completed
+    assert [t.id for t in await reopened.list_tasks(q="NÏC")] == [first.id]
+    assert (await reopened.get_version())[0] == 3
+
+    binary_snapshot.main(["to-json", data_file, str(tmp_path / "copy.json")])
+    copy = json.loads((tmp_path / "copy.json").read_text())
+    assert [(t["id"], t["description"], t["is_completed"]) for t in copy["tasks"]] == [
+        (first.id, "ünïcode", True), (second.id, None, False)]
+    assert copy["version"] == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("journal", [False, True])
+async def test_versions_advance_on_changes_and_survive_reloads(tmp_path, journal):
+    data_file = str(tmp_path / "data.json")
+    handler = JSONDataHandler(data_file, journal=journal)
+    assert (await handler.get_version())[0] == 0
+    first = await handler.create_task(TaskCreate(title="first"))
+    second = await handler.create_task(TaskCreate(title="second"))
+    version, modified_at = await handler.get_version()
+    assert version == 2 and modified_at is not None
+    assert (await handler.get_task_with_version(first.id))[1] == 1
+
+    await handler.mark_completed(first.id)
+    # completing it again and deleting an unknown id change nothing
+    await handler.mark_completed(first.id)
+    assert await handler.delete_task("missing") is False
+    assert (await handler.get_version())[0] == 3
+    assert (await handler.get_task_with_version(first.id))[1] == 3
+    assert (await handler.get_task_with_version(second.id))[1] == 2
+    await handler.close()
+
+    # the counter never goes back, so an old version can never be mistaken for the current state
+    reopened = JSONDataHandler(data_file, journal=journal)
+    assert (await reopened.get_version())[0] == 3
+    assert (await reopened.get_task_with_version(first.id))[1] <= 3
+    await reopened.delete_task(second.id)
+    assert (await reopened.get_version())[0] == 4
+    assert await reopened.get_task_with_version(second.id) is None
+
+
+@pytest.mark.asyncio
+async def test_sort_and_created_at_range_with_keyset_pages(tmp_path):
+    data_file = tmp_path / "data.json"
+    titles = ["delta", "alpha", "charlie", "bravo", "echo"]
+    tasks = [
+        {"title": t, "description": None, "id": f"id-{i}", "is_completed": i % 2 == 1,
+         "created_at": f"2025-01-0{i + 1}T00:00:00.000000Z"}
+        for i, t in enumerate(titles)
+    ]
+    data_file.write_text(json.dumps({"tasks": tasks}))
+    handler = JSONDataHandler(str(data_file))
+
+    rows = await handler.list_task_rows(sort="-created_at")
+    assert [r["id"] for r in rows] == ["id-4", "id-3", "id-2", "id-1", "id-0"]
+    rows = await handler.list_task_rows(created_after="2025-01-02T00:00:00.000000Z",
+                                        created_before="2025-01-05T00:00:00.000000Z")
+    assert [r["id"] for r in rows] == ["id-2", "id-3"]
+
+    # the title order is maintained through writes once built
+    assert [r["title"] for r in await handler.list_task_rows(sort="title")] == sorted(titles)
+    added = await handler.create_task(TaskCreate(title="aardvark"))
+    await handler.delete_task("id-1")
+    rows = await handler.list_task_rows(sort="title")
+    assert [r["title"] for r in rows] == ["aardvark", "bravo", "charlie", "delta", "echo"]
+
+    seen, cursor = [], None
+    while True:
+        page = await handler.list_tasks_page(limit=2, cursor=cursor, sort="-title", fields=["id"])
+        seen += [t["id"] for t in page.items]
+        if not (cursor := page.next_cursor):
+            break
+    assert seen == ["id-4", "id-0", "id-2", "id-3", added.id]
+    first = await handler.list_tasks_page(limit=1, sort="-title")
+    with pytest.raises(ValueError):
+        await handler.list_tasks_page(limit=1, cursor=first.next_cursor, sort="created_at")
+
+    # filters combine with the sort and range
+    rows = await handler.list_task_rows(is_completed=False, q="a", sort="-created_at",
+                                        created_before="2025-01-05T00:00:00.000000Z")
+    assert [r["id"] for r in rows] == ["id-2", "id-0"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ratio", [1, 1000])
+async def test_indexed_search_pages_agree_whether_candidates_are_sorted_or_walked(tmp_path, monkeypatch, ratio):
+    import data_handler
+    # ratio 1 walks the maintained order filtering on the candidates, 1000 sorts the candidates
+    monkeypatch.setattr(data_handler, "WALK_ORDER_RATIO", ratio)
+    handler = JSONDataHandler(str(tmp_path / "data.json"))
+    tasks = await handler.create_tasks([TaskCreate(title=f"{'unit' if i % 3 else 'other'} {i:02d}") for i in range(30)])
+    await handler.list_tasks(q="unit")
+    await handler._indexing
+    for sort, key in (("created_at", lambda t: (t.created_at, t.id)), ("-title", lambda t: (t.title, t.id))):
+        expected = [t.id for t in sorted(tasks, key=key, reverse=sort.startswith("-")) if t.title.startswith("unit")]
+        seen, cursor = [], None
+        while True:
+            page = await handler.list_tasks_page(q="unit", limit=4, cursor=cursor, sort=sort, fields=["id"])
+            seen += [t["id"] for t in page.items]
+            if not (cursor := page.next_cursor):
+                break
+        assert seen == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("snapshot_format", ["json", "binary"])
+async def test_stats_counters_follow_writes(tmp_path, snapshot_format):
+    data_file = str(tmp_path / "data.json")
+    tasks = [{"id": f"id-{i}", "title": f"t{i}", "description": None, "is_completed": i == 0,
+              "created_at": f"2025-01-0{1 + i // 2}T10:00:00.000Z"} for i in range(3)]
+    with open(data_file, "wb") as f:
+        if snapshot_format == "binary":
+            binary_snapshot.dump(tasks, f)
+        else:
+            f.write(json.dumps({"tasks": tasks}).encode())
+    handler = JSONDataHandler(data_file)
+
+    stats = await handler.get_stats()
+    assert (stats.total, stats.open, stats.completed, stats.by_day) == (3, 2, 1, None)
+    days = (await handler.get_stats(by_day=True)).by_day
+    assert {d: (c.created, c.completed) for d, c in days.items()} == {"2025-01-01": (2, 1), "2025-01-02": (1, 0)}
+
+    # once built, the per-day counters are maintained by the writes themselves
+    await handler.mark_completed("id-2")
+    await handler.mark_completed("id-2")
+    await handler.delete_tasks(["id-0", "id-1"])
+    new = await handler.create_task(TaskCreate(title="new"))
+    stats = await handler.get_stats(by_day=True)
+    assert (stats.total, stats.open, stats.completed) == (2, 1, 1)
+    assert {d: (c.created, c.completed) for d, c in stats.by_day.items()} == {
+        "2025-01-02": (1, 1), new.created_at[:10]: (1, 0)}
+    assert await JSONDataHandler(data_file).get_stats(by_day=True) == stats
@@ -0,0 +1,276 @@
+import json
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from data_handler import BackendUnavailable, CircuitBreaker, JSONDataHandler, MongoDataHandler, _change_event  # noqa: E402
+from models import TaskCreate  # noqa: E402
+
+
+@pytest.fixture
+def mongo_handler(tmp_path):
+    return MongoDataHandler(
+        "mongodb://test",
+        client=mongomock_motor.AsyncMongoMockClient(),
+        json_handler=JSONDataHandler(str(tmp_path / "mirror.json")),
+        text_search=False,
+    )
+
+
+@pytest.mark.asyncio
+async def test_mongo_handler_crud_and_mirror(mongo_handler, tmp_path):
+    first = await mongo_handler.create_task(TaskCreate(title="first"))
+    created = await mongo_handler.create_tasks([TaskCreate(title="second"), TaskCreate(title="third")])
+
+    page = await mongo_handler.list_tasks_page(limit=2, fields=["id"])
+    assert page.items == [{"id": first.id}, {"id": created[0].id}]
+    page = await mongo_handler.list_tasks_page(limit=2, cursor=page.next_cursor)
+    assert [t["id"] for t in page.items] == [created[1].id] and page.next_cursor is None
+
+    assert (await mongo_handler.get_version())[0] == 2
+    assert (await mongo_handler.mark_completed(first.id)).is_completed is True
+    assert (await mongo_handler.get_version())[0] == 3
+    task, version = await mongo_handler.get_task_with_version(first.id)
+    assert task.is_completed is True and version == 2
+    assert "version" not in (await mongo_handler.list_task_rows())[0]
+    assert [t.id for t in await mongo_handler.list_tasks(is_completed=True)] == [first.id]
+    assert await mongo_handler.delete_tasks([created[0].id, "missing"]) == [True, False]
+
+    await mongo_handler.mirror.flush()
+    mirrored = json.loads((tmp_path / "mirror.json").read_text())["tasks"]
+    assert [(t["id"], t["is_completed"]) for t in mirrored] == [(first.id, True), (created[1].id, False)]
+    assert mongo_handler.mirror.stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_mongo_sort_range_and_keyset_pages(mongo_handler):
+    created = await mongo_handler.create_tasks([TaskCreate(title=t) for t in ("bravo", "alpha", "charlie")])
+
+    rows = await mongo_handler.list_task_rows(sort="-created_at")
+    assert [r["id"] for r in rows] == [t.id for t in created[::-1]]
+    rows = await mongo_handler.list_task_rows(created_after=created[0].created_at)
+    assert [r["id"] for r in rows] == [t.id for t in created if t.created_at > created[0].created_at]
+
+    page = await mongo_handler.list_tasks_page(limit=2, sort="-title", fields=["title"])
+    assert page.items == [{"title": "charlie"}, {"title": "bravo"}]
+    page = await mongo_handler.list_tasks_page(limit=2, sort="-title", cursor=page.next_cursor)
+    assert [t["title"] for t in page.items] == ["alpha"] and page.next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_unpaginated_listing_is_not_truncated(mongo_handler):
+    await mongo_handler.collection.insert_many([
+        {"id": f"id-{i:05d}", "title": "t", "description": None, "is_completed": False,
+         "created_at": f"2025-01-01T00:00:00.{i:06d}Z"} for i in range(10005)])
+    rows = await mongo_handler.list_task_rows()
+    assert len(rows) == 10005 and rows[-1]["id"] == "id-10004"
+
+
+@pytest.mark.asyncio
+async def test_apply_puts_over_documents_with_object_ids(mongo_handler):
+    legacy = {"id": "legacy", "title": "old", "description": None, "is_completed": True,
+              "created_at": "2025-01-01T00:00:00.000000Z"}
+    # stored before _id was the task id: the driver assigns an ObjectId
+    await mongo_handler.collection.insert_one(dict(legacy))
+    await mongo_handler.apply([{"op": "put", "task": {**legacy, "title": "renamed"}},
+                               {"op": "put", "task": {**legacy, "id": "new", "is_completed": False}}])
+    assert (await mongo_handler.get_task("legacy")).title == "renamed"
+    assert (await mongo_handler.collection.find_one({"id": "new"}))["_id"] == "new"
+    await mongo_handler.mirror.flush()
+    assert (await mongo_handler.json_handler.get_task("legacy")).title == "renamed"
+
+
+@pytest.mark.asyncio
+async def test_failed_version_bump_does_not_fail_a_committed_write(mongo_handler):
+    await mongo_handler.create_task(TaskCreate(title="first"))
+    update_one = mongo_handler.meta.update_one
+
+    async def unavailable(*args, **kwargs):
+        raise RuntimeError("meta write failed")
+    mongo_handler.meta.update_one = unavailable
+    task = await mongo_handler.create_task(TaskCreate(title="second"))
+    await mongo_handler.mirror.flush()
+    assert await mongo_handler.json_handler.get_task(task.id) is not None
+    # no validators while the counter lags the data
+    assert await mongo_handler.get_version() is None
+
+    mongo_handler.meta.update_one = update_one
+    assert (await mongo_handler.get_version())[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_provisions_every_query_index(mongo_handler):
+    await mongo_handler.ensure_indexes()
+    keys = {name: info["key"] for name, info in (await mongo_handler.collection.index_information()).items()}
+    assert keys["task_id"] == [("id", 1)]
+    assert keys["status_created_at"] == [("is_completed", 1), ("created_at", 1)]
+    assert keys["created_at_id"] == [("created_at", 1), ("id", 1)]
+    assert keys["title_id"] == [("title", 1), ("id", 1)]
+    assert "task_text" not in keys  # text_search=False
+    assert (await mongo_handler.collection.index_information())["task_id"]["unique"] is True
+
+
+@pytest.mark.asyncio
+async def test_explain_queries_reports_stages_and_collection_scans(mongo_handler):
+    class Explained:
+        def __init__(self, plan):
+            self.plan = plan
+
+        async def explain(self):
+            if isinstance(self.plan, Exception):
+                raise self.plan
+            return {"queryPlanner": {"winningPlan": self.plan}}
+
+    mongo_handler._query_shapes = lambda: {
+        "indexed": Explained({"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}),
+        # newer servers wrap the plan in queryPlan (slot-based execution)
+        "scan": Explained({"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}),
+        "broken": Explained(RuntimeError("explain not supported")),
+    }
+    assert await mongo_handler.explain_queries() == {
+        "indexed": {"stages": ["FETCH", "IXSCAN"], "collscan": False},
+        "scan": {"stages": ["SORT", "COLLSCAN"], "collscan": True},
+        "broken": {"error": "explain not supported"},
+    }
+
+
+@pytest.mark.asyncio
+async def test_text_search_falls_back_to_a_substring_match_without_words(mongo_handler):
+    mongo_handler.text_search = mongo_handler._text_index_ready = True
+    assert await mongo_handler._search_clause('unit "tests"') == {"$text": {"$search": '"unit  tests"'}}
+    regex = await mongo_handler._search_clause('""')
+    assert regex["$or"][0] == {"title": {"$regex": '""', "$options": "i"}}
+    await mongo_handler.collection.insert_one({"id": "q", "title": 'say ""', "description": None,
+                                               "is_completed": False, "created_at": "2025-01-01T00:00:00Z"})
+    assert [r["id"] for r in await mongo_handler.list_task_rows(q='""')] == ["q"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_does_not_claim_a_concurrent_delete(mongo_handler):
+    tasks = await mongo_handler.create_tasks([TaskCreate(title=f"t{i}") for i in range(3)])
+    collection = mongo_handler.collection
+    raced = []
+
+    def racing(method):
+        original = getattr(collection, method)
+
+        async def call(*args, **kwargs):
+            if not raced:
+                # another request deletes the first task just as the bulk delete writes
+                raced.append(await original({"id": tasks[0].id}) if method != "delete_many"
+                             else await collection.delete_one({"id": tasks[0].id}))
+            return await original(*args, **kwargs)
+        setattr(collection, method, call)
+    racing("delete_one")
+    racing("delete_many")
+
+    assert await mongo_handler.delete_tasks([t.id for t in tasks] + [tasks[1].id]) == [False, True, True, False]
+    await mongo_handler.mirror.flush()
+    # only the bulk delete's own deletes are mirrored (the racing one bypassed this handler)
+    assert [t.id for t in await mongo_handler.json_handler.list_tasks()] == [tasks[0].id]
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 10
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.stats()["retry_in_seconds"] == 10
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "trips": 2}
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_serves_reads_from_json_without_calling_mongo(mongo_handler):
+    task = await mongo_handler.create_task(TaskCreate(title="mirrored"))
+    await mongo_handler.mirror.flush()
+    calls = []
+
+    def broken_find(*args, **kwargs):
+        calls.append(args)
+        raise ConnectionError("server selection timed out")
+    mongo_handler.collection.find = broken_find
+    mongo_handler.collection.find_one = broken_find
+    mongo_handler.breaker.failure_threshold = 2
+
+    # failures fall back to the JSON backup and trip the breaker...
+    assert [t.id for t in await mongo_handler.list_tasks()] == [task.id]
+    assert (await mongo_handler.get_task(task.id)).id == task.id
+    assert mongo_handler.breaker.state == "open" and len(calls) == 2
+
+    # ...after which Mongo is not tried at all until the reset timeout
+    assert [t["id"] for t in (await mongo_handler.list_tasks_page(limit=5)).items] == [task.id]
+    assert [r["id"] async for r in mongo_handler.iter_tasks()] == [task.id]
+    with pytest.raises(BackendUnavailable):
+        await mongo_handler.create_task(TaskCreate(title="rejected"))
+    assert len(calls) == 2
+
+
+def test_change_stream_documents_become_feed_events():
+    doc = {"_id": "t1", "title": "x", "description": None, "id": "t1", "is_completed": True,
+           "created_at": "2025-01-01T00:00:00.000000Z", "version": 2}
+    event = _change_event({"operationType": "update", "fullDocument": doc, "documentKey": {"_id": "t1"}})
+    assert event["op"] == "complete" and event["id"] == "t1" and "version" not in event["task"]
+    assert _change_event({"operationType": "delete", "documentKey": {"_id": "t1"}}) == {"op": "delete", "id": "t1"}
+    # a legacy document keyed by an ObjectId cannot be named
+    assert _change_event({"operationType": "delete", "documentKey": {"_id": object()}})["op"] == "reset"
+    assert _change_event({"operationType": "update", "fullDocument": None, "documentKey": {"_id": "t1"}}) is None
+
+
+
+@pytest.mark.asyncio
+async def test_mongo_stats_are_cached_per_version(mongo_handler):
+    tasks = await mongo_handler.create_tasks([TaskCreate(title="a"), TaskCreate(title="b")])
+    await mongo_handler.mark_completed(tasks[0].id)
+    stats = await mongo_handler.get_stats()
+    assert (stats.total, stats.open, stats.completed) == (2, 1, 1)
+    days = (await mongo_handler.get_stats(by_day=True)).by_day
+    assert {d: (c.created, c.completed) for d, c in days.items()} == {tasks[0].created_at[:10]: (2, 1)}
+    assert set(mongo_handler._stats_cache) == {(2, False), (2, True)}
+    assert await mongo_handler.get_stats() is stats
+
+    await mongo_handler.delete_task(tasks[1].id)
+    assert (await mongo_handler.get_stats()).total == 1
+    assert set(mongo_handler._stats_cache) == {(3, False)}
+
+
+@pytest.mark.asyncio
+async def test_reconciler_repairs_only_the_drifted_mirror_rows(mongo_handler):
+    tasks = await mongo_handler.create_tasks([TaskCreate(title=f"t{i}") for i in range(20)])
+    await mongo_handler.mirror.flush()
+    reconciler = mongo_handler.reconciler
+    report = await reconciler.run()
+    assert report["in_sync"] is True and report["tasks"] == {"primary": 20, "mirror": 20}
+
+    # drift: a lost create, a lost completion and a row Mongo no longer has
+    mirror = mongo_handler.json_handler
+    await mirror.apply([{"op": "delete", "id": tasks[0].id}])
+    await mongo_handler.collection.update_one({"id": tasks[1].id}, {"$set": {"is_completed": True}})
+    await mirror.apply([{"op": "create", "task": {**tasks[2].model_dump(), "id": "ghost"}}])
+
+    scans = []
+    iter_tasks = mirror.iter_tasks
+    mirror.iter_tasks = lambda **kw: (scans.append(kw), iter_tasks(**kw))[1]
+    report = await reconciler.run(repair=False)
+    assert (report["in_sync"], report["missing"], report["stale"], report["extra"], report["repaired"]) == (
+        False, 1, 1, 1, 0)
+    # the differing buckets are diffed from the digest pass, not by reading the mirror again
+    assert len(scans) == 1
+    del mirror.iter_tasks
+    assert report["buckets"]["differing"] <= 3
+    report = await reconciler.run()
+    assert report["repaired"] == 3
+    assert (await reconciler.run())["in_sync"] is True
+    assert (await mirror.get_task(tasks[1].id)).is_completed is True
+    assert await mirror.get_task("ghost") is None
+    assert reconciler.status()["runs"] == 4
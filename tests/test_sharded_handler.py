@@ -0,0 +1,72 @@
+import json
+import pytest
+
+import binary_snapshot
+from data_handler import JSONDataHandler
+from models import TaskCreate
+from sharded_handler import ShardedJSONDataHandler, read_manifest, reshard, shard_of, shard_path
+
+
+@pytest.mark.asyncio
+async def test_sharded_handler_routes_by_id_and_merges_listings(tmp_path):
+    handler = ShardedJSONDataHandler(str(tmp_path / "shards"), shards=3)
+    tasks = await handler.create_tasks([TaskCreate(title=f"task {i:02d}") for i in range(30)])
+    tasks.append(await handler.create_task(TaskCreate(title="last")))
+    # created_at can tie within a batch; ties are broken on id
+    ids = [t.id for t in sorted(tasks, key=lambda t: (t.created_at, t.id))]
+
+    # every task lives in exactly the shard its id hashes to
+    for i in range(3):
+        on_disk = json.loads((tmp_path / "shards" / f"shard-{i:03d}.json").read_text())
+        assert sorted(t["id"] for t in on_disk["tasks"]) == sorted(x for x in ids if shard_of(x, 3) == i)
+
+    assert [t.id for t in await handler.list_tasks()] == ids
+    by_title = [t.id for t in sorted(tasks, key=lambda t: (t.title, t.id), reverse=True)]
+    assert [r["id"] for r in await handler.list_task_rows(sort="-title")] == by_title
+    assert await handler.mark_completed_many([ids[0], "missing", ids[5]]) == [
+        await handler.get_task(ids[0]), None, await handler.get_task(ids[5])]
+    assert [t.id for t in await handler.list_tasks(is_completed=True)] == sorted([ids[0], ids[5]], key=ids.index)
+
+    seen, cursor = [], None
+    while True:
+        page = await handler.list_tasks_page(limit=7, cursor=cursor, sort="-created_at", fields=["id"])
+        seen += [t["id"] for t in page.items]
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert seen == ids[::-1]
+    assert [r["id"] async for r in handler.iter_tasks(sort="-created_at")] == seen
+
+    stats = await handler.get_stats(by_day=True)
+    assert (stats.total, stats.completed) == (31, 2)
+    assert sum(d.created for d in stats.by_day.values()) == 31
+
+    version, _ = await handler.get_version()
+    assert await handler.delete_tasks([ids[1], ids[1], "missing"]) == [True, False, False]
+    assert (await handler.get_version())[0] == version + 1
+    await handler.close()
+
+    with pytest.raises(ValueError):
+        ShardedJSONDataHandler(str(tmp_path / "shards"), shards=4)
+
+
+def test_reshard_moves_every_task_and_keeps_versions_ahead(tmp_path):
+    src = tmp_path / "data.json"
+    tasks = [{"id": f"id-{i}", "title": f"t{i}", "description": None, "is_completed": i % 2 == 0,
+              "created_at": f"2025-01-01T00:00:{i:02d}.000Z"} for i in range(20)]
+    src.write_text(json.dumps({"tasks": tasks, "version": 20}))
+
+    counts = reshard(str(src), str(tmp_path / "four"), 4, snapshot_format="binary")
+    assert sum(counts) == 20 and read_manifest(str(tmp_path / "four")) == 4
+    assert binary_snapshot.is_binary(shard_path(str(tmp_path / "four"), 0))
+
+    counts = reshard(str(tmp_path / "four"), str(tmp_path / "two"), 2)
+    assert sum(counts) == 20
+    for i in range(2):
+        shard = JSONDataHandler(shard_path(str(tmp_path / "two"), i))
+        assert all(shard_of(t["id"], 2) == i for t in shard._store.document()["tasks"])
+        # each new shard starts from the total of the shards it was built from
+        assert shard._store.version == 80
+
+    with pytest.raises(ValueError):
+        reshard(str(src), str(tmp_path / "two"), 2)
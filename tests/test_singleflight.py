@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+
+from data_handler import JSONDataHandler
+from models import TaskCreate
+from singleflight import CoalescingDataHandler, SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_one_call_and_survives_a_cancelled_caller():
+    flight = SingleFlight()
+    started = 0
+    release = asyncio.Event()
+
+    async def load():
+        nonlocal started
+        started += 1
+        await release.wait()
+        return "rows"
+
+    callers = [asyncio.create_task(flight.do("k", load)) for _ in range(5)]
+    await asyncio.sleep(0)
+    callers[0].cancel()
+    release.set()
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert started == 1
+    assert isinstance(results[0], asyncio.CancelledError) and results[1:] == ["rows"] * 4
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": 4}
+
+
+@pytest.mark.asyncio
+async def test_reads_after_a_write_do_not_join_older_reads(tmp_path):
+    inner = JSONDataHandler(str(tmp_path / "data.json"))
+    handler = CoalescingDataHandler(inner)
+    calls = 0
+    release = asyncio.Event()
+    list_task_rows = inner.list_task_rows
+
+    async def slow_rows(**filters):
+        nonlocal calls
+        calls += 1
+        rows = await list_task_rows(**filters)
+        await release.wait()
+        return rows
+
+    inner.list_task_rows = slow_rows
+    before = [asyncio.create_task(handler.list_task_rows()) for _ in range(3)]
+    await asyncio.sleep(0)
+    task = await handler.create_task(TaskCreate(title="new"))
+    after = asyncio.create_task(handler.list_task_rows())
+    await asyncio.sleep(0)
+    release.set()
+    assert [await t for t in before] == [[], [], []]
+    assert [r["id"] for r in await after] == [task.id]
+    assert calls == 2
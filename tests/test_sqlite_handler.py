@@ -0,0 +1,105 @@
+import sqlite3
+import pytest
+import pytest_asyncio
+
+from models import TaskCreate
+from sqlite_handler import SQLiteDataHandler
+
+
+@pytest_asyncio.fixture
+async def sqlite_handler(tmp_path):
+    handler = SQLiteDataHandler(str(tmp_path / "tasks.db"))
+    yield handler
+    await handler.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_handler_crud_paging_and_bulk(sqlite_handler, tmp_path):
+    first = await sqlite_handler.create_task(TaskCreate(title="first"))
+    created = await sqlite_handler.create_tasks([TaskCreate(title="second"), TaskCreate(title="third")])
+
+    page = await sqlite_handler.list_tasks_page(limit=2, fields=["id"])
+    assert page.items == [{"id": first.id}, {"id": created[0].id}]
+    page = await sqlite_handler.list_tasks_page(limit=2, cursor=page.next_cursor)
+    assert [t["id"] for t in page.items] == [created[1].id] and page.next_cursor is None
+
+    assert (await sqlite_handler.get_version())[0] == 2
+    # nothing to create, nothing changed
+    assert await sqlite_handler.create_tasks([]) == []
+    assert (await sqlite_handler.get_version())[0] == 2
+    assert (await sqlite_handler.get_task_with_version(created[0].id))[1] == 2
+    assert (await sqlite_handler.mark_completed(first.id)).is_completed is True
+    assert (await sqlite_handler.get_task_with_version(first.id))[1] == 3
+    with pytest.raises(KeyError):
+        await sqlite_handler.mark_completed("missing")
+    assert [t.id for t in await sqlite_handler.list_tasks(is_completed=True)] == [first.id]
+    done = await sqlite_handler.mark_completed_many([created[1].id, "missing"])
+    assert done[0].is_completed is True and done[1] is None
+    assert await sqlite_handler.delete_tasks([created[0].id, "missing", created[0].id]) == [True, False, False]
+    assert (await sqlite_handler.get_version())[0] == 5
+    assert await sqlite_handler.get_task(created[0].id) is None
+    assert [r["id"] async for r in sqlite_handler.iter_tasks()] == [first.id, created[1].id]
+
+    # committed to the database file, visible to a fresh handler
+    reopened = SQLiteDataHandler(str(tmp_path / "tasks.db"))
+    assert [(t.id, t.is_completed) for t in await reopened.list_tasks()] == [(first.id, True), (created[1].id, True)]
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_search_is_case_insensitive_substring(sqlite_handler):
+    a = await sqlite_handler.create_task(TaskCreate(title="Write unit tests", description="pytest"))
+    b = await sqlite_handler.create_task(TaskCreate(title="Deploy", description="Unit of work"))
+    c = await sqlite_handler.create_task(TaskCreate(title="50% done_ish"))
+
+    assert sqlite_handler.fts is True
+    assert [t.id for t in await sqlite_handler.list_tasks(q="UNIT")] == [a.id, b.id]
+    assert [t.id for t in await sqlite_handler.list_tasks(q="nit te")] == [a.id]
+    # short queries use LIKE, with its wildcards taken literally
+    assert [t.id for t in await sqlite_handler.list_tasks(q="%")] == [c.id]
+    assert [t.id for t in await sqlite_handler.list_tasks(q="_i")] == [c.id]
+    assert await sqlite_handler.list_tasks(q='"unit') == []
+
+    await sqlite_handler.mark_completed(b.id)
+    await sqlite_handler.delete_task(a.id)
+    assert [t.id for t in await sqlite_handler.list_tasks(q="unit", is_completed=True)] == [b.id]
+
+
+@pytest.mark.asyncio
+async def test_sqlite_sort_and_created_at_range(sqlite_handler):
+    created = await sqlite_handler.create_tasks([TaskCreate(title=t) for t in ("bravo", "alpha", "charlie")])
+    ids = [t.id for t in created]
+
+    rows = await sqlite_handler.list_task_rows(sort="-created_at")
+    assert [r["id"] for r in rows] == ids[::-1]
+    rows = await sqlite_handler.list_task_rows(created_after=created[0].created_at,
+                                               created_before="9999-01-01T00:00:00.000000Z")
+    assert [r["id"] for r in rows] == [t.id for t in created if t.created_at > created[0].created_at]
+
+    page = await sqlite_handler.list_tasks_page(limit=2, sort="title", fields=["title"])
+    assert page.items == [{"title": "alpha"}, {"title": "bravo"}]
+    page = await sqlite_handler.list_tasks_page(limit=2, sort="title", cursor=page.next_cursor)
+    assert [t["title"] for t in page.items] == ["charlie"] and page.next_cursor is None
+    assert [r["title"] async for r in sqlite_handler.iter_tasks(sort="-title")] == ["charlie", "bravo", "alpha"]
+
+
+@pytest.mark.asyncio
+async def test_sqlite_stats_from_trigger_counters(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    handler = SQLiteDataHandler(path)
+    tasks = await handler.create_tasks([TaskCreate(title=t) for t in ("a", "b", "c")])
+    await handler.mark_completed_many([tasks[0].id, tasks[0].id, tasks[1].id])
+    await handler.delete_task(tasks[1].id)
+    stats = await handler.get_stats(by_day=True)
+    assert (stats.total, stats.open, stats.completed) == (2, 1, 1)
+    assert {d: (c.created, c.completed) for d, c in stats.by_day.items()} == {tasks[0].created_at[:10]: (2, 1)}
+
+    # a database from before the counters gets them backfilled when opened
+    await handler.close()
+    conn = sqlite3.connect(path)
+    conn.executescript("DROP TRIGGER task_days_insert; DROP TRIGGER task_days_delete; "
+                       "DROP TRIGGER task_days_complete; DROP TABLE task_days;")
+    conn.close()
+    reopened = SQLiteDataHandler(path)
+    assert await reopened.get_stats(by_day=True) == stats
+    await reopened.close()
@@ -0,0 +1,80 @@
+import pytest
+
+from data_handler import JSONDataHandler
+from models import TaskCreate
+from tiering import TieredDataHandler
+
+
+def _task(i, completed_at=None, created_at="2025-01-01T00:00:00.000000Z"):
+    return {"id": f"id-{i:02d}", "title": f"task {i:02d}", "description": None,
+            "is_completed": completed_at is not None or created_at.startswith("2024"),
+            "created_at": created_at[:-3] + f"{i:02d}Z", "completed_at": completed_at}
+
+
+@pytest.mark.asyncio
+async def test_archiver_moves_old_completed_tasks_and_reads_fall_through(tmp_path):
+    hot = JSONDataHandler(str(tmp_path / "hot.json"))
+    archive = JSONDataHandler(str(tmp_path / "archive.json"), snapshot_format="binary")
+    handler = TieredDataHandler(hot, archive, max_age=86400, interval=0, batch=2)
+    old = [_task(i, completed_at="2025-01-02T00:00:00.000000Z") for i in range(5)]
+    # completed before completion times were recorded: aged by created_at
+    legacy = _task(5, created_at="2024-01-01T00:00:00.000000Z")
+    await hot.apply([{"op": "put", "task": t} for t in old + [legacy]])
+    recent = await handler.create_task(TaskCreate(title="recent"))
+    await handler.mark_completed(recent.id)
+    live = await handler.create_task(TaskCreate(title="live"))
+    total = (await handler.get_version())[0]
+
+    assert await handler.archive_completed() == 6
+    assert await handler.archive_completed() == 0
+    assert handler.archive_stats()["archived"] == 6
+    assert [t.id for t in await handler.list_tasks()] == [recent.id, live.id]
+    archived = [legacy["id"]] + [t["id"] for t in old]
+    assert [t["id"] for t in await archive.list_task_rows(sort="created_at")] == archived
+    # every move changes the combined version, so listing ETags never repeat
+    assert (await handler.get_version())[0] > total
+
+    everything = archived + [recent.id, live.id]
+    assert [r["id"] for r in await handler.list_task_rows(include_archived=True)] == everything
+    assert [r["id"] async for r in handler.iter_tasks(sort="-created_at", include_archived=True)] == everything[::-1]
+    seen, cursor = [], None
+    while True:
+        page = await handler.list_tasks_page(limit=3, cursor=cursor, fields=["id"], include_archived=True)
+        seen += [t["id"] for t in page.items]
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert seen == everything
+
+    assert (await handler.get_task(old[0]["id"])).completed_at == old[0]["completed_at"]
+    assert await handler.get_task_with_version(old[0]["id"]) == (await handler.get_task(old[0]["id"]), None)
+    assert (await handler.mark_completed(old[1]["id"])).id == old[1]["id"]
+    assert [t and t.id for t in await handler.mark_completed_many([old[1]["id"], "missing"])] == [old[1]["id"], None]
+    with pytest.raises(KeyError):
+        await handler.mark_completed("missing")
+
+    stats = await handler.get_stats()
+    assert (stats.total, stats.completed, stats.open) == (8, 7, 1)
+    assert await handler.delete_tasks([old[2]["id"], live.id, "missing"]) == [True, True, False]
+    assert await handler.get_task(old[2]["id"]) is None
+    await handler.close()
+
+
+@pytest.mark.asyncio
+async def test_task_deleted_while_being_archived_does_not_resurface(tmp_path):
+    hot = JSONDataHandler(str(tmp_path / "hot.json"))
+    archive = JSONDataHandler(str(tmp_path / "archive.json"))
+    handler = TieredDataHandler(hot, archive, max_age=86400, interval=0)
+    await hot.apply([{"op": "put", "task": _task(i, completed_at="2025-01-02T00:00:00.000000Z")} for i in range(2)])
+
+    copy = archive.apply
+
+    async def apply_then_race(records):
+        await copy(records)
+        await hot.delete_task("id-00")
+    archive.apply = apply_then_race
+
+    assert await handler.archive_completed() == 1
+    assert [t.id for t in await handler.list_tasks(include_archived=True)] == ["id-01"]
+    assert await archive.get_task("id-00") is None
+    await handler.close()
@@ -0,0 +1,221 @@
+"""
+Hot/cold tiering: completed tasks are moved out of the primary store into an archive once
+they are old enough, so the listings and searches that run all day only cover live tasks.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from data_handler import (IDataHandler, _merge_rows, _merge_streams, _next_cursor, _parse_page_args, _project,
+                          _sum_stats)
+from models import Task, TaskCreate, TaskPage, TaskStats
+from utils import iso_from_timestamp, utc_now_iso, get_logger
+
+logger = get_logger("tiering")
+
+
+def _distinct(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    "Drop the second of two adjacent rows with the same id (a task caught mid-move is in both tiers)."
+    out: List[Dict[str, Any]] = []
+    for row in rows:
+        if not out or out[-1]["id"] != row["id"]:
+            out.append(row)
+    return out
+
+
+class TieredDataHandler(IDataHandler):
+    """Moves tasks completed more than `max_age` seconds ago from `inner` (the hot tier)
+    to `archive` (the cold tier), in batches of `batch`, every `interval` seconds.
+
+    Listings only read the hot tier unless called with `include_archived=True`, which
+    merges both tiers in sort order (created_at when no sort is given). Reads, completes
+    and deletes by id fall through to the archive, so archiving a task does not change
+    how it is addressed. A task is written to the archive before it is deleted from the
+    hot tier; if a move is interrupted in between, the task is in both tiers for a while
+    and reads return the hot copy. Tasks completed before completion times were recorded
+    are aged by their creation time.
+    """
+
+    def __init__(self, inner: IDataHandler, archive: IDataHandler, max_age: float = 30 * 86400,
+                 interval: float = 3600.0, batch: int = 1000):
+        self.inner = inner
+        self.archive = archive
+        self.max_age = max_age
+        self.interval = interval
+        self.batch = batch
+        self.archived = 0
+        self.last_run: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._archiver: Optional[asyncio.Task] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    # ---------------- Archiver ----------------
+    async def archive_completed(self) -> int:
+        "Move every task completed longer than `max_age` ago to the archive; returns how many moved."
+        async with self._lock:
+            cutoff = iso_from_timestamp(time.time() - self.max_age)
+            moved = 0
+            chunk: List[Dict[str, Any]] = []
+            # a task is completed after it is created, so created_before narrows the stream to an
+            # indexed range holding every candidate; it is consumed batch by batch, never loaded whole
+            async for row in self.inner.iter_tasks(is_completed=True, created_before=cutoff):
+                if (row.get("completed_at") or row["created_at"]) < cutoff:
+                    chunk.append(row)
+                if len(chunk) >= self.batch:
+                    moved += await self._move(chunk)
+                    chunk = []
+            if chunk:
+                moved += await self._move(chunk)
+            self.last_run = utc_now_iso()
+            if moved:
+                logger.info("Archived %d completed tasks", moved)
+            return moved
+
+    async def _move(self, rows: List[Dict[str, Any]]) -> int:
+        # archive first: a crash in between leaves a copy in both tiers, never in neither
+        await self.archive.apply([{"op": "put", "task": r} for r in rows])
+        deleted = await self.inner.delete_tasks([r["id"] for r in rows])
+        # deleted by a request while being moved: it must not live on in the archive
+        gone = [r["id"] for r, ok in zip(rows, deleted) if not ok]
+        if gone:
+            await self.archive.delete_tasks(gone)
+        self.archived += len(rows) - len(gone)
+        return len(rows) - len(gone)
+
+    async def _archive_every_interval(self) -> None:
+        while True:
+            try:
+                await self.archive_completed()
+            except Exception:
+                logger.exception("Archiving completed tasks failed")
+            await asyncio.sleep(self.interval)
+
+    def archive_stats(self) -> Dict[str, Any]:
+        return {"archived": self.archived, "last_run": self.last_run, "max_age_seconds": self.max_age}
+
+    async def startup(self) -> None:
+        await asyncio.gather(self.inner.startup(), self.archive.startup())
+        if self.interval > 0:
+            self._archiver = asyncio.create_task(self._archive_every_interval())
+
+    async def close(self) -> None:
+        if self._archiver is not None:
+            self._archiver.cancel()
+            await asyncio.gather(self._archiver, return_exceptions=True)
+            self._archiver = None
+        await self.inner.close()
+        await self.archive.close()
+
+    # ---------------- Reads ----------------
+    async def list_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None, include_archived: bool = False) -> List[Task]:
+        filters = dict(is_completed=is_completed, q=q, sort=sort, created_after=created_after,
+                       created_before=created_before)
+        if not include_archived:
+            return await self.inner.list_tasks(**filters)
+        return [Task(**t) for t in await self.list_task_rows(**filters, include_archived=True)]
+
+    async def list_task_rows(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                             sort: Optional[str] = None, created_after: Optional[str] = None,
+                             created_before: Optional[str] = None,
+                             include_archived: bool = False) -> List[Dict[str, Any]]:
+        filters = dict(is_completed=is_completed, q=q, sort=sort or "created_at", created_after=created_after,
+                       created_before=created_before)
+        if not include_archived:
+            return await self.inner.list_task_rows(**{**filters, "sort": sort})
+        hot, cold = await asyncio.gather(self.inner.list_task_rows(**filters), self.archive.list_task_rows(**filters))
+        return _distinct(_merge_rows([hot, cold], sort))
+
+    async def list_tasks_page(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None, limit: int = 100,
+                              cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                              sort: Optional[str] = None, created_after: Optional[str] = None,
+                              created_before: Optional[str] = None, include_archived: bool = False) -> TaskPage:
+        filters = dict(is_completed=is_completed, q=q, limit=limit, cursor=cursor, sort=sort,
+                       created_after=created_after, created_before=created_before)
+        if not include_archived:
+            return await self.inner.list_tasks_page(**filters, fields=fields)
+        _parse_page_args(cursor, fields, sort)
+        # cursors are (sort key, id) positions, valid in either tier
+        pages = await asyncio.gather(self.inner.list_tasks_page(**filters), self.archive.list_tasks_page(**filters))
+        rows = _distinct(_merge_rows([p.items for p in pages], sort))
+        more = len(rows) > limit or any(p.next_cursor for p in pages)
+        rows = rows[:limit]
+        next_cursor = _next_cursor(rows[-1], sort) if more and rows else None
+        return TaskPage(items=[_project(t, fields) for t in rows], next_cursor=next_cursor)
+
+    async def iter_tasks(self, *, is_completed: Optional[bool] = None, q: Optional[str] = None,
+                         sort: Optional[str] = None, created_after: Optional[str] = None,
+                         created_before: Optional[str] = None,
+                         include_archived: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        filters = dict(is_completed=is_completed, q=q, created_after=created_after, created_before=created_before)
+        if not include_archived:
+            async for row in self.inner.iter_tasks(**filters, sort=sort):
+                yield row
+            return
+        streams = [tier.iter_tasks(**filters, sort=sort or "created_at") for tier in (self.inner, self.archive)]
+        last_id = None
+        async for row in _merge_streams(streams, sort):
+            if row["id"] != last_id:
+                yield row
+            last_id = row["id"]
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        return await self.inner.get_task(task_id) or await self.archive.get_task(task_id)
+
+    async def get_task_with_version(self, task_id: str) -> Optional[Tuple[Task, Optional[int]]]:
+        found = await self.inner.get_task_with_version(task_id)
+        if found is not None:
+            return found
+        # the tiers count versions separately, so an archived task's version could repeat
+        # one the task had while it was hot: serve it without a validator instead
+        task = await self.archive.get_task(task_id)
+        return (task, None) if task else None
+
+    async def get_version(self) -> Optional[Tuple[int, Optional[str]]]:
+        hot, cold = await asyncio.gather(self.inner.get_version(), self.archive.get_version())
+        if hot is None or cold is None:
+            return None
+        modified = [m for _, m in (hot, cold) if m]
+        return hot[0] + cold[0], max(modified) if modified else None
+
+    async def get_stats(self, by_day: bool = False) -> TaskStats:
+        # archived tasks still exist, so they are counted
+        return _sum_stats(await asyncio.gather(self.inner.get_stats(by_day), self.archive.get_stats(by_day)), by_day)
+
+    # ---------------- Writes ----------------
+    async def create_task(self, payload: TaskCreate) -> Task:
+        return await self.inner.create_task(payload)
+
+    async def create_tasks(self, payloads: List[TaskCreate]) -> List[Optional[Task]]:
+        return await self.inner.create_tasks(payloads)
+
+    async def mark_completed(self, task_id: str) -> Task:
+        try:
+            return await self.inner.mark_completed(task_id)
+        except KeyError:
+            # archived tasks are completed already
+            task = await self.archive.get_task(task_id)
+            if task is None:
+                raise
+            return task
+
+    async def mark_completed_many(self, task_ids: List[str]) -> List[Optional[Task]]:
+        results = await self.inner.mark_completed_many(task_ids)
+        missing = [i for i, task in zip(task_ids, results) if task is None]
+        if missing:
+            archived = dict(zip(missing, await asyncio.gather(*(self.archive.get_task(i) for i in missing))))
+            results = [task or archived[i] for i, task in zip(task_ids, results)]
+        return results
+
+    async def delete_task(self, task_id: str) -> bool:
+        # both tiers, so a copy left by an interrupted move cannot resurface
+        hot, cold = await asyncio.gather(self.inner.delete_task(task_id), self.archive.delete_task(task_id))
+        return hot or cold
+
+    async def delete_tasks(self, task_ids: List[str]) -> List[bool]:
+        hot, cold = await asyncio.gather(self.inner.delete_tasks(task_ids), self.archive.delete_tasks(task_ids))
+        return [h or c for h, c in zip(hot, cold)]
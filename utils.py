@@ -1,6 +1,9 @@
+import base64
+import json
 import logging
 from datetime import datetime, timezone
-from typing import Optional
+from email.utils import format_datetime
+from typing import Any, List, Optional
 
 ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
 
@@ -8,6 +11,20 @@ def utc_now_iso() -> str:
     "Return current UTC time in ISO8601 with Z suffix."
     return datetime.now(timezone.utc).strftime(ISO_FORMAT)
 
+def iso_from_timestamp(ts: float) -> str:
+    "Format a POSIX timestamp like utc_now_iso."
+    return datetime.fromtimestamp(ts, timezone.utc).strftime(ISO_FORMAT)
+
+def http_date(iso: str) -> str:
+    "Format a stored ISO timestamp as an HTTP date (for Last-Modified)."
+    return format_datetime(datetime.strptime(iso, ISO_FORMAT).replace(tzinfo=timezone.utc), usegmt=True)
+
+def to_iso_utc(value: datetime) -> str:
+    "Format a datetime like stored created_at values (naive datetimes are taken as UTC)."
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime(ISO_FORMAT)
+
 def parse_bool(value: Optional[str]) -> Optional[bool]:
     "Parse truthy/falsey strings to bool. Returns None if value is None or unrecognized."
     if value is None:
@@ -19,6 +36,22 @@ def parse_bool(value: Optional[str]) -> Optional[bool]:
         return False
     return None
 
+def encode_cursor(values: List[Any]) -> str:
+    "Encode a sort key as an opaque, URL-safe pagination cursor."
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> List[Any]:
+    "Inverse of encode_cursor. Raises ValueError for malformed cursors."
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
 def get_logger(name: str = "task_api") -> logging.Logger:
     logger = logging.getLogger(name)
     if not logger.handlers: